@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from pipeline import DeadlineExceeded
+
+# Admission control for /predict. At most max_concurrent requests are
+# decoded and run through the model at once; up to max_queue more wait for
+# a slot (for at most max_wait_seconds), and anything beyond that is turned
+# away straight away with a Retry-After derived from the observed service
+# time, instead of piling up decoded images until latency and memory run
+# away for everyone.
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=8, max_queue=16, max_wait_seconds=10.0):
+        self.max_concurrent = int(max_concurrent)  # 0 turns admission control off
+        self.max_queue = int(max_queue)
+        self.max_wait_seconds = float(max_wait_seconds)
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._service_seconds = None  # moving average of admitted requests
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.expired = 0
+
+    def retry_after(self):
+        # Seconds until a slot is likely free: the requests ahead of a new
+        # arrival, drained max_concurrent at a time at the observed pace
+        with self._cond:
+            return self._retry_after()
+
+    def _retry_after(self):
+        service = self._service_seconds or 1.0
+        ahead = self._waiting + 1
+        return max(1, math.ceil(service * ahead / max(1, self.max_concurrent)))
+
+    def acquire(self, deadline=None):
+        # Returns once the caller holds a slot; raises Rejected otherwise, or
+        # DeadlineExceeded if the request's own deadline passes first (it may
+        # already have passed while the request waited in front of Flask)
+        with self._cond:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.expired += 1
+                raise DeadlineExceeded('admission')
+        if self.max_concurrent <= 0:
+            return
+        with self._cond:
+            if self._in_flight < self.max_concurrent and not self._waiting:
+                self._in_flight += 1
+                self.admitted += 1
+                return
+            if self._waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise Rejected("queue full", self._retry_after())
+
+            self._waiting += 1
+            self.queued += 1
+            wait_until = time.monotonic() + self.max_wait_seconds
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        self.expired += 1
+                        raise DeadlineExceeded('admission')
+                    if now >= wait_until:
+                        self.rejected_timeout += 1
+                        raise Rejected("queue wait timed out", self._retry_after())
+                    self._cond.wait(min(wait_until, deadline or wait_until) - now)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self.admitted += 1
+
+    def release(self, service_seconds=None):
+        if self.max_concurrent <= 0:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            if service_seconds is not None:
+                previous = self._service_seconds
+                self._service_seconds = service_seconds if previous is None else 0.9 * previous + 0.1 * service_seconds
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_wait_seconds": self.max_wait_seconds,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+                "expired": self.expired,
+                "mean_service_ms": round(self._service_seconds * 1000.0, 3) if self._service_seconds else None,
+                "retry_after_seconds": self._retry_after(),
+            }
+
+
+# Per-client token buckets: each client may send `rate` requests per second
+# with bursts of up to `burst`. Only the most recently seen max_clients are
+# tracked; a client that was dropped starts again with a full bucket.
+class RateLimiter:
+    def __init__(self, rate=0.0, burst=10, max_clients=10000):
+        self.rate = float(rate)  # 0 turns rate limiting off
+        self.burst = float(burst)
+        self.max_clients = int(max_clients)
+
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, client):
+        # Takes a token for client; raises Rejected if its bucket is empty
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+            if allowed:
+                self.allowed += 1
+                return
+            self.limited += 1
+            raise Rejected("rate limited", max(1, math.ceil((1.0 - tokens) / self.rate)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
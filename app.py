@@ -1,1080 +1,832 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from werkzeug.middleware.proxy_fix import ProxyFix
 import cv2
+import json
 import numpy as np
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import gdown
-from tensorflow.keras.models import load_model
+from backends import BACKENDS, DEFAULT_MODEL_PATHS, load_backend
+from batcher import MicroBatcher
+from pipeline import DeadlineExceeded, StagePool, check_deadline, deadline_after, expired
+from bulk import iter_multipart_items, iter_zip_items, chunked
+from preprocessing import IMAGE_SIZE, decode_bytes, preprocess_into, preprocess_pairs
+from cache import PredictionCache, TensorCache, content_hash, pair_key
+from labels import class_labels
+from model_metrics import DEFAULT_METRICS_PATH, LEGACY_METRICS, load_model_metrics
+from recommendations import lookup_recommendation, recommendations_by_id, NO_RECOMMENDATION
+from admission import AdmissionController, RateLimiter, Rejected
+from jobs import JobRunner, MemoryJobStore, SQLiteJobStore, QueueFull
+from thread_settings import thread_settings_from_env, apply_opencv_threads, apply_tensorflow_threads
+from metrics import Registry, BYTES_BUCKETS, CONTENT_TYPE as METRICS_CONTENT_TYPE, read_snapshots, render_snapshots, write_snapshot
 from flask import Flask  # You forgot to import Flask here
 
 app = Flask(__name__)
+# Number of reverse proxies in front of the app (Render has one). Only the
+# X-Forwarded-For entries they appended are trusted for request.remote_addr;
+# anything further left was written by the client
+trusted_proxies = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+if trusted_proxies:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+# Uploads are decoded in memory; set SAVE_UPLOADS=1 to also keep a copy on disk
+app.config['SAVE_UPLOADS'] = os.environ.get('SAVE_UPLOADS', '0') == '1'
+# Number of eye pairs /predict_batch decodes and runs through the model at once
+app.config['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 16))
+# 'exact' (blur at full resolution) or 'resize_first' (blur near 224x224, faster);
+# compare the two with validate_preprocessing.py before switching
+app.config['PREPROCESS_MODE'] = os.environ.get('PREPROCESS_MODE', 'exact')
+# Decode large JPEGs at 1/2, 1/4 or 1/8 scale (never below 448 px); on by
+# default for 'resize_first', which shrinks to that size before the blurs anyway
+app.config['REDUCED_DECODE'] = os.environ.get(
+    'REDUCED_DECODE', '1' if app.config['PREPROCESS_MODE'] == 'resize_first' else '0'
+) == '1'
+# Time budget of a /predict request in milliseconds (0 = none). A client can
+# send its own in the X-Deadline-Ms header; work still queued when it runs
+# out is dropped at the next stage and the request answered with a 504
+app.config['REQUEST_DEADLINE_MS'] = float(os.environ.get('REQUEST_DEADLINE_MS', 0))
+DEADLINE_HEADER = 'X-Deadline-Ms'
+# Time a request waited before reaching Flask (in the proxy, the listen
+# backlog, gunicorn) also counts against its budget when the proxy stamps
+# its arrival, e.g. nginx: proxy_set_header X-Request-Start "t=${msec}";
+REQUEST_START_HEADER = 'X-Request-Start'
 
 # Step 1: Define model path and URL
 model_path = 'retinal_disease_model.h5'
 model_url = 'https://drive.google.com/uc?id=1dSGNTBLv2aIw3BZIzF8mdELckGBzRSAv'
 
-# Step 2: Download model if not already present
-if not os.path.exists(model_path):
-    print("Model file not found. Downloading...")
-    gdown.download(model_url, model_path, quiet=False)
-
-# Step 3: Load the model after it's downloaded
-model = load_model(model_path)
-
-# Class labels
-class_labels = [
-    'Normal Retina',
-    'Diabetic Retinopathy',
-    'Glaucoma',
-    'Cataract',
-    'Age-related Macular Degeneration',
-    'Hypertensive Retinopathy',
-    'Pathological Myopia',
-    'Other Abnormalities'
-]
-
-# Recommendations dictionary (you already have it above, include it fully here)
-recommendations = {
-    'Normal Retina': {
-        (0, 20): """
-🩺 **Status**: No ocular disease detected.
-
-🏥 **Consultations**:
-- Annual check-up with pediatric ophthalmologist
-- Screen for vision issues during school years
-
-🍽️ **Diet**:
-- Encourage fruits (especially citrus), carrots, spinach, and eggs
-- Limit screen time and increase water intake
-
-🧘‍♀️ **Lifestyle**:
-- Outdoor play is essential
-- Eye relaxation after 20 mins of screen use (20-20-20 rule)
-
-📅 **Monitoring**:
-- Annual comprehensive eye exam
-- If using glasses, check prescription yearly
-        """,
-        (20, 30): """
-🩺 **Status**: No signs of ocular disease.
-
-🏥 **Consultations**:
-- Comprehensive eye exam every 1–2 years
-
-🍽️ **Diet**:
-- Rich in Vitamin A (carrots, leafy greens), Omega-3s (flaxseeds, fish), and hydration
-
-🧘‍♂️ **Lifestyle**:
-- Reduce blue light exposure from screens
-- Use sunglasses to prevent UV damage
-
-📅 **Monitoring**:
-- Baseline retinal imaging for reference
-        """,
-        (30, 40): """
-🩺 **Status**: No ocular abnormalities found.
-
-🏥 **Consultations**:
-- Eye exams every 2 years unless vision changes
-
-🍽️ **Diet**:
-- Add antioxidant-rich foods (blueberries, spinach, walnuts)
-
-🧘‍♀️ **Lifestyle**:
-- Take breaks during screen-heavy work
-- Use artificial tears if experiencing dry eyes
-
-📅 **Monitoring**:
-- Annual comprehensive eye exam
-- If using glasses, check prescription yearly
-        """,
-        (40, 50): """
-🩺 **Status**: No disease, but aging eye changes may begin.
-
-🏥 **Consultations**:
-- Eye exam every 1–2 years to monitor for presbyopia or early disease signs
-
-🍽️ **Diet**:
-- Add lutein and zeaxanthin (broccoli, corn, eggs) for macular protection
-
-🧘‍♂️ **Lifestyle**:
-- Monitor reading distance; use adequate lighting
-
-📅 **Monitoring**:
-- Annual comprehensive eye exam
-- If using glasses, check prescription yearly
-        """,
-        (50, 60): """
-🩺 **Status**: Healthy retina.
-
-🏥 **Consultations**:
-- Annual dilated eye exams to monitor age-related risks
-
-🍽️ **Diet**:
-- Add turmeric, green tea (anti-inflammatory), and Omega-3s
-
-🧘‍♀️ **Lifestyle**:
-- Control blood pressure, manage screen use
-
-📅 **Monitoring**:
-- Annual comprehensive eye exam
-- If using glasses, check prescription yearly
-        """,
-        (60, 100): """
-🩺 **Status**: Eyes are healthy, but risk of age-related changes is high.
-
-🏥 **Consultations**:
-- Annual to biannual visits with ophthalmologist
-- Check for cataract, macular degeneration, glaucoma
-
-🍽️ **Diet**:
-- High antioxidant intake (berries, dark greens)
-- Stay hydrated and limit sodium
-
-🧘‍♂️ **Lifestyle**:
-- Stay active, avoid falls, use vision-friendly lighting at home
-
-📅 **Monitoring**:
-- Yearly comprehensive tests including eye pressure, field of vision, and retina scans📅
-- Annual comprehensive eye exam
-        """
-    },
-    'Diabetic Retinopathy': {
-    (0, 20): """
-🩺 **Diagnosis**: Diabetic Retinopathy.
-
-🏥 **Consultations**:
-- Pediatric retina specialist
-- Endocrinologist for tight glucose control
-
-🍽️ **Diet**:
-- High-fiber, low-GI meals; supervised carbohydrate control
-
-🧘‍♀️ **Lifestyle**:
-- Daily physical activity; avoid sugar-rich snacks
-- Parent-supervised glucose monitoring
-
-💊 **Treatment**:
-- Mostly non-surgical if caught early
-- Retinal scan every 6–12 months
-
-📅 **Monitoring**:
-- HbA1c every 3 months
-- Fundus photography for tracking
-        """,
-    (20, 30): """
-🩺 **Diagnosis**: Diabetic Retinopathy detected.
-
-🏥 **Consultations**:
-- Retina specialist and diabetologist
-
-🍽️ **Diet**:
-- Whole grains, beans, leafy greens; limit starches and sugary drinks
-
-🧘‍♂️ **Lifestyle**:
-- Daily walking/jogging
-- Manage work stress with mindfulness
-
-💊 **Treatment**:
-- Anti-VEGF injections or laser if needed
-- Oral or insulin glucose therapy
-
-📅 **Monitoring**:
-- Eye scan every 6–12 months
-- Glucose log maintenance
-        """,
-    (30, 40): """
-🩺 **Diagnosis**: Diabetic Retinopathy detected
-
-🏥 **Consultations**:
-- Retina consultant, general physician, diabetes educator
-
-🍽️ **Diet**:
-- High-protein, low-carb meals
-- Include Omega-3s and vitamin D supplements
-
-🧘‍♀️ **Lifestyle**:
-- 30–40 mins daily aerobic activity
-- Avoid smoking and alcohol
-
-💊 **Treatment**:
-- Laser therapy if needed
-- Blood sugar and blood pressure control
-
-📅 **Monitoring**:
-- Eye exams every 6 months
-- Monthly glucose checks
-        """,
-    (40, 50): """
-🩺 **Diagnosis**: Diabetic Retinopathy detected
-
-🏥 **Consultations**:
-- Retina specialist and diabetic care team
-
-🍽️ **Diet**:
-- Fresh, non-starchy veggies; avoid red meat and fried food
-
-🧘‍♂️ **Lifestyle**:
-- Manage weight, reduce stress with guided yoga
-
-💊 **Treatment**:
-- Anti-VEGF therapy likely, oral diabetes meds or insulin
-
-📅 **Monitoring**:
-- Retinal OCT scans every 6 months
-- Renal screening for diabetes-related complications
-        """,
-    (50, 60): """
-🩺 Diabetic Retinopathy detected.
-
-🏥 **Consultations**:
-- Retina surgeon, nephrologist (if comorbid)
-
-🍽️ **Diet**:
-- Nutritionist-supervised low-carb plan
-- Control sodium and cholesterol intake
-
-🧘‍♀️ **Lifestyle**:
-- Walk after meals, reduce stress
-
-💊 **Treatment**:
-- Injections or laser therapy depending on severity
-- May require insulin regimen update
-
-📅 **Monitoring**:
-- Quarterly eye check-ups
-- Glucose and BP log with caregiver support
-        """,
-    (60, 100): """
-🩺 **Diagnosis**: Diabetic Retinopathy detected
-
-🏥 **Consultations**:
-- Retina surgeon, endocrinologist, geriatric care support
-
-🍽️ **Diet**:
-- Soft diabetic meals; avoid sugar completely
-
-🧘‍♂️ **Lifestyle**:
-- Limited movement? Assisted physical therapy
-- Home lighting and fall-prevention strategies
-
-💊 **Treatment**:
-- Possible vitrectomy
-- Long-term anti-VEGF therapy
-
-📅 **Monitoring**:
-- Monthly retinal scans
-- Family/caregiver involvement for medication
-        """
-},
- 'Glaucoma':{
-    (0, 20): """
-🩺 **Diagnosis**: Pediatric or juvenile glaucoma.
-
-🏥 **Consultations**:
-- Pediatric glaucoma specialist
-- Genetic counseling if congenital
-
-🍽️ **Diet**:
-- Balanced, fiber-rich meals
-- Limit sugar and processed food
-
-🧘‍♀️ **Lifestyle**:
-- Avoid eye trauma during sports
-- Use eye drops as prescribed
-
-💊 **Treatment**:
-- Likely surgical (goniotomy, trabeculotomy)
-- Regular IOP-lowering medication
-
-📅 **Monitoring**:
-- IOP check every 3 months
-- Visual field and optic nerve imaging
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Pediatric or juvenile glaucoma.
-
-🏥 **Consultations**:
-- Glaucoma specialist
-- Optometrist for field testing
-
-🍽️ **Diet**:
-- Leafy greens (kale, spinach), avoid caffeine and salt
-- Stay hydrated
-
-🧘‍♂️ **Lifestyle**:
-- Avoid yoga poses that raise eye pressure (e.g., headstands)
-- Use prescribed eye drops regularly
-
-💊 **Treatment**:
-- Eye drops (prostaglandin analogs)
-- Laser trabeculoplasty in some cases
-
-📅 **Monitoring**:
-- IOP check every 3–4 months
-- Visual field test every 6 months
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: Pediatric or juvenile glaucoma
-
-🏥 **Consultations**:
-- Ophthalmologist, lifestyle counselor
-
-🍽️ **Diet**:
-- High in carotenoids, magnesium-rich foods
-- Limit red meat and alcohol
-
-🧘‍♀️ **Lifestyle**:
-- Elevate head while sleeping to reduce eye pressure
-- Avoid weightlifting
-
-💊 **Treatment**:
-- Combination drops or surgery if drops ineffective
-
-📅 **Monitoring**:
-- Biannual optic nerve scans (OCT)
-- Visual acuity testing every 6 months
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Pediatric or juvenile glaucoma
-
-🏥 **Consultations**:
-- Glaucoma surgeon if pressure uncontrolled
-
-🍽️ **Diet**:
-- Add turmeric and flax seeds
-- Low sodium, high hydration
-
-🧘‍♂️ **Lifestyle**:
-- Screen work breaks; avoid bending or strain
-
-💊 **Treatment**:
-- Dual or triple therapy with drops
-- Laser or micro-invasive surgery (MIGS)
-
-📅 **Monitoring**:
-- Every 3-month pressure check
-- Visual field every 6–12 months
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: Pediatric or juvenile glaucoma detected 
-                   Risk of optic nerve damage increases.
-
-🏥 **Consultations**:
-- Advanced glaucoma clinic
-
-🍽️ **Diet**:
-- Maintain heart-healthy, eye-supportive diet
-- Avoid smoking
-
-🧘‍♀️ **Lifestyle**:
-- Use light filtering lenses
-- Avoid emotional stress
-
-💊 **Treatment**:
-- Glaucoma filtering surgery if needed
-- Beta blockers or carbonic anhydrase inhibitors
-
-📅 **Monitoring**:
-- Monthly IOP check if severe
-- OCT and optic nerve head imaging every 6 months
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: Glaucoma detected 
-                  Glaucoma often advanced in this age group.
-
-🏥 **Consultations**:
-- Geriatric ophthalmologist
-- Neurology if vision loss affects daily life
-
-🍽️ **Diet**:
-- Eye-healthy diet: spinach, salmon, citrus, seeds
-
-🧘‍♂️ **Lifestyle**:
-- Fall prevention; increase lighting at home
-- Family-assisted medication
-
-💊 **Treatment**:
-- Possible shunt surgery or tube implants
-- Continue eye drops rigorously
-
-📅 **Monitoring**:
-- Frequent (every 2 months) IOP monitoring
-- Home eye pressure tracking if needed
-    """
-},
- 'Cataract':{
-    (0, 20): """
-🩺 **Diagnosis**: Congenital or developmental cataract (rare but vision-critical).
-
-🏥 **Consultations**:
-- Pediatric ophthalmologist
-- Pediatrician for systemic causes
-
-🍽️ **Diet**:
-- Vitamin A-rich foods (mango, eggs)
-- Hydration and eye nutrition
-
-🧘‍♀️ **Lifestyle**:
-- Protect eyes from UV
-- Glasses if advised
-
-💊 **Treatment**:
-- Surgery if cataract obstructs vision
-- Post-op visual rehab
-
-📅 **Monitoring**:
-- Vision and lens clarity checks every 3–6 months
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Rare; may be trauma, steroid, or radiation-induced.
-
-🏥 **Consultations**:
-- Retina and cataract surgeon
-
-🍽️ **Diet**:
-- Leafy greens, Omega-3s, avoid smoking
-
-🧘‍♂️ **Lifestyle**:
-- Use protective eyewear in labs/sports
-
-💊 **Treatment**:
-- Cataract surgery if vision is significantly affected
-
-📅 **Monitoring**:
-- Slit-lamp check every 6 months
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: cataract  likely due to oxidative stress or medications.
-
-🏥 **Consultations**:
-- General ophthalmologist
-
-🍽️ **Diet**:
-- Increase lutein, zeaxanthin, Vitamin C (citrus, corn)
-
-🧘‍♀️ **Lifestyle**:
-- UV sunglasses, reduce alcohol
-
-💊 **Treatment**:
-- Surgery if visual impairment affects function
-
-📅 **Monitoring**:
-- Annual vision check-ups
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Age-related lens changes; early nuclear sclerosis common.
-
-🏥 **Consultations**:
-- Eye surgeon if visual clarity declines
-
-🍽️ **Diet**:
-- Vitamin E and B-complex supplements
-- Avoid excess sunlight
-
-🧘‍♂️ **Lifestyle**:
-- Adequate lighting for reading
-
-💊 **Treatment**:
-- Phacoemulsification (if indicated)
-
-📅 **Monitoring**:
-- Annual slit lamp and refraction test
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: Lens opacity likely affecting daily activities.
-
-🏥 **Consultations**:
-- Cataract surgeon
-
-🍽️ **Diet**:
-- Anti-inflammatory foods: tomatoes, green tea, berries
-
-🧘‍♀️ **Lifestyle**:
-- Drive carefully; ensure proper contrast vision
-
-💊 **Treatment**:
-- Cataract surgery (intraocular lens implant)
-
-📅 **Monitoring**:
-- Pre-surgery workup, post-op follow-ups
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: Mature or hypermature cataract common.
-
-🏥 **Consultations**:
-- Geriatric ophthalmologist
-- GP to manage anesthesia risks
-
-🍽️ **Diet**:
-- Soft fiber-rich foods, hydration
-
-🧘‍♂️ **Lifestyle**:
-- Prevent falls, avoid dim lighting
-
-💊 **Treatment**:
-- Immediate cataract surgery if visual obstruction
-
-📅 **Monitoring**:
-- Monthly checkups post-surgery until stable
-    """
-},
-'Age-related Macular Degeneration': {
-    (0, 20): """
-🩺 **Diagnosis**: Extremely rare. Consider misdiagnosis or rare genetic macular dystrophies.
-
-🏥 **Consultations**:
-- Pediatric retinal specialist
-- Genetic testing for Stargardt disease
-
-🍽️ **Diet**:
-- Vitamin A, lutein-rich foods (carrots, eggs, leafy greens)
-
-🧘‍♀️ **Lifestyle**:
-- Limit screen time, use protective glasses
-
-💊 **Treatment**:
-- Low vision aids if needed
-- Regular monitoring
-
-📅 **Monitoring**:
-- Fundus photography every 6 months
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Early AMD unlikely; suspect early-onset macular disorders.
-
-🏥 **Consultations**:
-- Retina specialist for OCT
-
-🍽️ **Diet**:
-- Antioxidants (C, E, Zinc), avoid processed food
-
-🧘‍♂️ **Lifestyle**:
-- Quit smoking completely (major risk factor)
-
-💊 **Treatment**:
-- Observation if no wet AMD
-- AREDS2 vitamins (preventive)
-
-📅 **Monitoring**:
-- OCT scan once a year
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: Rare early AMD or hereditary variants.
-
-🏥 **Consultations**:
-- Genetic counseling if family history exists
-
-🍽️ **Diet**:
-- Lutein, zeaxanthin, Omega-3 supplements
-- Avoid trans fats and excess carbs
-
-🧘‍♀️ **Lifestyle**:
-- Minimize blue light exposure
-
-💊 **Treatment**:
-- Antioxidant therapy
-- Observation if no exudative signs
-
-📅 **Monitoring**:
-- Yearly visual field + retinal scans
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Rare early AMD or hereditary variants.
-
-🏥 **Consultations**:
-- Ophthalmologist with retinal expertise
-
-🍽️ **Diet**:
-- AREDS2 formulation supplements
-- Add wild salmon, citrus fruits
-
-🧘‍♂️ **Lifestyle**:
-- Stop smoking, walk daily (20–30 min)
-
-💊 **Treatment**:
-- Dry AMD: Supplements and lifestyle
-- Wet AMD: Anti-VEGF injection (if diagnosed)
-
-📅 **Monitoring**:
-- Amsler grid at home weekly
-- Fundus exam every 6 months
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: Moderate AMD likely. Watch for neovascular changes.
-
-🏥 **Consultations**:
-- Retina specialist regularly
-- Nutritional counselor
-
-🍽️ **Diet**:
-- Kale, spinach, sweet corn, berries
-- Avoid refined sugar
-
-🧘‍♀️ **Lifestyle**:
-- Use magnifiers, increase indoor lighting
-
-💊 **Treatment**:
-- Wet AMD: Monthly Anti-VEGF injections
-- Dry AMD: Supplements and diet
-
-📅 **Monitoring**:
-- OCT monthly for wet AMD
-- Visual acuity every 6 months
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: High risk of advanced AMD and legal blindness.
-
-🏥 **Consultations**:
-- Retina clinic
-- Low vision therapist
-
-🍽️ **Diet**:
-- Eye-supporting diet (AREDS2-based), soft textured
-
-🧘‍♂️ **Lifestyle**:
-- Assistive tools: reading lamps, large-print books
-- Family assistance
-
-💊 **Treatment**:
-- Wet AMD: Injections (Ranibizumab, Aflibercept)
-- Dry AMD: Monitoring + vision support
-
-📅 **Monitoring**:
-- Bi-monthly if on injections
-- Vision aid adjustment every 6–12 months
-    """
-},
- 'Hypertensive Retinopathy':{
-    (0, 20): """
-🩺 **Diagnosis**: Hypertensive Retinopathy detected
-🏥 **Consultations**:
-- Pediatric nephrologist + ophthalmologist
-
-🍽️ **Diet**:
-- Salt-restricted, potassium-rich (banana, spinach)
-
-🧘‍♀️ **Lifestyle**:
-- Avoid junk food, maintain healthy BMI
-
-💊 **Treatment**:
-- Antihypertensives if diagnosed
-- Retinal laser rarely if severe edema
-
-📅 **Monitoring**:
-- BP monthly
-- Retina check every 6 months
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Early signs like arteriolar narrowing, mild AV nicking.
-
-🏥 **Consultations**:
-- General physician + retina specialist
-
-🍽️ **Diet**:
-- DASH diet: low sodium, high fiber
-
-🧘‍♂️ **Lifestyle**:
-- Reduce screen time, avoid late nights
-
-💊 **Treatment**:
-- Antihypertensives
-- Anti-VEGF if macular edema occurs
-
-📅 **Monitoring**:
-- Fundus once a year if stable
-- BP check biweekly
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: AV nicking, cotton wool spots possible.
-
-🏥 **Consultations**:
-- Cardiologist + ophthalmologist
-
-🍽️ **Diet**:
-- Avoid red meat, caffeine; add whole grains
-
-🧘‍♀️ **Lifestyle**:
-- Daily walk (30 minutes)
-- Decrease work stress
-
-💊 **Treatment**:
-- BP meds (ACE inhibitors, beta-blockers)
-- Injections if edema or hemorrhage
-
-📅 **Monitoring**:
-- Retina check every 6 months
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Moderate hypertensive changes.
-
-🏥 **Consultations**:
-- Hypertension clinic
-- Retina specialist
-
-🍽️ **Diet**:
-- DASH diet + Vitamin C & magnesium
-
-🧘‍♂️ **Lifestyle**:
-- Screen-time limits, 8-hour sleep
-
-💊 **Treatment**:
-- Combo antihypertensives
-- Laser or anti-VEGF if complications
-
-📅 **Monitoring**:
-- Eye check every 3 months
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: Grade 3/4 HR common—hemorrhages, macular edema.
-
-🏥 **Consultations**:
-- Endocrinologist (if diabetic), retina surgeon
-
-🍽️ **Diet**:
-- Strict sodium restriction, omega-3
-
-🧘‍♀️ **Lifestyle**:
-- Monitor home BP, relax daily
-
-💊 **Treatment**:
-- Anti-VEGF injections
-- Retinal laser
-
-📅 **Monitoring**:
-- Monthly if macular edema exists
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: Advanced changes with risk of permanent damage.
-
-🏥 **Consultations**:
-- Geriatric hypertension & retina care
-
-🍽️ **Diet**:
-- Light, BP-safe diet, low-fat dairy
-
-🧘‍♂️ **Lifestyle**:
-- Chair yoga, supervised walking
-
-💊 **Treatment**:
-- Aggressive BP control
-- Injections + surgery (rare)
-
-📅 **Monitoring**:
-- BP home monitoring daily
-- Eye check monthly
-    """
-},
-'Pathological Myopia':{
-    (0, 20): """
-🩺 **Diagnosis**: Often congenital or juvenile progressive myopia.
-
-🏥 **Consultations**:
-- Pediatric ophthalmologist
-- Genetic counseling if familial
-
-🍽️ **Diet**:
-- Eye-healthy foods: citrus fruits, carrots, zinc-rich foods
-
-🧘‍♀️ **Lifestyle**:
-- Limit screen time
-- Encourage outdoor play (2+ hours/day)
-
-💊 **Treatment**:
-- Atropine eye drops (0.01%) to slow progression
-- Myopia control lenses (orthokeratology)
-
-📅 **Monitoring**:
-- Axial length measurement every 6 months
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Early signs of posterior staphyloma, floaters may occur.
-
-🏥 **Consultations**:
-- Retina specialist for annual monitoring
-
-🍽️ **Diet**:
-- Rich in lutein, zeaxanthin, and DHA
-
-🧘‍♂️ **Lifestyle**:
-- Avoid contact sports (retinal tear risk)
-- Screen use breaks: 20–20–20 rule
-
-💊 **Treatment**:
-- Protective glasses
-- Photodynamic therapy if CNV develops
-
-📅 **Monitoring**:
-- Yearly OCT + Fundus photography
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: Macular thinning, risk of choroidal neovascularization (CNV).
-
-🏥 **Consultations**:
-- Retina clinic regularly
-- Low vision optometry if needed
-
-🍽️ **Diet**:
-- Omega-3 (fish oil), antioxidant-rich
-
-🧘‍♀️ **Lifestyle**:
-- Regular posture breaks
-- Eye relaxation techniques
-
-💊 **Treatment**:
-- CNV: Anti-VEGF injections
-- Corrective lenses with prism if double vision
-
-📅 **Monitoring**:
-- Visual field + fundus every 6–12 months
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Risk of macular hemorrhage or foveoschisis.
-
-🏥 **Consultations**:
-- Retina surgeon
-- Low vision therapist
-
-🍽️ **Diet**:
-- AREDS2 supplements may help
-
-🧘‍♂️ **Lifestyle**:
-- Avoid heavy lifting or trauma
-
-💊 **Treatment**:
-- Anti-VEGF for CNV
-- Surgical options: vitrectomy if foveoschisis
-
-📅 **Monitoring**:
-- OCT every 3–6 months
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: High risk of retinal detachment, CNV, or myopic maculopathy.
-
-🏥 **Consultations**:
-- Retina specialist urgently if visual symptoms arise
-
-🍽️ **Diet**:
-- Soft diet to reduce strain
-- Antioxidants: kale, sweet potatoes
-
-🧘‍♀️ **Lifestyle**:
-- Avoid night driving if vision impacted
-
-💊 **Treatment**:
-- Injections or surgery based on CNV or detachment
-
-📅 **Monitoring**:
-- Frequent (every 3 months) retina screening
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: legal blindness possible.
-
-🏥 **Consultations**:
-- Retina specialist + rehabilitation center
-
-🍽️ **Diet**:
-- Vision-support diet with supplements
-
-🧘‍♂️ **Lifestyle**:
-- Use assistive devices: magnifiers, talking devices
-
-💊 **Treatment**:
-- Advanced: Anti-VEGF or surgery
-- Low vision support (e.g., magnifying video systems)
-
-📅 **Monitoring**:
-- Bimonthly follow-up for progression tracking
-    """
-},
- 'Other Abnormalities':{
-    (0, 20): """
-🩺 **Diagnosis**: Commonly congenital abnormalities (e.g., coloboma, albinism).
-
-🏥 **Consultations**:
-- Pediatric ophthalmologist
-- Neuro-ophthalmology if needed
+# Inference backend: 'keras' (default), 'keras-compiled', 'tflite', 'onnx',
+# a quantized 'tflite-dynamic' / 'tflite-int8', 'tflite-shared', whose
+# memory-mapped weights are shared by every worker, or 'keras-uint8', which
+# takes uint8 pixels and scales them itself. The non-.h5 models are
+# exported from the .h5 with convert_model.py / quantize_model.py;
+# MODEL_BACKEND_PATH overrides where the selected backend's model file is read from.
+backend_name = os.environ.get('INFERENCE_BACKEND', 'keras')
+if backend_name not in BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {BACKENDS}, got '{backend_name}'")
+backend_path = os.environ.get('MODEL_BACKEND_PATH') or (
+    model_path if backend_name in ('keras', 'keras-compiled') else DEFAULT_MODEL_PATHS[backend_name]
+)
+backend_options = {}
+if backend_name == 'keras-compiled':
+    # Batch sizes to trace the model for (requests are padded up to the
+    # nearest one) and whether to XLA-compile them
+    backend_options = {
+        "buckets": [int(b) for b in os.environ.get('COMPILED_BATCH_BUCKETS', '1,2,4,8').split(',') if b.strip()],
+        "jit_compile": os.environ.get('COMPILED_XLA', '0') == '1',
+    }
+elif backend_name.startswith('tflite'):
+    # Batch sizes to keep an interpreter allocated for (requests are padded
+    # up to the nearest one). Every bucket is a whole interpreter: its own
+    # activation arena, sized for that batch, and under the XNNPACK delegate
+    # (tflite, tflite-dynamic, tflite-int8) its own packed copy of the
+    # weights, so each extra bucket costs about one more model per worker;
+    # tflite-shared interpreters share the mapped weights and pay only the
+    # arena. Hence just single requests and full batches by default; compare
+    # bucket sets with measure_worker_memory.py --tflite-buckets
+    backend_options = {
+        "buckets": [int(b) for b in os.environ.get(
+            'TFLITE_BATCH_BUCKETS', f"1,{os.environ.get('BATCH_MAX_SIZE', 8)}").split(',') if b.strip()],
+    }
+
+# Batch sizes to run one synthetic inference for before reporting ready, so
+# the first patient request never pays for graph tracing or allocation
+warmup_batch_sizes = [int(n) for n in os.environ.get('WARMUP_BATCH_SIZES', '1').split(',') if n.strip()]
+
+# TensorFlow / OpenCV thread-pool sizes (see thread_settings.py)
+thread_settings = thread_settings_from_env()
+if (backend_name.startswith('tflite') or backend_name == 'onnx') and thread_settings["tf_intra_op"]:
+    backend_options["num_threads"] = thread_settings["tf_intra_op"]
+apply_opencv_threads(thread_settings)
+
+# Steps 2-3 run in a background thread so the server binds its port straight
+# away; /readyz reports progress. The thread is started at the bottom of this
+# file, or under gunicorn (LOAD_MODEL_AFTER_FORK=1) by start_worker() in each
+# worker: TensorFlow must never start in the master, its runtime does not
+# survive fork.
+backend = None
+model_ready = threading.Event()
+model_status = {"state": "starting", "backend": backend_name, "error": None, "load_seconds": None, "warmup_seconds": None,
+                "threads": thread_settings}
+
+# Accuracy / loss reported with every prediction, as measured by evaluate.py
+# for the served model file (the old hardcoded numbers until one exists)
+metrics_path = os.environ.get('MODEL_METRICS_PATH', DEFAULT_METRICS_PATH)
+model_metrics = dict(LEGACY_METRICS)
+
+# Model input format, set from the backend once it is loaded: float32 RGB in
+# [0, 1], or the uint8 pixels (possibly still BGR) of a model that scales them
+model_input = {"dtype": np.dtype(np.float32), "channel_order": 'rgb'}
+
+
+@contextmanager
+def model_download_lock():
+    # Every gunicorn worker loads the model on its own; the first one to
+    # get here downloads it while the others wait for the file
+    try:
+        import fcntl
+    except ImportError:  # Windows: a single development server
+        yield
+        return
+    with open(model_path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load_model_files():
+    started = time.perf_counter()
+
+    # Step 2: Download model if not already present
+    if backend_path == model_path and not os.path.exists(model_path):
+        model_status["state"] = "downloading"
+        with model_download_lock():
+            if not os.path.exists(model_path):
+                print("Model file not found. Downloading...")
+                gdown.download(model_url, model_path + '.part', quiet=False)
+                os.replace(model_path + '.part', model_path)
+
+    # Step 3: Load the model after it's downloaded
+    model_status["state"] = "loading"
+    if backend_name.startswith('keras'):
+        apply_tensorflow_threads(thread_settings)
+    global backend
+    backend = load_backend(backend_name, backend_path, **backend_options)
+    model_status["load_seconds"] = round(time.perf_counter() - started, 3)
+    model_input.update(dtype=np.dtype(backend.input_dtype), channel_order=backend.channel_order)
+
+    model_metrics.update(load_model_metrics(metrics_path, backend_path))
+    model_status["metrics"] = model_metrics
+
+
+def load_model_in_background():
+    try:
+        load_model_files()
 
-🍽️ **Diet**:
-- Eye development support: Vitamin A, D, and calcium
+        model_status["state"] = "warming_up"
+        started = time.perf_counter()
+        warmup()
+        model_status["warmup_seconds"] = round(time.perf_counter() - started, 3)
 
-🧘‍♀️ **Lifestyle**:
-- Visual therapy if amblyopia
-- Avoid screen strain
+        model_status["state"] = "ready"
+        model_ready.set()
+        print("✅ Model ready")
 
-💊 **Treatment**:
-- Tailored to condition: steroids (for inflammation), genetic therapies (if eligible)
+        resumed = job_runner.resume()
+        if resumed:
+            print(f"Resumed {resumed} unfinished job(s)")
+    except Exception as e:
+        model_status["state"] = "failed"
+        model_status["error"] = str(e)
+        print("🔥 Model load failed:", str(e))
+
+
+def warmup():
+    # One synthetic pair through preprocessing, then each warmup batch size
+    # through the model
+    rng = np.random.default_rng(0)
+    fake_eye = rng.integers(0, 256, (IMAGE_SIZE * 4, IMAGE_SIZE * 4, 3), dtype=np.uint8)
+    combined = build_input(fake_eye, fake_eye)
+    for batch_size in warmup_batch_sizes:
+        run_model(np.repeat(combined[np.newaxis], batch_size, axis=0))
+
+
+# Single entry point for running the model on a (N, 224, 224, 6) batch
+def run_model(batch):
+    with stage_seconds.time(stage='model'):
+        return backend.predict(batch)
+
+# Step 4: Micro-batch concurrent requests into a single model call
+# (BATCH_MAX_SIZE=1 turns batching off and calls the model directly). This is
+# the inference stage of the request pipeline; submitters block once
+# BATCH_MAX_QUEUE inputs are waiting. Its thread is started with the other
+# per-process threads at the bottom of this file, never in the gunicorn master.
+batcher = MicroBatcher(
+    run_model,
+    max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+    max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', 5)),
+    max_queue=int(os.environ.get('BATCH_MAX_QUEUE', 64)),
+)
+
+# Decode/preprocess stage: both eyes of a request are preprocessed in
+# parallel, and the next request's eyes while this one is being inferred
+preprocess_pool = StagePool(
+    'preprocess',
+    workers=int(os.environ.get('PREPROCESS_WORKERS', min(4, os.cpu_count() or 1))),
+    max_queue=int(os.environ.get('PREPROCESS_QUEUE', 32)),
+)
+
+# Step 5: Cache model outputs by the content of both uploaded images, so a
+# re-submitted pair (e.g. only the age changed) skips decoding and inference
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 1024)),
+    ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+)
+
+# Step 6: Cache each eye's preprocessed tensor (602 KB each) under a byte
+# budget, so a follow-up visit only preprocesses the newly captured eye
+tensor_cache = TensorCache(
+    max_bytes=int(os.environ.get('TENSOR_CACHE_MB', 64)) * 1024 * 1024,
+)
+
+# Step 7: Prometheus metrics, served at /metrics. Under gunicorn
+# (METRICS_DIR, set by gunicorn.conf.py) each worker writes its metrics there
+# every METRICS_WRITE_SECONDS, and whichever worker answers the scrape serves
+# those of every worker, labelled worker="<pid>" (see metrics.py)
+metrics_dir = os.environ.get('METRICS_DIR')
+metrics_write_seconds = float(os.environ.get('METRICS_WRITE_SECONDS', 1.0))
+registry = Registry()
+requests_total = registry.counter(
+    'retina_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'status'))
+request_errors_total = registry.counter(
+    'retina_request_errors_total', 'Predictions that failed with an exception', ('endpoint',))
+requests_in_flight = registry.gauge(
+    'retina_requests_in_flight', 'Requests currently being handled', ('endpoint',))
+request_seconds = registry.histogram(
+    'retina_request_latency_seconds', 'Time spent in each request handler', ('endpoint',))
+stage_seconds = registry.histogram(
+    'retina_stage_latency_seconds', 'Time spent in each prediction pipeline stage', ('stage',))
+upload_bytes = registry.histogram(
+    'retina_upload_bytes', 'Size of uploaded eye images in bytes', ('eye',), BYTES_BUCKETS)
+predicted_class_total = registry.counter(
+    'retina_predicted_class_total', 'Predictions by predicted disease', ('disease',))
+admission_rejected_total = registry.counter(
+    'retina_admission_rejected_total', 'Requests turned away by admission control', ('endpoint', 'reason'))
+deadline_expired_total = registry.counter(
+    'retina_deadline_expired_total', 'Requests dropped because their deadline passed, by stage', ('endpoint', 'stage'))
+component_stats = registry.gauge(
+    'retina_component_stat', 'Micro-batcher and cache statistics, sampled at scrape time', ('component', 'stat'))
+
+
+# Decoding
+def decode_image(data):
+    # Decode uploaded image bytes straight into a BGR array, no disk round-trip
+    with stage_seconds.time(stage='decode'):
+        img = decode_bytes(data, app.config['REDUCED_DECODE'])
+    if img is None:
+        raise ValueError("Could not decode uploaded image")
+    return img
 
-📅 **Monitoring**:
-- Detailed eye exams every 6–12 months
-    """,
-    (20, 30): """
-🩺 **Diagnosis**: Rare disorders like uveitis, early optic neuritis, trauma-induced damage.
 
-🏥 **Consultations**:
-- Specialist depending on type (retina, cornea, neuro)
+def save_upload(data, eye, filename=''):
+    # Opt-in persistence with a unique name per request so concurrent
+    # requests never overwrite each other's files
+    ext = os.path.splitext(filename or '')[1].lower() or '.jpg'
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f"{eye}_{uuid.uuid4().hex}{ext}")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
 
-🍽️ **Diet**:
-- Anti-inflammatory foods: turmeric, berries
 
-🧘‍♂️ **Lifestyle**:
-- Use safety goggles if at risk (workplace)
+# Preprocessing
+def preprocess_image(image):
+    # Accepts a file path or an already decoded BGR image array
+    img = load_image(image)
+    out = np.empty((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=model_input["dtype"])
+    with stage_seconds.time(stage='preprocess'):
+        return preprocess_into(img, out, app.config['PREPROCESS_MODE'], model_input["channel_order"])
+
+
+def load_image(image):
+    if isinstance(image, str) and app.config['REDUCED_DECODE']:
+        img = decode_bytes(np.fromfile(image, dtype=np.uint8), True) if os.path.isfile(image) else None
+    else:
+        img = cv2.imread(image) if isinstance(image, str) else image
+    if img is None:
+        raise ValueError(f"Could not read image '{image}'")
+    return img
 
-💊 **Treatment**:
-- Topical or systemic steroids for inflammatory causes
+# Prediction
+def build_input(left_image, right_image, out=None):
+    # Both eyes are written straight into one (224, 224, 6) buffer
+    pair = [(load_image(left_image), load_image(right_image))]
+    if out is not None:
+        out = out[np.newaxis]
+    with stage_seconds.time(stage='preprocess_pair'):
+        return preprocess_pairs(pair, app.config['PREPROCESS_MODE'], out,
+                                model_input["dtype"], model_input["channel_order"])[0]
+
+
+def infer(left_image, right_image):
+    # Left and right eyes are preprocessed in parallel on the preprocess stage
+    combined = np.empty((IMAGE_SIZE, IMAGE_SIZE, 6), dtype=model_input["dtype"])
+    left = preprocess_pool.submit(preprocess_image, left_image)
+    right = preprocess_pool.submit(preprocess_image, right_image)
+    combined[..., :3] = left.result()
+    combined[..., 3:] = right.result()
+    return batcher.submit(combined)  # shape: (8,)
+
+
+def predict_class(left_image, right_image):
+    return summarize_prediction(infer(left_image, right_image))
+
+
+def preprocess_uploaded(data, digest, deadline=None):
+    key = (f"{app.config['PREPROCESS_MODE']}:{int(app.config['REDUCED_DECODE'])}:"
+           f"{model_input['dtype'].name}:{model_input['channel_order']}:{digest}")
+
+    def compute():
+        img = decode_image(data)
+        check_deadline(deadline, 'preprocess')
+        return preprocess_image(img)
+    return tensor_cache.get_or_compute(key, compute)
+
+
+def infer_uploaded(left_bytes, right_bytes, left_hash, right_hash, deadline=None):
+    # The deadline is checked as each eye leaves the preprocess queue,
+    # between decoding and filtering, and as the pair leaves the batch queue
+    left = preprocess_pool.submit(preprocess_uploaded, left_bytes, left_hash, deadline, deadline=deadline)
+    right = preprocess_pool.submit(preprocess_uploaded, right_bytes, right_hash, deadline, deadline=deadline)
+    combined = np.empty((IMAGE_SIZE, IMAGE_SIZE, 6), dtype=model_input["dtype"])
+    try:
+        combined[..., :3] = left.result()
+        combined[..., 3:] = right.result()
+    except DeadlineExceeded:
+        right.cancel()
+        raise
+    return batcher.submit(combined, deadline)
+
+
+def predict_uploaded(left_bytes, right_bytes, deadline=None):
+    # Model output for a pair of uploaded image byte streams, served from
+    # the prediction cache when the same pair was seen recently and built
+    # from cached per-eye tensors when only one eye is new
+    left_hash, right_hash = content_hash(left_bytes), content_hash(right_bytes)
+    while True:
+        try:
+            return prediction_cache.get_or_compute(
+                pair_key(left_hash, right_hash),
+                lambda: infer_uploaded(left_bytes, right_bytes, left_hash, right_hash, deadline),
+                deadline,
+            )
+        except DeadlineExceeded:
+            # It may have been the deadline of another request for the same
+            # pair that this one was waiting on; only give up on our own
+            if expired(deadline):
+                raise
+
+
+def summarize_prediction(prediction):
+    label = np.argmax(prediction)
+    confidence = round(prediction[label] * 100, 2)
 
-📅 **Monitoring**:
-- As per underlying condition
-    """,
-    (30, 40): """
-🩺 **Diagnosis**: Intermediate-stage disorders (e.g., keratoconus, autoimmune uveitis).
+    # Measured on labeled data by evaluate.py, see model_metrics.py
+    accuracy = model_metrics["accuracy"]
+    loss = model_metrics["loss"]
 
-🏥 **Consultations**:
-- Cornea or autoimmune specialist
+    probabilities = {class_labels[i]: round(float(prediction[i]), 4) for i in range(len(class_labels))}
+    return class_labels[label], confidence, accuracy, loss, probabilities
 
-🍽️ **Diet**:
-- Omega-3s, green tea, flax seeds
 
-🧘‍♀️ **Lifestyle**:
-- Maintain hygiene for eye infections
+# Bulk prediction: one model call per chunk, one NDJSON-ready dict per item
+def prepare_bulk_item(item, out):
+    try:
+        build_input(decode_image(item.left), decode_image(item.right), out=out)
+        return None
+    except Exception as e:
+        return str(e)
+    finally:
+        item.left = item.right = None
+
+
+def predict_bulk_chunk(chunk, include_text=True):
+    ready, lines = [], {}
+    inputs = np.empty((len(chunk), IMAGE_SIZE, IMAGE_SIZE, 6), dtype=model_input["dtype"])
+    for item in chunk:
+        if item.error:
+            lines[item.index] = {"index": item.index, "id": item.id, "error": item.error}
+
+    # Items are decoded and preprocessed in parallel, each into its own slot
+    slots = [(slot, item) for slot, item in enumerate(chunk) if not item.error]
+    errors = preprocess_pool.map(prepare_bulk_item, [item for _, item in slots], [inputs[slot] for slot, _ in slots])
+    ready_slots = []
+    for (slot, item), error in zip(slots, errors):
+        if error:
+            lines[item.index] = {"index": item.index, "id": item.id, "error": error}
+        else:
+            ready.append(item)
+            ready_slots.append(slot)
+
+    if ready:
+        try:
+            predictions = run_model(inputs[ready_slots])
+            for item, prediction in zip(ready, predictions):
+                disease, confidence, accuracy, loss, probabilities = summarize_prediction(prediction)
+                predicted_class_total.inc(disease=disease)
+                lines[item.index] = {
+                    "index": item.index,
+                    "id": item.id,
+                    "predicted_disease": disease,
+                    "confidence": float(confidence),
+                    "accuracy": float(accuracy),
+                    "loss": float(loss),
+                    **recommendation_fields(disease, item.age, include_text),
+                    "probabilities": {k: float(v) for k, v in probabilities.items()}
+                }
+        except Exception as e:
+            print("🔥 Batch prediction error:", str(e))
+            request_errors_total.inc(endpoint='predict_batch')
+            for item in ready:
+                lines[item.index] = {"index": item.index, "id": item.id, "error": str(e)}
+
+    for item in chunk:
+        yield json.dumps(lines[item.index]) + "\n"
+
+
+def recommendation_fields(disease, age, include_text=True):
+    # The recommendation id always; the full markdown text unless the client
+    # asked for ids only (it can fetch /recommendations/<id> once and cache it)
+    with stage_seconds.time(stage='recommendation'):
+        entry = lookup_recommendation(disease, age)
+    fields = {"recommendation_id": entry.id if entry else None}
+    if include_text:
+        fields["recommendation"] = entry.markdown if entry else NO_RECOMMENDATION
+    return fields
+
+
+def prediction_response(left_bytes, right_bytes, age, include_text=True, deadline=None):
+    # Age only feeds the recommendation, never the (cached) model output
+    prediction = predict_uploaded(left_bytes, right_bytes, deadline)
+    disease, confidence, accuracy, loss, probabilities = summarize_prediction(prediction)
+    predicted_class_total.inc(disease=disease)
+
+    return {
+        "predicted_disease": disease,
+        "confidence": float(confidence),
+        "accuracy": float(accuracy),
+        "loss": float(loss),
+        **recommendation_fields(disease, age, include_text),
+        "probabilities": {k: float(v) for k, v in probabilities.items()}
+    }
+
+
+def wants_recommendation_text():
+    # ?recommendation=id returns only recommendation_id to keep payloads small
+    return request.args.get('recommendation', 'text') != 'id'
+
+
+def run_job(left_bytes, right_bytes, age):
+    # Jobs accepted (or resumed) while the model is still loading wait for it
+    while not model_ready.wait(timeout=5):
+        if model_status["state"] == "failed":
+            raise RuntimeError("Model failed to load: " + str(model_status["error"]))
+    return prediction_response(left_bytes, right_bytes, age)
+
+
+# Step 8: Asynchronous jobs (POST /jobs, GET /jobs/<id>). JOB_STORE=sqlite
+# keeps them in JOB_STORE_PATH so they survive restarts and are visible to
+# every gunicorn worker; the default in-memory store is per process.
+if os.environ.get('JOB_STORE', 'memory') == 'sqlite':
+    job_store = SQLiteJobStore(os.environ.get('JOB_STORE_PATH', 'jobs.sqlite3'))
+else:
+    job_store = MemoryJobStore()
+job_runner = JobRunner(
+    job_store,
+    run_job,
+    max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+    max_queued=int(os.environ.get('JOB_QUEUE_SIZE', 100)),
+    retention_seconds=float(os.environ.get('JOB_RETENTION_SECONDS', 3600)),
+)
+
+# Step 9: Admission control for /predict (see admission.py). At most
+# ADMISSION_MAX_CONCURRENT requests are processed at once (0 = unlimited),
+# ADMISSION_MAX_QUEUE more wait up to ADMISSION_MAX_WAIT_SECONDS, the rest
+# get a fast 503. RATE_LIMIT_PER_SECOND > 0 adds a token bucket per client,
+# identified by RATE_LIMIT_KEY_HEADER (e.g. X-API-Key) or the client address
+# (the peer, or the address the trusted proxies saw, see TRUSTED_PROXY_COUNT).
+# Under gunicorn the limits are per worker and gunicorn.conf.py gives every
+# worker enough threads for all of them (smaller defaults there).
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', 16)),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 32)),
+    max_wait_seconds=float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', 10)),
+)
+rate_limiter = RateLimiter(
+    rate=float(os.environ.get('RATE_LIMIT_PER_SECOND', 0)),
+    burst=float(os.environ.get('RATE_LIMIT_BURST', 10)),
+)
+rate_limit_key_header = os.environ.get('RATE_LIMIT_KEY_HEADER')
 
-💊 **Treatment**:
-- Cross-linking (keratoconus)
-- Steroids/immunomodulators (uveitis)
 
-📅 **Monitoring**:
-- 3-monthly if active disease
-    """,
-    (40, 50): """
-🩺 **Diagnosis**: Potential for degenerative disorders or post-injury complications.
+# Routes
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    g.metrics_started = time.perf_counter()
+    requests_in_flight.inc(endpoint=g.metrics_endpoint)
 
-🏥 **Consultations**:
-- Multispecialty: retina, glaucoma, neuro
 
-🍽️ **Diet**:
-- Fiber-rich, low sodium for IOP control
+@app.after_request
+def record_request_metrics(response):
+    requests_total.inc(endpoint=g.metrics_endpoint, status=response.status_code)
+    # A streamed body is produced after this runs; its generator calls
+    # finish_streamed_request_metrics() once the stream ends instead
+    if not g.get('metrics_streamed'):
+        request_seconds.observe(time.perf_counter() - g.metrics_started, endpoint=g.metrics_endpoint)
+    return response
 
-🧘‍♂️ **Lifestyle**:
-- No heavy eye rubbing
 
-💊 **Treatment**:
-- Depending on the specific pathology (drops, surgery)
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs twice for a stream_with_context() response, hence the flag
+    if 'metrics_endpoint' in g and not g.get('metrics_streamed'):
+        requests_in_flight.dec(endpoint=g.metrics_endpoint)
 
-📅 **Monitoring**:
-- Every 3–6 months
-    """,
-    (50, 60): """
-🩺 **Diagnosis**: ischemic optic neuropathy, chronic uveitis.
 
-🏥 **Consultations**:
-- Retina + anterior segment specialists
+def finish_streamed_request_metrics():
+    request_seconds.observe(time.perf_counter() - g.metrics_started, endpoint=g.metrics_endpoint)
+    requests_in_flight.dec(endpoint=g.metrics_endpoint)
 
-🍽️ **Diet**:
-- Vitamin C, E, and Zinc supplements
 
-🧘‍♀️ **Lifestyle**:
-- Indoor mobility training if needed
+def not_ready_response():
+    response = jsonify({"error": "Model is not ready yet", "state": model_status["state"]})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
 
-💊 **Treatment**:
-- Surgery (e.g., cataract) + medications
 
-📅 **Monitoring**:
-- 2–3 month follow-up depending on condition
-    """,
-    (60, 100): """
-🩺 **Diagnosis**: Optic atrophy, retinal vascular occlusion, age-related issues.
+def rejected_response(rejection, endpoint):
+    admission_rejected_total.inc(endpoint=endpoint, reason=rejection.reason)
+    response = jsonify({"error": f"Server is overloaded: {rejection.reason}"})
+    response.status_code = 429 if rejection.reason == 'rate limited' else 503
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
 
-🏥 **Consultations**:
-- Full geriatric ophthalmic team
 
-🍽️ **Diet**:
-- Heart and vision-healthy diet, soft textured
+def deadline_response(exceeded, endpoint):
+    deadline_expired_total.inc(endpoint=endpoint, stage=exceeded.stage)
+    return jsonify({"error": f"Deadline exceeded before {exceeded.stage}"}), 504
 
-🧘‍♂️ **Lifestyle**:
-- Fall prevention measures, vision aid tools
 
-💊 **Treatment**:
-- Surgery or long-term drops depending on condition
+def queued_seconds():
+    # Since the X-Request-Start stamp: 't=<seconds>' (nginx) or milliseconds
+    # or microseconds since the epoch; 0 without a readable one
+    value = request.headers.get(REQUEST_START_HEADER, '').strip()
+    try:
+        started = float(value[2:] if value.startswith('t=') else value)
+    except ValueError:
+        return 0.0
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, time.time() - started)
 
-📅 **Monitoring**:
-- Every 1–2 months for progressive diseases
-    """
-},
-}
 
-# Preprocessing
-def preprocess_image(image_path):
-    img = cv2.imread(image_path)
-    img = cv2.medianBlur(img, 5)
-    img = cv2.GaussianBlur(img, (5, 5), 0)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img = cv2.resize(img, (224, 224))
-    img = img.astype('float32') / 255.0
-    return img
+def request_deadline():
+    # The client's budget from the X-Deadline-Ms header, else the default,
+    # less the time the request already spent queued in front of Flask
+    value = request.headers.get(DEADLINE_HEADER)
+    deadline = deadline_after(float(value) if value else app.config['REQUEST_DEADLINE_MS'])
+    return None if deadline is None else deadline - queued_seconds()
 
-# Prediction
-def predict_class(left_img_path, right_img_path):
-    left_img = preprocess_image(left_img_path)
-    right_img = preprocess_image(right_img_path)
-    combined = np.concatenate([left_img, right_img], axis=-1)
-    combined = np.expand_dims(combined, axis=0)
-    
-    prediction = model.predict(combined)[0]  # shape: (8,)
-    label = np.argmax(prediction)
-    confidence = round(prediction[label] * 100, 2)
-    
-    # Realistic accuracy and loss for single prediction — can be omitted or hardcoded
-    accuracy = 84.511 # approximate
-    loss = 0.14328
-    
-    probabilities = {class_labels[i]: round(float(prediction[i]), 4) for i in range(len(class_labels))}
-    return class_labels[label], confidence, accuracy, loss, probabilities
 
+def client_key():
+    if rate_limit_key_header and request.headers.get(rate_limit_key_header):
+        return request.headers[rate_limit_key_header]
+    return request.remote_addr
 
-# Get recommendation
-def get_recommendation(disease, age):
-    for age_range, advice in recommendations[disease].items():
-        if age_range[0] <= age < age_range[1]:
-            return advice
-    return "No recommendation found."
 
-# Routes
 @app.route('/predict', methods=['POST'])
 @app.route('/predict', methods=['POST'])
 def predict():
+    if not model_ready.is_set():
+        return not_ready_response()
+
     try:
-        age = int(request.form['age'])
-        left_image = request.files['left_eye']
-        right_image = request.files['right_eye']
+        deadline = request_deadline()
+    except ValueError:
+        return jsonify({"error": f"Invalid {DEADLINE_HEADER} header, expected milliseconds"}), 400
+
+    # Rejected before the upload is even parsed, let alone decoded
+    try:
+        rate_limiter.check(client_key())
+        admission.acquire(deadline)
+    except Rejected as rejection:
+        return rejected_response(rejection, 'predict')
+    except DeadlineExceeded as exceeded:
+        return deadline_response(exceeded, 'predict')
+    started = time.perf_counter()
+    try:
+        return predict_admitted(deadline)
+    finally:
+        admission.release(time.perf_counter() - started)
 
-        left_path = os.path.join(app.config['UPLOAD_FOLDER'], 'left.jpg')
-        right_path = os.path.join(app.config['UPLOAD_FOLDER'], 'right.jpg')
-        left_image.save(left_path)
-        right_image.save(right_path)
 
-        disease, confidence, accuracy, loss, probabilities = predict_class(left_path, right_path)
-        recommendation = get_recommendation(disease, age)
+def predict_admitted(deadline):
+    try:
+        age = int(request.form['age'])
+        left_file = request.files['left_eye']
+        right_file = request.files['right_eye']
+        left_bytes = left_file.read()
+        right_bytes = right_file.read()
+        upload_bytes.observe(len(left_bytes), eye='left')
+        upload_bytes.observe(len(right_bytes), eye='right')
 
-        return jsonify({
-            "predicted_disease": disease,
-            "confidence": float(confidence),
-            "accuracy": float(accuracy),
-            "loss": float(loss),
-            "recommendation": recommendation,
-            "probabilities": {k: float(v) for k, v in probabilities.items()}
-        })
+        if app.config['SAVE_UPLOADS']:
+            save_upload(left_bytes, 'left', left_file.filename)
+            save_upload(right_bytes, 'right', right_file.filename)
 
+        return jsonify(prediction_response(left_bytes, right_bytes, age, wants_recommendation_text(), deadline))
 
+    except DeadlineExceeded as exceeded:
+        return deadline_response(exceeded, 'predict')
     except Exception as e:
         print("🔥 Prediction error:", str(e))
+        request_errors_total.inc(endpoint='predict')
         return jsonify({"error": "Prediction failed: " + str(e)}), 500
 
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    # Many (left, right, age) triples, either as repeated multipart fields or
+    # as a zip 'archive' with a manifest.csv. Results are streamed back as
+    # NDJSON, one line per item, as soon as each chunk has been through the model.
+    if not model_ready.is_set():
+        return not_ready_response()
+
+    if 'archive' in request.files:
+        items = iter_zip_items(request.files['archive'])
+    else:
+        items = iter_multipart_items(request.files, request.form)
+    include_text = wants_recommendation_text()
+
+    def generate():
+        try:
+            for chunk in chunked(items, app.config['BULK_CHUNK_SIZE']):
+                yield from predict_bulk_chunk(chunk, include_text)
+        except Exception as e:
+            # The payload itself is unreadable (bad zip, missing manifest, ...)
+            print("🔥 Batch payload error:", str(e))
+            yield json.dumps({"error": "Batch payload failed: " + str(e)}) + "\n"
+        finally:
+            # Until the last line is sent (or the client goes away)
+            finish_streamed_request_metrics()
+
+    g.metrics_streamed = True
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        age = int(request.form['age'])
+        left_bytes = request.files['left_eye'].read()
+        right_bytes = request.files['right_eye'].read()
+        job_id = job_runner.submit(left_bytes, right_bytes, age)
+    except QueueFull as e:
+        response = jsonify({"error": "Job queue is full: " + str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '10'
+        return response
+    except Exception as e:
+        print("🔥 Job submit error:", str(e))
+        return jsonify({"error": "Job submit failed: " + str(e)}), 400
+
+    response = jsonify({"id": job_id, "status": "queued"})
+    response.status_code = 202
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    return jsonify(job)
+
+
+@app.route('/recommendations/<recommendation_id>')
+def recommendation(recommendation_id):
+    # Pre-rendered entries: ?format=json (default), html or markdown, with
+    # strong ETags and pre-compressed gzip bodies
+    entry = recommendations_by_id.get(recommendation_id)
+    if entry is None:
+        return jsonify({"error": "Unknown recommendation id"}), 404
+    fmt = request.args.get('format', 'json')
+    if fmt not in entry.representations:
+        return jsonify({"error": f"Unknown format '{fmt}'", "formats": sorted(entry.representations)}), 400
+
+    content_type, body, gzipped, etag = entry.representations[fmt]
+    use_gzip = request.accept_encodings['gzip'] > 0
+    if use_gzip:
+        etag += '-gzip'  # a strong ETag identifies the exact bytes sent
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif use_gzip:
+        response = Response(gzipped, content_type=content_type)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, content_type=content_type)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+@app.route('/healthz')
+def healthz():
+    # Liveness: the process is up and serving requests
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: the model is loaded and warmed up
+    status = 200 if model_ready.is_set() else 503
+    return jsonify(model_status), status
+
+
+@app.route('/stats/batcher')
+def batcher_stats():
+    return jsonify(batcher.stats())
+
+
+@app.route('/stats/pipeline')
+def pipeline_stats():
+    return jsonify({
+        "preprocess": preprocess_pool.stats(),
+        "inference": batcher.stats(),
+    })
+
+
+@app.route('/stats/admission')
+def admission_stats():
+    return jsonify({"admission": admission.stats(), "rate_limit": rate_limiter.stats()})
+
+
+@app.route('/stats/cache')
+def cache_stats():
+    return jsonify({
+        "predictions": prediction_cache.stats(),
+        "tensors": tensor_cache.stats(),
+    })
+
+
+def sample_component_stats():
+    for component, stats in (('batcher', batcher.stats()),
+                             ('preprocess_pool', preprocess_pool.stats()),
+                             ('admission', admission.stats()),
+                             ('rate_limiter', rate_limiter.stats()),
+                             ('prediction_cache', prediction_cache.stats()),
+                             ('tensor_cache', tensor_cache.stats())):
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                component_stats.set(value, component=component, stat=stat)
+
+
+def write_worker_metrics():
+    while True:
+        try:
+            sample_component_stats()
+            write_snapshot(registry, metrics_dir, os.getpid())
+        except OSError as e:
+            print(f"⚠️ Could not write metrics to {metrics_dir}: {e}")
+        time.sleep(metrics_write_seconds)
+
+
+@app.route('/metrics')
+def metrics():
+    sample_component_stats()
+    if not metrics_dir:
+        return Response(registry.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
+    # This worker's own numbers fresh, the others' at most
+    # METRICS_WRITE_SECONDS old
+    write_snapshot(registry, metrics_dir, os.getpid())
+    return Response(render_snapshots(read_snapshots(metrics_dir)), mimetype=None,
+                    content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route('/')
 def index():
     return "Hello from Render!"
 
 
+def start_worker():
+    # Called in each gunicorn worker right after fork: the master starts no
+    # threads, so start the micro-batcher and preprocess pool here, then load
+    # and warm up this worker's model while it already answers /readyz
+    apply_opencv_threads(thread_settings)
+    batcher.start()
+    preprocess_pool.start()
+    threading.Thread(target=load_model_in_background, name='model-loader', daemon=True).start()
+    if metrics_dir:
+        threading.Thread(target=write_worker_metrics, name='metrics-writer', daemon=True).start()
+
+
+if os.environ.get('LOAD_MODEL_AFTER_FORK') != '1':
+    # Load and warm up the model without blocking the server from starting
+    batcher.start()
+    preprocess_pool.start()
+    threading.Thread(target=load_model_in_background, name='model-loader', daemon=True).start()
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))  # Render sets PORT environment variable
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,243 @@
+import os
+import threading
+
+import numpy as np
+
+# Inference backends behind run_model(). Each one takes a float32
+# (N, 224, 224, 6) batch and returns (N, 8) class probabilities.
+#
+#   keras   the original .h5 model through model.predict
+#   keras-compiled
+#           the same .h5 model traced once per batch-size bucket into a
+#           fixed-signature tf.function (optionally XLA-compiled); inputs
+#           are zero-padded up to the nearest bucket
+#   keras-uint8
+#           the .h5 model wrapped by convert_model.py --uint8 with the
+#           divide by 255 (and optionally the BGR->RGB swap) as input layers;
+#           it takes the filtered uint8 pixels, a quarter of the bytes
+#   tflite  a TFLite flatbuffer exported by convert_model.py, with one
+#           interpreter per batch-size bucket; inputs are zero-padded up
+#           to the nearest bucket
+#   tflite-dynamic / tflite-int8
+#           post-training quantized TFLite models from quantize_model.py
+#   tflite-shared
+#           the float TFLite model run on the builtin kernels only. The
+#           flatbuffer is memory-mapped read-only and those kernels read the
+#           weights straight out of the mapping, so every worker process on
+#           a host shares one copy through the page cache (the default
+#           XNNPACK delegate repacks them into private memory per process)
+#   onnx    an ONNX graph exported by convert_model.py, run with ONNX Runtime on CPU
+#
+# Every backend reports the input it expects as input_dtype (float32 in
+# [0, 1], or uint8 in [0, 255]) and channel_order ('rgb', or 'bgr' when the
+# model swaps the channels itself), see preprocessing.preprocess_pairs().
+
+BACKENDS = ('keras', 'keras-compiled', 'keras-uint8', 'tflite', 'tflite-dynamic', 'tflite-int8', 'tflite-shared', 'onnx')
+
+DEFAULT_MODEL_PATHS = {
+    'keras': 'retinal_disease_model.h5',
+    'keras-compiled': 'retinal_disease_model.h5',
+    'keras-uint8': 'retinal_disease_model_uint8.h5',
+    'tflite': 'retinal_disease_model.tflite',
+    'tflite-dynamic': 'retinal_disease_model_dynamic.tflite',
+    'tflite-int8': 'retinal_disease_model_int8.tflite',
+    'tflite-shared': 'retinal_disease_model.tflite',
+    'onnx': 'retinal_disease_model.onnx',
+}
+
+EXPORT_COMMANDS = {
+    'keras-uint8': 'python convert_model.py --uint8',
+    'tflite': 'python convert_model.py --tflite',
+    'tflite-dynamic': 'python quantize_model.py --dynamic',
+    'tflite-int8': 'python quantize_model.py --int8 --calibration-dir <images>',
+    'tflite-shared': 'python convert_model.py --tflite',
+    'onnx': 'python convert_model.py --onnx',
+}
+
+
+# Name of the fixed 1x1 convolution convert_model.py --uint8 --fold-bgr
+# puts in front of the model to reorder B,G,R to R,G,B for each eye
+BGR_TO_RGB_LAYER = 'bgr_to_rgb'
+
+
+class KerasBackend:
+    name = 'keras'
+    input_dtype = np.dtype(np.float32)
+    channel_order = 'rgb'
+
+    def __init__(self, path, name=None):
+        from tensorflow.keras.models import load_model
+        self.name = name or self.name
+        self.path = path
+        self.model = load_model(path)
+        dtype = self.model.inputs[0].dtype
+        self.input_dtype = np.dtype(getattr(dtype, 'as_numpy_dtype', dtype))
+        if any(layer.name == BGR_TO_RGB_LAYER for layer in self.model.layers):
+            self.channel_order = 'bgr'
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class CompiledKerasBackend(KerasBackend):
+    name = 'keras-compiled'
+
+    def __init__(self, path, buckets=(1, 2, 4, 8), jit_compile=False):
+        super().__init__(path)
+        import tensorflow as tf
+        self.buckets = sorted(set(int(b) for b in buckets))
+        self.jit_compile = jit_compile
+
+        # model.predict builds a data adapter and callbacks on every call;
+        # a concrete function per bucket skips all of that
+        call = tf.function(lambda x: self.model(x, training=False), jit_compile=jit_compile)
+        input_shape = tuple(self.model.input_shape[1:])
+        self._functions = {
+            bucket: call.get_concrete_function(tf.TensorSpec((bucket,) + input_shape, tf.as_dtype(self.input_dtype)))
+            for bucket in self.buckets
+        }
+        self._input_shape = input_shape
+        self._to_tensor = tf.convert_to_tensor
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=self.input_dtype)
+        largest = self.buckets[-1]
+        outputs = []
+        for start in range(0, len(batch), largest):
+            chunk = batch[start:start + largest]
+            count = len(chunk)
+            bucket = next(b for b in self.buckets if b >= count)
+            if bucket != count:
+                padded = np.zeros((bucket,) + self._input_shape, dtype=self.input_dtype)
+                padded[:count] = chunk
+                chunk = padded
+            outputs.append(self._functions[bucket](self._to_tensor(chunk)).numpy()[:count])
+        return np.concatenate(outputs)
+
+
+class TFLiteBackend:
+    name = 'tflite'
+    channel_order = 'rgb'
+
+    def __init__(self, path, num_threads=None, name=None, shared_weights=False, buckets=(1, 8)):
+        try:
+            from tflite_runtime.interpreter import Interpreter, OpResolverType
+        except ImportError:
+            import tensorflow as tf
+            from tensorflow.lite import Interpreter
+            OpResolverType = tf.lite.experimental.OpResolverType
+        self.name = name or self.name
+        self.path = path
+        self.buckets = sorted(set(int(b) for b in buckets))
+        options = {}
+        if shared_weights:
+            options['experimental_op_resolver_type'] = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+        # Resizing the input means a new allocate_tensors(), which replans
+        # the arena and re-prepares every op (XNNPACK repacks its weights),
+        # so one interpreter is sized for each batch-size bucket up front and
+        # inputs are zero-padded up to the nearest one, like keras-compiled.
+        # Each interpreter holds its own arena and (under XNNPACK) its own
+        # packed weights, which is why the default is two buckets
+        self._interpreters = {}
+        for bucket in self.buckets:
+            interpreter = Interpreter(model_path=path, num_threads=num_threads, **options)
+            details = interpreter.get_input_details()[0]
+            if details['shape'][0] != bucket:
+                interpreter.resize_tensor_input(details['index'], [bucket] + list(details['shape'][1:]))
+            interpreter.allocate_tensors()
+            # Each interpreter holds per-invocation state, so its calls are serialized
+            self._interpreters[bucket] = (interpreter, threading.Lock())
+        interpreter = self._interpreters[self.buckets[0]][0]
+        self._input = interpreter.get_input_details()[0]
+        self._output = interpreter.get_output_details()[0]
+        self._input_shape = tuple(int(d) for d in self._input['shape'][1:])
+        # Full-int8 models are fed float32 and quantized here; an export of
+        # the uint8 Keras variant takes its uint8 pixels unquantized
+        self.input_dtype = np.dtype(self._input['dtype'] if self._input['quantization'][0] == 0 else np.float32)
+        if 'bgr' in self._input['name']:
+            self.channel_order = 'bgr'
+
+    def predict(self, batch):
+        batch = self._quantize(batch, self._input)
+        largest = self.buckets[-1]
+        outputs = []
+        for start in range(0, len(batch), largest):
+            chunk = batch[start:start + largest]
+            count = len(chunk)
+            bucket = next(b for b in self.buckets if b >= count)
+            if bucket != count:
+                padded = np.zeros((bucket,) + self._input_shape, dtype=chunk.dtype)
+                padded[:count] = chunk
+                chunk = padded
+            interpreter, lock = self._interpreters[bucket]
+            with lock:
+                interpreter.set_tensor(self._input['index'], chunk)
+                interpreter.invoke()
+                output = interpreter.get_tensor(self._output['index'])[:count].copy()
+            outputs.append(self._dequantize(output, self._output))
+        return np.concatenate(outputs)
+
+    # Full-int8 models take and return integer tensors
+    @staticmethod
+    def _quantize(batch, details):
+        dtype = details['dtype']
+        scale, zero_point = details['quantization']
+        if not np.issubdtype(dtype, np.integer) or scale == 0:
+            return np.ascontiguousarray(batch, dtype=dtype)
+        info = np.iinfo(dtype)
+        quantized = np.round(np.asarray(batch) / scale + zero_point)
+        return np.ascontiguousarray(np.clip(quantized, info.min, info.max), dtype=dtype)
+
+    @staticmethod
+    def _dequantize(output, details):
+        if not np.issubdtype(output.dtype, np.integer):
+            return output
+        scale, zero_point = details['quantization']
+        if scale == 0:
+            return output
+        return (output.astype(np.float32) - zero_point) * scale
+
+
+class OnnxBackend:
+    name = 'onnx'
+    input_dtype = np.dtype(np.float32)
+    channel_order = 'rgb'
+
+    def __init__(self, path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime")
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+def load_backend(name, path=None, **options):
+    # options are passed to the backend class, e.g. buckets / jit_compile
+    # for keras-compiled, buckets / num_threads for tflite or num_threads
+    # for onnx
+    path = path or DEFAULT_MODEL_PATHS.get(name)
+    if name in ('keras', 'keras-uint8'):
+        if name == 'keras-uint8' and not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, export it first with: {EXPORT_COMMANDS[name]}")
+        return KerasBackend(path, name=name)
+    if name == 'keras-compiled':
+        return CompiledKerasBackend(path, **options)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {BACKENDS}")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, export it first with: {EXPORT_COMMANDS[name]}")
+    if name == 'tflite-shared':
+        return TFLiteBackend(path, name=name, shared_weights=True, **options)
+    if name.startswith('tflite'):
+        return TFLiteBackend(path, name=name, **options)
+    return OnnxBackend(path, **options)
@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from pipeline import DeadlineExceeded, expired
+
+# Dynamic micro-batching: callers submit one (224, 224, 6) tensor each, a
+# background thread collects up to max_batch_size of them (waiting at most
+# max_wait_ms after the first one arrives), runs a single inference call and
+# hands every caller its own row of the result. With max_queue set, submit()
+# blocks while that many tensors are already waiting (backpressure).
+# Tensors whose deadline (see pipeline.py) passes while they wait are dropped
+# before the batch is formed, so they never take a slot in a model call.
+class _Pending:
+    def __init__(self, tensor, deadline=None):
+        self.tensor = tensor
+        self.deadline = deadline
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0, max_queue=0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.max_queue = max(0, int(max_queue))
+
+        self._queue = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._batches = 0
+        self._items = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._busy_seconds = 0.0
+        self._started_at = None
+        self._blocked_submits = 0
+        self._expired = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+            if self._started_at is None:
+                self._started_at = time.perf_counter()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, tensor, deadline=None):
+        # Blocks until the batch containing this tensor has been run and
+        # returns this caller's slice of the model output. Raises
+        # DeadlineExceeded if the deadline passes before it is run.
+        if self.max_batch_size == 1:
+            return self._run_direct(tensor, deadline)
+
+        if self._thread is None:
+            self.start()
+
+        item = _Pending(np.asarray(tensor), deadline)
+        with self._cond:
+            if self.max_queue and len(self._queue) >= self.max_queue:
+                self._blocked_submits += 1
+                while len(self._queue) >= self.max_queue:
+                    if expired(deadline):
+                        self._count_expired()
+                        raise DeadlineExceeded('inference')
+                    self._cond.wait(None if deadline is None else deadline - time.monotonic())
+            self._queue.append(item)
+            self._cond.notify_all()
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _run_direct(self, tensor, deadline=None):
+        if expired(deadline):
+            self._count_expired()
+            raise DeadlineExceeded('inference')
+        start = time.perf_counter()
+        if self._started_at is None:
+            self._started_at = start
+        output = self.predict_fn(np.expand_dims(tensor, axis=0))[0]
+        self._record([start], time.perf_counter() - start)
+        return output
+
+    def _collect(self):
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if self._stopped and not self._queue:
+                return None
+
+            deadline = self._queue[0].enqueued_at + self.max_wait_ms / 1000.0
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            self._drop_expired()
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            self._cond.notify_all()  # wake submitters blocked on a full queue
+            return batch
+
+    def _drop_expired(self):
+        # Called with _cond held
+        live = []
+        for item in self._queue:
+            if expired(item.deadline):
+                self._count_expired()
+                item.error = DeadlineExceeded('inference')
+                item.done.set()
+            else:
+                live.append(item)
+        self._queue[:] = live
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            if not batch:
+                continue  # everything waiting had expired
+
+            started = time.perf_counter()
+            try:
+                stacked = np.stack([item.tensor for item in batch], axis=0)
+                outputs = self.predict_fn(stacked)
+                for i, item in enumerate(batch):
+                    item.result = outputs[i]
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                self._record([item.enqueued_at for item in batch], time.perf_counter() - started, started)
+                for item in batch:
+                    item.done.set()
+
+    def _count_expired(self):
+        with self._stats_lock:
+            self._expired += 1
+
+    def _record(self, enqueued_at, busy_seconds, now=None):
+        now = now or time.perf_counter()
+        waits = [(now - t) * 1000.0 for t in enqueued_at]
+        with self._stats_lock:
+            self._busy_seconds += busy_seconds
+            self._batches += 1
+            self._items += len(waits)
+            self._batch_sizes[len(waits)] += 1
+            self._wait_total_ms += sum(waits)
+            self._wait_max_ms = max(self._wait_max_ms, max(waits))
+
+    def stats(self):
+        with self._stats_lock:
+            elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_queue": self.max_queue,
+                "queue_depth": len(self._queue),
+                "blocked_submits": self._blocked_submits,
+                "expired": self._expired,
+                "utilization": round(self._busy_seconds / elapsed, 4) if elapsed else 0.0,
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "mean_queue_wait_ms": round(self._wait_total_ms / self._items, 3) if self._items else 0.0,
+                "max_queue_wait_ms": round(self._wait_max_ms, 3),
+            }
+
+
+# Check that batching does not change the numbers: every sample is run once
+# on its own and once through the batcher (from concurrent threads so real
+# batches form) and the outputs are compared.
+def verify_batching(predict_fn, samples, max_batch_size=8, max_wait_ms=5.0, atol=1e-4):
+    samples = [np.asarray(s) for s in samples]
+    unbatched = [predict_fn(np.expand_dims(s, axis=0))[0] for s in samples]
+
+    batcher = MicroBatcher(predict_fn, max_batch_size, max_wait_ms).start()
+    batched = [None] * len(samples)
+
+    def worker(i):
+        batched[i] = batcher.submit(samples[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(samples))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = batcher.stats()
+    batcher.stop()
+
+    max_diff = max(float(np.max(np.abs(a - b))) for a, b in zip(unbatched, batched))
+    return max_diff <= atol, max_diff, stats
+
+
+if __name__ == '__main__':
+    # Offline self-check; with --backend the parity is checked on a real
+    # inference backend (e.g. keras or tflite-int8) instead of the stand-in
+    import argparse
+    parser = argparse.ArgumentParser(description="Check that micro-batching does not change the predictions")
+    parser.add_argument('--backend', help="Check a real inference backend instead of the stand-in model")
+    parser.add_argument('--model', help="Model file for the backend (default: its usual path)")
+    parser.add_argument('--samples', type=int, default=32)
+    parser.add_argument('--atol', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    if args.backend:
+        from backends import load_backend
+        from compare_backends import backend_inputs, sample_inputs
+        backend = load_backend(args.backend, args.model)
+        predict_fn = backend.predict
+        samples = backend_inputs(sample_inputs(args.samples), backend)
+    else:
+        # A stand-in model of the same input/output shape
+        rng = np.random.default_rng(0)
+        weights = rng.standard_normal((224 * 224 * 6, 8)).astype('float32') * 0.01
+
+        def predict_fn(batch):
+            logits = batch.reshape(len(batch), -1) @ weights
+            logits -= logits.max(axis=1, keepdims=True)
+            exp = np.exp(logits)
+            return exp / exp.sum(axis=1, keepdims=True)
+
+        samples = rng.random((args.samples, 224, 224, 6), dtype='float32')
+
+    ok, max_diff, stats = verify_batching(predict_fn, samples, atol=args.atol)
+    print(f"Model: {args.backend or 'stand-in'}")
+    print("Batched vs unbatched max abs diff:", max_diff)
+    print("Batcher stats:", stats)
+    print("✅ Parity OK" if ok else "❌ Parity FAILED")
+    if not ok:
+        raise SystemExit(1)
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from labels import class_labels
+from preprocessing import IMAGE_SIZE, PREPROCESS_MODES, decode_bytes, decode_reduction, preprocess_batch
+from recommendations import get_recommendation
+
+# Stage-level benchmark of the /predict pipeline. Every stage is timed on its
+# own for the bundled eye images and for synthetic fundus images of several
+# resolutions. Runs offline with a stand-in model of the real input/output
+# shape unless --backend is given.
+#
+#   python benchmark.py --save benchmarks/baseline.json
+#   python benchmark.py --compare benchmarks/baseline.json --threshold 0.15
+#
+# --compare exits non-zero when any stage's median got slower than the
+# baseline by more than --threshold (a fraction).
+
+SYNTHETIC_SIZES = [(512, 512), (1024, 1024), (2048, 1536), (3072, 2048)]
+
+
+class StandInModel:
+    # (N, 224, 224, 6) -> (N, 8) softmax, with a dense layer's worth of work
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        self.weights = rng.standard_normal((IMAGE_SIZE * IMAGE_SIZE * 6, len(class_labels))).astype(np.float32) * 0.01
+
+    def predict(self, batch):
+        logits = np.asarray(batch, dtype=np.float32).reshape(len(batch), -1) @ self.weights
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def synthetic_fundus(width, height, seed=0):
+    # Dark frame with a bright textured disc, JPEG-encoded like a camera upload
+    rng = np.random.default_rng(seed)
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    center, radius = (width // 2, height // 2), int(min(width, height) * 0.45)
+    cv2.circle(img, center, radius, (40, 90, 170), -1)
+    noise = rng.normal(0, 12, img.shape).astype(np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    cv2.circle(img, (center[0] + radius // 3, center[1]), radius // 6, (140, 200, 240), -1)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+def image_sources():
+    sources = {}
+    for eye in ('left', 'right'):
+        path = os.path.join('static', 'uploads', f'{eye}.jpg')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                sources[f'bundled_{eye}'] = f.read()
+    for width, height in SYNTHETIC_SIZES:
+        sources[f'synthetic_{width}x{height}'] = synthetic_fundus(width, height)
+    return sources
+
+
+def time_stage(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "median_ms": round(float(np.median(times)), 4),
+        "p95_ms": round(float(np.percentile(times, 95)), 4),
+        "n": repeats,
+    }
+
+
+def peak_mb(fn):
+    # Peak memory allocated while fn runs. OpenCV allocates the arrays it
+    # returns through numpy, so a decoded image is counted in full
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_image(data, repeats, tmpdir):
+    results = {}
+    path = os.path.join(tmpdir, 'upload.jpg')
+
+    def save_and_read():
+        with open(path, 'wb') as f:
+            f.write(data)
+        return cv2.imread(path)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    results["upload_save_imread"] = time_stage(save_and_read, repeats)
+    results["upload_decode"] = time_stage(lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR), repeats)
+    results["upload_decode"]["peak_mb"] = peak_mb(lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR))
+    results["upload_decode_reduced"] = time_stage(lambda: decode_bytes(buf, True), repeats)
+    results["upload_decode_reduced"]["peak_mb"] = peak_mb(lambda: decode_bytes(buf, True))
+    results["upload_decode_reduced"]["reduction"] = decode_reduction(buf)
+
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    median = cv2.medianBlur(img, 5)
+    gaussian = cv2.GaussianBlur(median, (5, 5), 0)
+    rgb = cv2.cvtColor(gaussian, cv2.COLOR_BGR2RGB)
+    resized = cv2.resize(rgb, (IMAGE_SIZE, IMAGE_SIZE))
+
+    results["median_blur"] = time_stage(lambda: cv2.medianBlur(img, 5), repeats)
+    results["gaussian_blur"] = time_stage(lambda: cv2.GaussianBlur(median, (5, 5), 0), repeats)
+    results["color_conversion"] = time_stage(lambda: cv2.cvtColor(gaussian, cv2.COLOR_BGR2RGB), repeats)
+    results["resize"] = time_stage(lambda: cv2.resize(rgb, (IMAGE_SIZE, IMAGE_SIZE)), repeats)
+    results["normalization"] = time_stage(lambda: resized.astype('float32') / 255.0, repeats)
+    for mode in PREPROCESS_MODES:
+        results[f"preprocess_{mode}"] = time_stage(lambda: preprocess_batch([img], mode), repeats)
+    return results
+
+
+def benchmark_pipeline(model, repeats):
+    results = {}
+    rng = np.random.default_rng(0)
+    left = rng.random((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+    right = rng.random((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+    results["concatenation"] = time_stage(
+        lambda: np.expand_dims(np.concatenate([left, right], axis=-1), axis=0), repeats
+    )
+
+    combined = np.expand_dims(np.concatenate([left, right], axis=-1), axis=0)
+    results["inference"] = time_stage(lambda: model.predict(combined), repeats)
+
+    prediction = model.predict(combined)[0]
+    disease = class_labels[int(np.argmax(prediction))]
+    results["get_recommendation"] = time_stage(lambda: get_recommendation(disease, 45), repeats)
+
+    response = {
+        "predicted_disease": disease,
+        "confidence": float(prediction.max() * 100),
+        "accuracy": 84.511,
+        "loss": 0.14328,
+        "recommendation": get_recommendation(disease, 45),
+        "probabilities": {class_labels[i]: float(p) for i, p in enumerate(prediction)},
+    }
+    results["json_serialization"] = time_stage(lambda: json.dumps(response), repeats)
+    return results
+
+
+def run(model, repeats):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, data in image_sources().items():
+            for stage, timing in benchmark_image(data, repeats, tmpdir).items():
+                results[f"{name}/{stage}"] = timing
+    for stage, timing in benchmark_pipeline(model, repeats).items():
+        results[f"pipeline/{stage}"] = timing
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, timing in sorted(results.items()):
+        old = baseline.get("results", {}).get(key)
+        if not old or old["median_ms"] <= 0:
+            continue
+        change = timing["median_ms"] / old["median_ms"] - 1.0
+        flag = "❌" if change > threshold else ("✅" if change < -threshold else "  ")
+        print(f"{flag} {key:<52}{old['median_ms']:>10.3f} ->{timing['median_ms']:>10.3f} ms ({change:+.1%})")
+        if change > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of the prediction pipeline")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--backend', help="Time a real inference backend (e.g. keras) instead of the stand-in model")
+    parser.add_argument('--save', help="Write results as a JSON baseline to this file")
+    parser.add_argument('--compare', help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed slowdown before a stage is flagged")
+    args = parser.parse_args()
+
+    if args.backend:
+        from backends import load_backend
+        model = load_backend(args.backend)
+    else:
+        model = StandInModel()
+
+    results = run(model, args.repeats)
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "model": args.backend or "stand-in",
+            "repeats": args.repeats,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        for key, timing in results.items():
+            peak = f"  peak {timing['peak_mb']:.2f} MB" if 'peak_mb' in timing else ""
+            print(f"{key:<52}{timing['median_ms']:>10.3f} ms  (p95 {timing['p95_ms']:.3f}){peak}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if regressions:
+        raise SystemExit(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from bulk import chunked
+from cache import content_hash, pair_key
+from preprocessing import IMAGE_SIZE, PREPROCESS_MODES, filter_and_resize_into, preprocessing_fingerprint
+from score_dataset import decode_pair, read_manifest, read_pair
+from tensor_store import STORE_DTYPES, TensorStore
+
+# Preprocesses every eye pair of a manifest (the same CSV score_dataset.py
+# reads) once into a TensorStore, so later evaluations and re-scoring runs
+# read the model inputs instead of decoding and filtering again.
+#
+#   python build_tensor_store.py manifest.csv --store tensors/
+#   python build_tensor_store.py manifest.csv --store tensors/ --mode resize_first --dtype float16
+#
+# Pairs already stored under the same preprocessing settings are skipped, so
+# an interrupted build continues where it stopped. Entries stored under other
+# settings (or older filter code) are reported as stale and recomputed.
+
+_store = None
+
+
+def _init_worker(store_path):
+    global _store
+    cv2.setNumThreads(1)
+    if os.path.exists(store_path):
+        _store = TensorStore(store_path)
+
+
+def prepare(task):
+    # Runs in a worker process: (row, key, uint8 pair or None, error)
+    row, mode, reduced, fingerprint = task
+    try:
+        data = read_pair(row)
+        key = pair_key(*map(content_hash, data))
+        if _store is not None and _store.lookup(key, fingerprint) is not None:
+            return row, key, None, None
+        left, right = decode_pair(row, data, reduced)
+        pair = np.empty((IMAGE_SIZE, IMAGE_SIZE, 6), dtype=np.uint8)
+        filter_and_resize_into(left, pair[..., :3], mode)
+        filter_and_resize_into(right, pair[..., 3:], mode)
+        return row, key, pair, None
+    except Exception as e:
+        return row, None, None, str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess a manifest of eye pairs into a tensor store")
+    parser.add_argument('manifest', help="CSV with left,right columns (as for score_dataset.py)")
+    parser.add_argument('--store', required=True, help="Store directory (created if missing)")
+    parser.add_argument('--dtype', choices=STORE_DTYPES, default='uint8')
+    parser.add_argument('--chunk-size', type=int, default=1024, help="Pairs per chunk file")
+    parser.add_argument('--mode', choices=PREPROCESS_MODES, default='exact')
+    parser.add_argument('--reduced-decode', action='store_true', help="Decode large JPEGs at reduced scale")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=256, help="Pairs written between index flushes")
+    args = parser.parse_args()
+
+    fingerprint = preprocessing_fingerprint(args.mode, args.reduced_decode)
+    store = TensorStore(args.store, args.dtype, args.chunk_size, writable=True)
+    before = store.stats(fingerprint)
+    if before["stale_entries"]:
+        print(f"⚠️ {before['stale_entries']} of {before['entries']} entries were preprocessed "
+              f"with other settings and will be recomputed")
+
+    rows = read_manifest(args.manifest)
+    tasks = ((row, args.mode, args.reduced_decode, fingerprint) for row in rows)
+    counts = {"stored": 0, "fresh": 0, "errors": 0}
+    started = time.perf_counter()
+
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(max(1, args.workers), initializer=_init_worker, initargs=(args.store,)) as pool:
+        for batch in chunked(tasks, args.batch_size):
+            for row, key, pair, error in pool.imap(prepare, batch, chunksize=8):
+                if error:
+                    counts["errors"] += 1
+                    print(f"⚠️ Row {row['index']} ({row['id']}): {error}")
+                elif pair is None or store.lookup(key, fingerprint) is not None:
+                    counts["fresh"] += 1  # already stored, or repeated in this manifest
+                else:
+                    store.put(key, fingerprint, pair)
+                    counts["stored"] += 1
+            store.flush()
+            done = sum(counts.values())
+            print(f"{done}/{len(rows)} pairs ({done / (time.perf_counter() - started):.1f} pairs/s)")
+
+    report = dict(counts, seconds=round(time.perf_counter() - started, 2), fingerprint=fingerprint,
+                  store=store.stats(fingerprint))
+    store.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
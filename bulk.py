@@ -0,0 +1,96 @@
+import csv
+import io
+import itertools
+import shutil
+import tempfile
+import zipfile
+
+
+# Bulk input readers for /predict_batch. Each reader lazily yields one item
+# per (left, right, age) triple, reading that item's image bytes only when it
+# is pulled, so memory stays bounded by the chunk being processed.
+#
+# Flask closes request.files when the view returns, before a streamed
+# response is consumed, so uploads are first moved into temporary files
+# owned by the reader.
+class BulkItem:
+    def __init__(self, index, item_id, age=None, left=None, right=None, error=None):
+        self.index = index
+        self.id = item_id
+        self.age = age
+        self.left = left
+        self.right = right
+        self.error = error
+
+
+def _parse_age(value):
+    try:
+        return int(value), None
+    except (TypeError, ValueError):
+        return None, f"Invalid age: {value!r}"
+
+
+def detach_upload(file_storage):
+    detached = tempfile.TemporaryFile()
+    file_storage.stream.seek(0)
+    shutil.copyfileobj(file_storage.stream, detached)
+    detached.seek(0)
+    return detached
+
+
+def iter_multipart_items(files, form):
+    # Repeated left_eye / right_eye / age fields, paired up by position
+    lefts = [detach_upload(f) for f in files.getlist('left_eye')]
+    rights = [detach_upload(f) for f in files.getlist('right_eye')]
+    return _multipart_items(lefts, rights, form.getlist('age'), form.getlist('id'))
+
+
+def _multipart_items(lefts, rights, ages, ids):
+    for i in range(max(len(lefts), len(rights), len(ages))):
+        item_id = ids[i] if i < len(ids) else str(i)
+        if i >= len(lefts) or i >= len(rights) or i >= len(ages):
+            yield BulkItem(i, item_id, error="Missing left_eye, right_eye or age for this item")
+            continue
+
+        age, error = _parse_age(ages[i])
+        if error:
+            yield BulkItem(i, item_id, error=error)
+            continue
+        yield BulkItem(i, item_id, age, lefts[i].read(), rights[i].read())
+        lefts[i].close()
+        rights[i].close()
+
+
+def iter_zip_items(file_storage, manifest_name='manifest.csv'):
+    # A zip archive holding the images plus a CSV manifest with
+    # left,right,age columns (and an optional id column)
+    return _zip_items(detach_upload(file_storage), manifest_name)
+
+
+def _zip_items(fileobj, manifest_name):
+    with fileobj, zipfile.ZipFile(fileobj) as archive, archive.open(manifest_name) as raw:
+        rows = csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8'))
+        for i, row in enumerate(rows):
+            item_id = row.get('id') or str(i)
+            age, error = _parse_age(row.get('age'))
+            if not row.get('left') or not row.get('right'):
+                error = "Manifest row is missing left or right"
+            if error:
+                yield BulkItem(i, item_id, error=error)
+                continue
+
+            try:
+                left, right = archive.read(row['left']), archive.read(row['right'])
+            except KeyError as e:
+                yield BulkItem(i, item_id, error=e.args[0])
+                continue
+            yield BulkItem(i, item_id, age, left, right)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
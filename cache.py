@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from pipeline import DeadlineExceeded
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def pair_key(left_hash, right_hash):
+    # Order matters: swapping the eyes is a different model input
+    return f"{left_hash}:{right_hash}"
+
+
+# Content-addressed cache of model outputs with LRU eviction and a TTL.
+# Identical requests that arrive while the first one is still computing wait
+# on that computation instead of starting their own, but no longer than their
+# own deadline (see pipeline.py).
+class PredictionCache:
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_compute(self, key, compute, deadline=None):
+        if self.max_entries <= 0:
+            return compute()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_seconds <= 0 or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not owner:
+            try:
+                return future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                raise DeadlineExceeded('cache')
+
+        try:
+            value = compute()
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_inflight": self.shared,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.shared) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Byte-budgeted LRU cache of preprocessed single-eye tensors, so a follow-up
+# visit that re-uses one eye image only decodes and filters the other one.
+class TensorCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+
+        self._entries = OrderedDict()  # key -> read-only ndarray
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        if self.max_bytes <= 0:
+            return compute()
+
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tensor
+            self.misses += 1
+
+        tensor = compute()
+        tensor.setflags(write=False)
+        if tensor.nbytes > self.max_bytes:
+            return tensor
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = tensor
+                self._bytes += tensor.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+        return tensor
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "max_bytes": self.max_bytes,
+                "bytes_used": self._bytes,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,163 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, DEFAULT_MODEL_PATHS, load_backend
+from preprocessing import preprocess_pairs
+
+# Side-by-side check of every inference backend against Keras: parity of the
+# class probabilities, per-call latency and resident memory. Each backend is
+# measured in its own process so their memory does not add up.
+#
+#   python compare_backends.py                      # every float backend whose model file exists
+#   python compare_backends.py --backends keras tflite --atol 1e-4
+#   python compare_backends.py --backends keras keras-compiled --batch-sizes 1 3 8
+#       (per-call saving of the compiled path over model.predict, including padding)
+#   python compare_backends.py --backends keras keras-uint8
+#       (the uint8-input variant against the float path)
+#
+# Exits non-zero if any backend disagrees with Keras by more than --atol.
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def sample_pairs(count):
+    # The bundled eye pair plus synthetic fundus-sized noise images
+    left = cv2.imread('static/uploads/left.jpg')
+    right = cv2.imread('static/uploads/right.jpg')
+    rng = np.random.default_rng(0)
+    pairs = [(left, right)] if left is not None and right is not None else []
+    while len(pairs) < count:
+        pairs.append(tuple(rng.integers(0, 256, (896, 896, 3), dtype=np.uint8) for _ in range(2)))
+    return pairs
+
+
+def sample_inputs(count):
+    return preprocess_pairs(sample_pairs(count))
+
+
+def backend_inputs(inputs, backend):
+    # float32 RGB inputs in the format the backend takes; uint8 pixels are
+    # recovered exactly, since the float inputs are pixels / 255
+    if backend.input_dtype == np.uint8:
+        inputs = np.rint(inputs * 255.0).astype(np.uint8)
+    if backend.channel_order == 'bgr':
+        inputs = inputs[..., [2, 1, 0, 5, 4, 3]]
+    return np.ascontiguousarray(inputs)
+
+
+def measure(name, path, inputs, batch_sizes, repeats, results):
+    try:
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        backend = load_backend(name, path)
+        load_seconds = time.perf_counter() - started
+        inputs = backend_inputs(inputs, backend)
+
+        probabilities = np.concatenate([backend.predict(inputs[i:i + 1]) for i in range(len(inputs))])
+
+        latency = {}
+        for batch_size in batch_sizes:
+            batch = np.repeat(inputs[:1], batch_size, axis=0)
+            backend.predict(batch)  # warmup
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                backend.predict(batch)
+                times.append((time.perf_counter() - start) * 1000.0)
+            latency[str(batch_size)] = {
+                "p50_ms": round(float(np.percentile(times, 50)), 3),
+                "p95_ms": round(float(np.percentile(times, 95)), 3),
+                "per_item_ms": round(float(np.median(times)) / batch_size, 3),
+            }
+
+        results.put({
+            "backend": name,
+            "path": path,
+            "load_seconds": round(load_seconds, 3),
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_mb": round(rss_mb(), 1),
+            "latency": latency,
+            "probabilities": probabilities.tolist(),
+        })
+    except Exception as e:
+        results.put({"backend": name, "path": path, "error": str(e)})
+
+
+def run_isolated(name, path, inputs, batch_sizes, repeats):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=measure, args=(name, path, inputs, batch_sizes, repeats, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends for parity, latency and memory")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS)
+    parser.add_argument('--samples', type=int, default=8, help="Inputs used for the parity check")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--atol', type=float, default=1e-4, help="Max allowed probability difference from Keras")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Quantized variants are not expected to match within --atol; quantize_model.py reports on them
+    names = args.backends or [
+        name for name in BACKENDS
+        if name not in ('tflite-dynamic', 'tflite-int8') and os.path.exists(DEFAULT_MODEL_PATHS[name])
+    ]
+    if 'keras' not in names:
+        names.insert(0, 'keras')  # the reference every other backend is checked against
+
+    inputs = sample_inputs(args.samples)
+    reports = [run_isolated(name, DEFAULT_MODEL_PATHS[name], inputs, args.batch_sizes, args.repeats) for name in names]
+
+    reference = next(r for r in reports if r["backend"] == 'keras')
+    if "error" in reference:
+        raise SystemExit(f"Keras reference failed to run: {reference['error']}")
+    expected = np.array(reference["probabilities"])
+
+    failed = False
+    for report in reports:
+        if "error" in report:
+            failed = True
+            print(f"❌ {report['backend']}: {report['error']}")
+            continue
+        actual = np.array(report.pop("probabilities"))
+        report["max_prob_diff"] = float(np.max(np.abs(actual - expected)))
+        report["top1_agreement"] = float(np.mean(actual.argmax(1) == expected.argmax(1)))
+        report["parity_ok"] = report["max_prob_diff"] <= args.atol
+        failed |= not report["parity_ok"]
+        print(f"{'✅' if report['parity_ok'] else '❌'} {report['backend']}: "
+              f"max diff {report['max_prob_diff']:.2e}, "
+              f"p50 {report['latency'][str(args.batch_sizes[0])]['p50_ms']} ms @ batch {args.batch_sizes[0]}, "
+              f"RSS {report['rss_after_mb']} MB")
+
+    print(json.dumps(reports, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+
+import numpy as np
+
+from backends import BGR_TO_RGB_LAYER, DEFAULT_MODEL_PATHS
+
+# Exports the Keras model to the formats the other inference backends load.
+#
+#   python convert_model.py            # both TFLite and ONNX
+#   python convert_model.py --tflite
+#   python convert_model.py --onnx     # needs: pip install tf2onnx
+#   python convert_model.py --uint8 [--fold-bgr]
+#       a Keras variant taking uint8 pixels, with the divide by 255 (and,
+#       with --fold-bgr, the BGR->RGB swap) as its first layers; checked
+#       against the float model before it is written
+
+
+def export_tflite(model, path):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, path):
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        raise SystemExit("ONNX export needs tf2onnx: pip install tf2onnx")
+    spec = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input')]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=path)
+
+
+def build_uint8_model(model, fold_bgr=False):
+    import tensorflow as tf
+    shape = tuple(model.input_shape[1:])
+    inputs = tf.keras.Input(shape=shape, dtype='uint8', name='fundus_pair_bgr' if fold_bgr else 'fundus_pair')
+    x = tf.keras.layers.Rescaling(1.0 / 255, name='scale_to_unit')(inputs)
+    if fold_bgr:
+        # A fixed 1x1 convolution that only permutes channels: every output
+        # is one input times 1.0, so it is exact
+        channels = shape[-1]
+        swap = tf.keras.layers.Conv2D(channels, 1, use_bias=False, trainable=False, name=BGR_TO_RGB_LAYER)
+        x = swap(x)
+        kernel = np.zeros((1, 1, channels, channels), dtype=np.float32)
+        for eye in range(0, channels, 3):
+            for rgb, bgr in enumerate((2, 1, 0)):
+                kernel[0, 0, eye + bgr, eye + rgb] = 1.0
+        swap.set_weights([kernel])
+    return tf.keras.Model(inputs, model(x), name=f'{model.name}_uint8')
+
+
+def check_uint8_parity(model, uint8_model, fold_bgr, atol):
+    # The float path the service used so far against the uint8 path
+    from compare_backends import sample_pairs
+    from preprocessing import preprocess_pairs
+    pairs = sample_pairs(8)
+    expected = model.predict(preprocess_pairs(pairs), verbose=0)
+    actual = uint8_model.predict(
+        preprocess_pairs(pairs, dtype=np.uint8, channel_order='bgr' if fold_bgr else 'rgb'), verbose=0
+    )
+    max_diff = float(np.max(np.abs(expected - actual)))
+    agreement = float(np.mean(expected.argmax(1) == actual.argmax(1)))
+    print(f"{'✅' if max_diff <= atol else '❌'} uint8 parity: max prob diff {max_diff:.2e}, top-1 agreement {agreement:.0%}")
+    return max_diff <= atol
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Keras model to TFLite and/or ONNX")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATHS['keras'])
+    parser.add_argument('--tflite', action='store_true', help="Export to TFLite")
+    parser.add_argument('--onnx', action='store_true', help="Export to ONNX")
+    parser.add_argument('--tflite-path', default=DEFAULT_MODEL_PATHS['tflite'])
+    parser.add_argument('--onnx-path', default=DEFAULT_MODEL_PATHS['onnx'])
+    parser.add_argument('--uint8', action='store_true', help="Export the uint8-input Keras variant")
+    parser.add_argument('--fold-bgr', action='store_true', help="Also fold the BGR->RGB swap into the uint8 variant")
+    parser.add_argument('--uint8-path', default=DEFAULT_MODEL_PATHS['keras-uint8'])
+    parser.add_argument('--atol', type=float, default=1e-4, help="Max allowed probability difference of the uint8 variant")
+    args = parser.parse_args()
+    if not args.tflite and not args.onnx and not args.uint8:
+        args.tflite = args.onnx = True
+
+    from tensorflow.keras.models import load_model
+    model = load_model(args.model)
+
+    if args.tflite:
+        export_tflite(model, args.tflite_path)
+        print(f"✅ TFLite model written to {args.tflite_path} ({os.path.getsize(args.tflite_path) / 1e6:.1f} MB)")
+    if args.onnx:
+        export_onnx(model, args.onnx_path)
+        print(f"✅ ONNX model written to {args.onnx_path} ({os.path.getsize(args.onnx_path) / 1e6:.1f} MB)")
+    if args.uint8:
+        uint8_model = build_uint8_model(model, args.fold_bgr)
+        if not check_uint8_parity(model, uint8_model, args.fold_bgr, args.atol):
+            raise SystemExit(f"uint8 variant disagrees with the float model by more than {args.atol}; not written")
+        uint8_model.save(args.uint8_path)
+        print(f"✅ uint8 model written to {args.uint8_path}")
+
+
+if __name__ == '__main__':
+    main()
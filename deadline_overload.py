@@ -0,0 +1,120 @@
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from admission import AdmissionController, Rejected
+from batcher import MicroBatcher
+from pipeline import DeadlineExceeded, StagePool, deadline_after
+
+# Shows what request deadlines buy under overload, without a model or a
+# server: requests arrive at a fixed rate above capacity and go through the
+# same admission controller, preprocess pool and micro-batcher as /predict,
+# with sleeps standing in for decode/filter and the model (both release the
+# GIL, like OpenCV and TensorFlow). Each client gives up after --timeout-ms.
+# The run is done twice, without and with the deadline set to the client's
+# timeout, and the live throughput (answers that arrived in time) compared.
+# Admission control is off by default; with --max-concurrent it bounds the
+# queues too and the two mechanisms can be compared or combined.
+#
+#   python deadline_overload.py --rate 150 --duration 10
+#
+# Against a running server the same comparison is
+#   python load_test.py --concurrency 64 --timeout 1
+#   python load_test.py --concurrency 64 --timeout 1 --header 'X-Deadline-Ms: 1000'
+
+
+def simulate(args, use_deadlines):
+    def preprocess(_):
+        time.sleep(args.preprocess_ms / 1000.0)
+        return np.zeros(1, dtype=np.float32)
+
+    def model(batch):
+        time.sleep((args.model_ms + args.model_item_ms * len(batch)) / 1000.0)
+        return np.zeros((len(batch), 8), dtype=np.float32)
+
+    pool = StagePool('preprocess', workers=args.preprocess_workers, max_queue=32).start()
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=5, max_queue=64).start()
+    admission = AdmissionController(args.max_concurrent, args.max_queue, max_wait_seconds=10.0)
+    outcomes = []  # (status, latency_ms)
+    lock = threading.Lock()
+
+    def handle():
+        sent = time.monotonic()
+        deadline = deadline_after(args.timeout_ms) if use_deadlines else None
+        status = 200
+        try:
+            admission.acquire(deadline)
+        except Rejected:
+            status = 503
+        except DeadlineExceeded:
+            status = 504
+        if status == 200:
+            try:
+                left = pool.submit(preprocess, 'left', deadline=deadline)
+                right = pool.submit(preprocess, 'right', deadline=deadline)
+                left.result(), right.result()
+                batcher.submit(np.zeros(1, dtype=np.float32), deadline)
+            except DeadlineExceeded:
+                status = 504
+            finally:
+                admission.release(time.monotonic() - sent)
+        latency_ms = (time.monotonic() - sent) * 1000.0
+        with lock:
+            outcomes.append((status, latency_ms))
+
+    threads = []
+    started = time.monotonic()
+    for i in range(int(args.rate * args.duration)):
+        time.sleep(max(0.0, started + i / args.rate - time.monotonic()))
+        thread = threading.Thread(target=handle, daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    batcher.stop()
+
+    live = [ms for status, ms in outcomes if status == 200 and ms <= args.timeout_ms]
+    late = sum(1 for status, ms in outcomes if status == 200 and ms > args.timeout_ms)
+    inference = batcher.stats()
+    return {
+        "deadlines": use_deadlines,
+        "requests": len(outcomes),
+        "live": len(live),
+        "late_answers": late,  # work finished after the client had given up
+        "expired_504": sum(1 for status, _ in outcomes if status == 504),
+        "rejected_503": sum(1 for status, _ in outcomes if status == 503),
+        "live_throughput_rps": round(len(live) / elapsed, 2),
+        "live_p99_ms": round(float(np.percentile(live, 99)), 1) if live else None,
+        "model_items": inference["items"],
+        "expired": {"admission": admission.stats()["expired"], "preprocess": pool.stats()["expired"],
+                    "inference": inference["expired"]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare live throughput under overload with and without deadlines")
+    parser.add_argument('--rate', type=float, default=150.0, help="Requests per second offered")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--timeout-ms', type=float, default=500.0, help="Client timeout, also the deadline")
+    parser.add_argument('--preprocess-workers', type=int, default=2)
+    parser.add_argument('--preprocess-ms', type=float, default=10.0, help="Decode + filter time per eye")
+    parser.add_argument('--model-ms', type=float, default=15.0, help="Fixed model time per batch")
+    parser.add_argument('--model-item-ms', type=float, default=5.0, help="Model time per pair in a batch")
+    parser.add_argument('--max-concurrent', type=int, default=0, help="Admission control limit (0 = off)")
+    parser.add_argument('--max-queue', type=int, default=32)
+    args = parser.parse_args()
+
+    results = [simulate(args, use_deadlines) for use_deadlines in (False, True)]
+    for result in results:
+        print(json.dumps(result))
+    without, with_deadlines = (r["live_throughput_rps"] for r in results)
+    print(f"Live throughput: {without} rps without deadlines, {with_deadlines} rps with them")
+    print("✅ Deadlines improve live throughput" if with_deadlines > without else "❌ No improvement")
+
+
+if __name__ == '__main__':
+    main()
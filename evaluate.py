@@ -0,0 +1,180 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import numpy as np
+
+from backends import BACKENDS, DEFAULT_MODEL_PATHS, load_backend
+from labels import class_labels
+from model_metrics import DEFAULT_METRICS_PATH, file_sha256, write_model_metrics
+from preprocessing import PREPROCESS_MODES, preprocessing_fingerprint
+from score_dataset import batch_inputs, init_worker, locate_stored, prepare_input, prepared_batches, read_manifest
+from tensor_store import TensorStore
+from thread_settings import apply_tensorflow_threads, thread_settings_from_env
+
+# Measures the model on labeled data: accuracy, cross-entropy loss, a
+# confusion matrix over class_labels and throughput. The manifest is the one
+# score_dataset.py reads plus a label column (a class name from labels.py or
+# its index). Inputs are streamed through the model a batch at a time, so
+# memory stays flat however large the dataset is.
+#
+#   python evaluate.py labeled.csv
+#   python evaluate.py labeled.csv --backend tflite --tensor-store tensors/
+#
+# The result is written to model_metrics.json together with the SHA-256 of
+# the evaluated model file; the service reports its accuracy and loss in
+# /predict responses when it serves that same file.
+
+# Keras clips probabilities the same way in categorical cross-entropy
+EPSILON = 1e-7
+
+
+def parse_label(value):
+    if value in class_labels:
+        return class_labels.index(value)
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown label {value!r}")
+    if not 0 <= index < len(class_labels):
+        raise ValueError(f"Label index {index} out of range")
+    return index
+
+
+def prepare_labeled(task):
+    # Runs in a worker process: (row, label index, model input, error)
+    row, mode, reduced, input_format = task
+    try:
+        return row, parse_label(row["label"]), prepare_input(row, mode, reduced, *input_format), None
+    except Exception as e:
+        return row, None, None, str(e)
+
+
+def stored_labeled(row, key):
+    # (row, label index, store key, error) for a row read from the tensor store
+    try:
+        return row, parse_label(row["label"]), key, None
+    except ValueError as e:
+        return row, None, None, str(e)
+
+
+class Evaluation:
+    # Running totals, so nothing per sample has to be kept
+    def __init__(self):
+        self.confusion = np.zeros((len(class_labels), len(class_labels)), dtype=np.int64)
+        self.loss_sum = 0.0
+        self.errors = 0
+
+    def add(self, labels, probabilities):
+        labels = np.asarray(labels)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        true_probs = np.clip(probabilities[np.arange(len(labels)), labels], EPSILON, 1.0)
+        self.loss_sum += float(-np.log(true_probs).sum())
+        np.add.at(self.confusion, (labels, probabilities.argmax(axis=1)), 1)
+
+    def report(self):
+        samples = int(self.confusion.sum())
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        correct = np.diag(self.confusion)
+        return {
+            "samples": samples,
+            "errors": self.errors,
+            "accuracy": round(100.0 * correct.sum() / samples, 3) if samples else None,
+            "loss": round(self.loss_sum / samples, 5) if samples else None,
+            "per_class": {
+                label: {
+                    "support": int(support[i]),
+                    "recall": round(float(correct[i] / support[i]), 4) if support[i] else None,
+                    "precision": round(float(correct[i] / predicted[i]), 4) if predicted[i] else None,
+                }
+                for i, label in enumerate(class_labels)
+            },
+            # rows: true class, columns: predicted class, both in class_labels order
+            "confusion_matrix": {"labels": class_labels, "matrix": self.confusion.tolist()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the model on a labeled manifest")
+    parser.add_argument('manifest', help="CSV with left,right,label columns")
+    parser.add_argument('--backend', choices=BACKENDS, default='keras')
+    parser.add_argument('--model', help="Model file for the backend (default: its usual path)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Preprocessing processes")
+    parser.add_argument('--preprocess-mode', choices=PREPROCESS_MODES, default='exact')
+    parser.add_argument('--reduced-decode', action='store_true', help="Decode large JPEGs at reduced scale")
+    parser.add_argument('--tensor-store', help="Read already preprocessed pairs from this store")
+    parser.add_argument('--output', default=DEFAULT_METRICS_PATH, help="Metrics file the service loads")
+    args = parser.parse_args()
+
+    model_file = args.model or DEFAULT_MODEL_PATHS[args.backend]
+    rows = read_manifest(args.manifest)
+    evaluation = Evaluation()
+
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(max(1, args.workers), initializer=init_worker) as pool:
+        chunksize = max(1, args.batch_size // (4 * max(1, args.workers)))
+        store, stored = None, {}
+        if args.tensor_store:
+            # Stored pairs go from the mapping to the model in batches; only
+            # the missing ones are preprocessed on the pool
+            store = TensorStore(args.tensor_store)
+            fingerprint = preprocessing_fingerprint(args.preprocess_mode, args.reduced_decode)
+            stored = locate_stored(pool, store, fingerprint, rows, chunksize)
+            print(f"{len(stored)}/{len(rows)} pairs found in {args.tensor_store}")
+
+        if args.backend.startswith('keras'):
+            apply_tensorflow_threads(thread_settings_from_env())
+        backend = load_backend(args.backend, model_file)
+        input_format = (np.dtype(backend.input_dtype).name, backend.channel_order)
+        to_batch = partial(batch_inputs, store, fingerprint, input_format) if store is not None else np.stack
+        tasks = ((row, args.preprocess_mode, args.reduced_decode, input_format) for row in rows)
+
+        def is_stored(task):
+            return task[0]["index"] in stored
+
+        started, model_seconds = time.perf_counter(), 0.0
+        for chunk, results in prepared_batches(pool, prepare_labeled, tasks, args.batch_size, chunksize, is_stored):
+            prepared = [result if result is not None else stored_labeled(task[0], stored[task[0]["index"]])
+                        for task, result in zip(chunk, results)]
+            ready = [(label, inputs) for _, label, inputs, error in prepared if error is None]
+            for row, _, _, error in prepared:
+                if error:
+                    evaluation.errors += 1
+                    print(f"⚠️ Row {row['index']} ({row['id']}): {error}")
+            if ready:
+                batch = to_batch([inputs for _, inputs in ready])
+                model_started = time.perf_counter()
+                probabilities = backend.predict(batch)
+                model_seconds += time.perf_counter() - model_started
+                evaluation.add([label for label, _ in ready], probabilities)
+            done = int(evaluation.confusion.sum()) + evaluation.errors
+            print(f"{done}/{len(rows)} pairs ({done / (time.perf_counter() - started):.1f} pairs/s)")
+        elapsed = time.perf_counter() - started
+
+    report = evaluation.report()
+    if not report["samples"]:
+        raise SystemExit("No rows could be evaluated")
+    report.update({
+        "model": {"backend": args.backend, "path": model_file, "sha256": file_sha256(model_file)},
+        "dataset": {"manifest": os.path.abspath(args.manifest), "sha256": file_sha256(args.manifest), "rows": len(rows)},
+        "preprocess_mode": args.preprocess_mode,
+        "reduced_decode": args.reduced_decode,
+        "throughput": {
+            "seconds": round(elapsed, 2),
+            "pairs_per_second": round(report["samples"] / elapsed, 2),
+            "images_per_second": round(2 * report["samples"] / elapsed, 2),
+            "model_images_per_second": round(2 * report["samples"] / model_seconds, 2) if model_seconds else None,
+        },
+    })
+    report = write_model_metrics(args.output, report)
+    print(json.dumps({k: report[k] for k in ('samples', 'errors', 'accuracy', 'loss', 'throughput')}, indent=2))
+    print(f"✅ Metrics written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import gc
+import glob
+import os
+import tempfile
+
+from thread_settings import apply_cpu_affinity, load_tuned_settings, thread_settings_from_env
+
+# Production serving: `gunicorn app:app` picks this file up automatically.
+#
+# The master imports app.py (preload_app, so the library code is shared
+# copy-on-write) but never starts TensorFlow: its runtime is not fork-safe,
+# and a worker forked from a master that ran it can hang on its first op.
+# With LOAD_MODEL_AFTER_FORK=1 the import does no model work at all, so the
+# port is bound straight away; each worker downloads (one at a time, see
+# model_download_lock) and loads its own model in the background after fork
+# and reports ready on /readyz.
+#
+# Keras weights are therefore held once per worker. To have them resident
+# once per host, serve INFERENCE_BACKEND=tflite-shared: every worker maps
+# the same read-only TFLite file. measure_worker_memory.py compares the two.
+#
+#   WEB_CONCURRENCY   worker processes (default 2)
+#   GUNICORN_THREADS  request threads per worker (default: see below)
+#   JOB_STORE         'sqlite' by default here, so every worker sees every job
+#   KEEPALIVE_CONNECTIONS
+#                     idle keep-alive connections per worker (default 8, see below)
+#   METRICS_DIR       where workers share their metrics (default: a fresh
+#                     temporary directory per master)
+#
+# Each worker keeps its own metrics, and a scrape of /metrics is answered by
+# whichever worker accepts it; so the workers write their metrics to
+# METRICS_DIR and the answering one returns every worker's, labelled
+# worker="<pid>" (sum without (worker) for the whole service). A worker's
+# file is removed when it exits.
+#
+# Admission control (app.py, admission.py) can only turn away requests that
+# reach Flask, and a gthread worker hands a request to Flask only when one
+# of its threads is free; anything beyond that waits in gunicorn, unseen.
+# So each worker gets a thread for every request admission control lets in
+# (ADMISSION_MAX_CONCURRENT, default 8) or queues (ADMISSION_MAX_QUEUE,
+# default 16), plus SPARE_THREADS to answer the fast 503s, /readyz and
+# /metrics. Setting GUNICORN_THREADS below that makes the limits
+# unreachable.
+#
+# gthread keeps at most worker_connections - threads idle keep-alive
+# connections, so a worker accepts its threads' worth of connections plus
+# KEEPALIVE_CONNECTIONS (default 8) more, letting the proxy in front reuse
+# them. The price: a kept-alive connection that sends its next request
+# while every thread is busy waits in gunicorn, unseen by admission
+# control, so up to KEEPALIVE_CONNECTIONS requests per worker can queue
+# there. KEEPALIVE_CONNECTIONS=0 turns keep-alive off (a new connection per
+# request) and closes that gap.
+#
+# TensorFlow / OpenCV thread pools are split across the workers so
+# workers x threads-per-worker does not exceed the core count; set
+# TF_NUM_INTRAOP_THREADS, TF_NUM_INTEROP_THREADS or OPENCV_NUM_THREADS
+# explicitly to override. When tune_threads.py has written
+# thread_settings.json for this host, its worker count, thread-pool sizes
+# and CPU affinity are used instead of these defaults (the environment
+# still wins).
+#
+# Throughput against the old `python app.py` development server, measured
+# with load_test.py --concurrency 16 --duration 20:
+#
+#   server                          rps    p50 ms   p99 ms
+#   python app.py                   5.59    2813     3112
+#   gunicorn, 1 worker              5.73    2703     3158
+#   gunicorn, 2 workers             5.39    2761     4546
+#
+# These are from a 1-core x86_64 host (Flask 3.1, gunicorn 26.2, OpenCV
+# 5.0) that had no TensorFlow and no model download, so a numpy stand-in
+# with the model's input/output shapes replaced the Keras model and the
+# numbers are decode + preprocessing + serving only. With a single core
+# more workers can only share it, hence no gain; repeat the runs with the
+# real model on the deployment host before relying on the worker count:
+#
+#   python app.py &                 python load_test.py --concurrency 16
+#   gunicorn app:app &              python load_test.py --concurrency 16
+
+SPARE_THREADS = 4
+KEEPALIVE_CONNECTIONS = int(os.environ.get('KEEPALIVE_CONNECTIONS', 8))
+
+tuned = load_tuned_settings()
+workers = int(os.environ.get('WEB_CONCURRENCY') or tuned.get('workers') or 2)
+admission_concurrent = int(os.environ.setdefault('ADMISSION_MAX_CONCURRENT', str(tuned.get('threads') or 8)))
+admission_queue = int(os.environ.setdefault('ADMISSION_MAX_QUEUE', '16'))
+admission_threads = admission_concurrent + admission_queue + SPARE_THREADS if admission_concurrent > 0 else 4
+threads = int(os.environ.get('GUNICORN_THREADS') or admission_threads)
+if threads < admission_threads:
+    print(f"⚠️ GUNICORN_THREADS={threads} is below ADMISSION_MAX_CONCURRENT + ADMISSION_MAX_QUEUE + "
+          f"{SPARE_THREADS}; requests will queue inside gunicorn instead of being turned away")
+worker_class = 'gthread'
+worker_connections = threads + KEEPALIVE_CONNECTIONS
+if KEEPALIVE_CONNECTIONS <= 0:
+    keepalive = 0
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+preload_app = True
+timeout = 120
+
+cores_per_worker = max(1, (os.cpu_count() or 1) // workers)
+os.environ['LOAD_MODEL_AFTER_FORK'] = '1'
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(tuned.get('tf_intra_op') or cores_per_worker))
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', str(tuned.get('tf_inter_op') or 1))
+os.environ.setdefault('OMP_NUM_THREADS', os.environ['TF_NUM_INTRAOP_THREADS'])
+os.environ.setdefault('OPENCV_NUM_THREADS', str(tuned.get('opencv', cores_per_worker)))
+
+# Jobs must be visible to every worker: GET /jobs/<id> can reach a different
+# worker than the POST that created the job
+if workers > 1 and os.environ.setdefault('JOB_STORE', 'sqlite') != 'sqlite':
+    print(f"⚠️ JOB_STORE={os.environ['JOB_STORE']} is per worker; with {workers} workers "
+          "GET /jobs/<id> will often not find the job")
+
+
+# Cleared by the master, so metrics of workers from an earlier run never show
+metrics_dir = os.environ.get('METRICS_DIR')
+owns_metrics_dir = not metrics_dir
+if owns_metrics_dir:
+    metrics_dir = os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='retina-metrics-')
+os.makedirs(metrics_dir, exist_ok=True)
+
+
+def remove_worker_metrics():
+    for path in glob.glob(os.path.join(metrics_dir, '*.json*')):
+        os.remove(path)
+
+
+remove_worker_metrics()
+
+
+def on_exit(server):
+    remove_worker_metrics()
+    if owns_metrics_dir:
+        os.rmdir(metrics_dir)
+
+
+def child_exit(server, worker):
+    try:
+        os.remove(os.path.join(metrics_dir, f'{worker.pid}.json'))
+    except FileNotFoundError:
+        pass
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from touching (and so copying) every
+    # object the master imported
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # worker.age counts every worker spawned, so a replacement worker takes
+    # over the cores of the one it replaced only approximately
+    cores = apply_cpu_affinity(thread_settings_from_env(), worker.age - 1, workers)
+    if cores:
+        server.log.info("Worker %s pinned to cores %s", worker.pid, cores)
+    import app
+    app.start_worker()
@@ -0,0 +1,291 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Asynchronous prediction jobs: POST /jobs stores the uploaded pair and
+# returns an id straight away, a bounded pool of worker threads runs the
+# prediction, and GET /jobs/<id> reads the status or result back from a job
+# store. Finished jobs are dropped once they are older than the retention
+# period.
+#
+# Stores share one small interface (create / claim / finish / get / pending /
+# purge). MemoryJobStore is the default; SQLiteJobStore keeps jobs, and the
+# inputs of unfinished ones, on disk so they survive a restart and can be
+# shared by several worker processes on one host.
+#
+# A job left running by a process that died is resumed by the next process
+# that starts. Processes are told apart by a boot id, a uuid drawn per
+# process, rather than by pid: after a container restart the old pids are
+# usually handed out again, to the new workers.
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_boot = (None, None)  # (pid, boot id); drawn again in a forked child
+
+
+def boot_id():
+    global _boot
+    if _boot[0] != os.getpid():
+        _boot = (os.getpid(), uuid.uuid4().hex)
+    return _boot[1]
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _public(job):
+    return {k: job[k] for k in ('id', 'status', 'created_at', 'started_at', 'finished_at', 'result', 'error')}
+
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, left, right, age):
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id, "status": QUEUED, "created_at": time.time(), "started_at": None,
+                "finished_at": None, "result": None, "error": None,
+                "inputs": (left, right, age),
+            }
+
+    def claim(self, job_id):
+        # Marks a queued job as running; returns its inputs, or None if
+        # another worker already took it
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return None
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            return job["inputs"]
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=FAILED if error else DONE, finished_at=time.time(),
+                           result=result, error=error, inputs=None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return _public(job) if job else None
+
+    def pending(self):
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items() if job["status"] == QUEUED]
+
+    def purge(self, finished_before):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] < finished_before]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+
+class SQLiteJobStore:
+    def __init__(self, path='jobs.sqlite3'):
+        self.path = path
+        self._local = threading.local()
+        self._registered = None  # boot id this process registered under
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker_pid INTEGER,
+                    worker_boot TEXT,
+                    result TEXT,
+                    error TEXT,
+                    left_image BLOB,
+                    right_image BLOB,
+                    age INTEGER
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at)")
+            if 'worker_boot' not in {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN worker_boot TEXT")
+            # The process each pid last belonged to
+            db.execute("CREATE TABLE IF NOT EXISTS workers (pid INTEGER PRIMARY KEY, boot_id TEXT NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread (and process: a connection must not be
+        # used across a fork); WAL lets readers and the writer overlap
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.row_factory = sqlite3.Row
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _register(self, db):
+        # Claims this pid for this process, before it claims or resumes jobs
+        if self._registered != boot_id():
+            db.execute("INSERT OR REPLACE INTO workers (pid, boot_id) VALUES (?, ?)", (os.getpid(), boot_id()))
+            self._registered = boot_id()
+
+    def create(self, job_id, left, right, age):
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, created_at, left_image, right_image, age) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, time.time(), left, right, age),
+        )
+
+    def claim(self, job_id):
+        db = self._connect()
+        self._register(db)
+        claimed = db.execute(
+            "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ?, worker_boot = ? WHERE id = ? AND status = ?",
+            (RUNNING, time.time(), os.getpid(), boot_id(), job_id, QUEUED),
+        ).rowcount
+        if not claimed:
+            return None
+        row = db.execute("SELECT left_image, right_image, age FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["left_image"], row["right_image"], row["age"]
+
+    def finish(self, job_id, result=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, "
+            "left_image = NULL, right_image = NULL WHERE id = ?",
+            (FAILED if error else DONE, time.time(), json.dumps(result) if result is not None else None, error, job_id),
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, status, created_at, started_at, finished_at, result, error FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def pending(self):
+        # Queued jobs, plus running ones whose process died (e.g. a restart)
+        db = self._connect()
+        self._register(db)
+        owners = {row["pid"]: row["boot_id"] for row in db.execute("SELECT pid, boot_id FROM workers")}
+        running = db.execute("SELECT id, worker_pid, worker_boot FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        for row in running:
+            if not _worker_alive(row["worker_pid"], row["worker_boot"], owners):
+                db.execute("UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (QUEUED, row["id"], RUNNING))
+        return [row["id"] for row in db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+
+    def purge(self, finished_before):
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before,)
+        ).rowcount
+
+
+def _worker_alive(pid, boot, owners):
+    # The process that claimed a job is alive if its pid is, and that pid
+    # has not been registered by a newer process since
+    if not boot:
+        return False  # claimed before boot ids were recorded
+    if boot == boot_id():
+        return True
+    return pid != os.getpid() and owners.get(pid) == boot and _pid_alive(pid)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    def __init__(self, store, process, max_workers=2, max_queued=100, retention_seconds=3600):
+        self.store = store
+        self.process = process  # (left_bytes, right_bytes, age) -> JSON-serializable result
+        self.max_workers = max(1, int(max_workers))
+        self.max_queued = int(max_queued)
+        self.retention_seconds = float(retention_seconds)
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._last_purge = 0.0
+
+    def _pool(self):
+        # Created lazily so a pool made before a fork is never reused after it
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+            return self._executor
+
+    def submit(self, left, right, age):
+        with self._lock:
+            if self._outstanding >= self.max_queued:
+                raise QueueFull(f"{self._outstanding} jobs already waiting")
+            self._outstanding += 1
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, left, right, age)
+            self._pool().submit(self._run, job_id)
+        except Exception:
+            with self._lock:
+                self._outstanding -= 1
+            raise
+        self.purge()
+        return job_id
+
+    def resume(self):
+        # Re-queue jobs a previous process accepted but never finished
+        job_ids = self.store.pending()
+        with self._lock:
+            self._outstanding += len(job_ids)
+        for job_id in job_ids:
+            self._pool().submit(self._run, job_id)
+        return len(job_ids)
+
+    def get(self, job_id):
+        self.purge()
+        return self.store.get(job_id)
+
+    def purge(self):
+        now = time.time()
+        if now - self._last_purge < min(60.0, self.retention_seconds):
+            return
+        self._last_purge = now
+        self.store.purge(now - self.retention_seconds)
+
+    def _run(self, job_id):
+        try:
+            inputs = self.store.claim(job_id)
+            if inputs is None:
+                return
+            try:
+                self.store.finish(job_id, result=self.process(*inputs))
+            except Exception as e:
+                print("🔥 Job error:", str(e))
+                self.store.finish(job_id, error=str(e))
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "store": type(self.store).__name__,
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "outstanding": self._outstanding,
+                "retention_seconds": self.retention_seconds,
+            }
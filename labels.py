@@ -0,0 +1,11 @@
+# Class labels
+class_labels = [
+    'Normal Retina',
+    'Diabetic Retinopathy',
+    'Glaucoma',
+    'Cataract',
+    'Age-related Macular Degeneration',
+    'Hypertensive Retinopathy',
+    'Pathological Myopia',
+    'Other Abnormalities'
+]
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+
+# Closed-loop load generator for /predict: --concurrency clients each send
+# requests back to back for --duration seconds using the bundled eye images.
+# Every request gets a few random bytes appended after the JPEG end marker,
+# which decoders ignore, so the prediction cache does not turn the run into
+# a cache benchmark (pass --same-images to measure cache hits instead).
+#
+#   python load_test.py --url http://127.0.0.1:5000 --concurrency 16 --duration 30
+
+
+def multipart_body(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def client(url, left, right, same_images, stop_at, results, timeout, headers):
+    while time.perf_counter() < stop_at:
+        suffix = b'' if same_images else os.urandom(16)
+        body, content_type = multipart_body(
+            {"age": "55"}, {"left_eye": ("left.jpg", left + suffix), "right_eye": ("right.jpg", right + suffix)}
+        )
+        request = urllib.request.Request(url, data=body, headers=dict(headers, **{"Content-Type": content_type}))
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except Exception:
+            status = 0
+        results.append((status, (time.perf_counter() - start) * 1000.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /predict throughput and latency under concurrent load")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--same-images', action='store_true', help="Send identical bytes every time")
+    parser.add_argument('--header', action='append', default=[], help="Extra request header, e.g. 'X-Deadline-Ms: 500'")
+    parser.add_argument('--output', help="Append the summary as a JSON line to this file")
+    args = parser.parse_args()
+
+    with open('static/uploads/left.jpg', 'rb') as f:
+        left = f.read()
+    with open('static/uploads/right.jpg', 'rb') as f:
+        right = f.read()
+    headers = dict(h.split(':', 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+
+    results = []
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.url.rstrip('/') + '/predict', left, right,
+                                              args.same_images, stop_at, results, args.timeout, headers))
+        for _ in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ok = [ms for status, ms in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    summary = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 2),
+        "requests": len(results),
+        "statuses": statuses,
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(ok, 50)), 1) if ok else None,
+        "p95_ms": round(float(np.percentile(ok, 95)), 1) if ok else None,
+        "p99_ms": round(float(np.percentile(ok, 99)), 1) if ok else None,
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from backends import BACKENDS, DEFAULT_MODEL_PATHS, load_backend
+
+# Per-worker memory with several worker processes holding the model at the
+# same time, the way gunicorn runs them. RSS counts shared pages in full in
+# every process; PSS splits them between the processes that map them, so the
+# sum of PSS is what the host actually pays. A baseline run (workers that
+# import the same libraries but load no model) is subtracted to isolate the
+# model itself.
+#
+#   python measure_worker_memory.py --workers 4 --backends keras tflite tflite-shared
+#   python measure_worker_memory.py --backends tflite --tflite-buckets 1 1,8 1,2,4,8
+#
+# TFLite backends keep one interpreter per batch-size bucket (backends.py);
+# each bucket set in --tflite-buckets is measured separately, and every
+# bucket is run once so its arena and packed weights are resident.
+#
+# Linux only: reads /proc/<pid>/smaps_rollup.
+
+
+def memory_mb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024.0
+    return {
+        "rss_mb": fields.get('Rss', 0.0),
+        "pss_mb": fields.get('Pss', 0.0),
+        "shared_mb": fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        "private_mb": fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def worker(name, path, options, ready, release):
+    try:
+        if name == 'baseline':
+            import tensorflow  # noqa: F401  same imports as a real worker, no model
+        else:
+            backend = load_backend(name, path, **options)
+            for size in getattr(backend, 'buckets', [1]):  # touch every weight once
+                backend.predict(np.zeros((size, 224, 224, 6), dtype=np.float32))
+        ready.put((os.getpid(), None))
+    except Exception as e:
+        ready.put((os.getpid(), str(e)))
+    release.wait()
+
+
+def measure(name, path, workers, options=None):
+    ctx = multiprocessing.get_context('spawn')
+    ready, release = ctx.Queue(), ctx.Event()
+    processes = [ctx.Process(target=worker, args=(name, path, options or {}, ready, release)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        reports = [ready.get() for _ in processes]
+        errors = [error for _, error in reports if error]
+        if errors:
+            return {"backend": name, "error": errors[0]}
+        # Every worker is alive and holding its model while this is read
+        per_worker = [memory_mb(pid) for pid, _ in reports]
+    finally:
+        release.set()
+        for process in processes:
+            process.join()
+
+    summary = {"backend": name, "workers": workers, **(options or {})}
+    for key in ('rss_mb', 'pss_mb', 'shared_mb', 'private_mb'):
+        summary[key] = round(float(np.mean([m[key] for m in per_worker])), 1)
+    summary["host_total_mb"] = round(sum(m['pss_mb'] for m in per_worker), 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-worker memory of each inference backend")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['keras', 'tflite', 'tflite-shared'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tflite-buckets', nargs='+', default=['1,8'],
+                        help="Batch-size bucket sets to measure the TFLite backends with, e.g. 1 1,8 1,2,4,8")
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    baseline = measure('baseline', None, args.workers)
+    if "error" in baseline:
+        raise SystemExit(f"Baseline workers failed to start: {baseline['error']}")
+    reports = [baseline]
+    runs = []
+    for name in args.backends:
+        if name.startswith('tflite'):
+            runs.extend((name, {"buckets": [int(b) for b in buckets.split(',')]}) for buckets in args.tflite_buckets)
+        else:
+            runs.append((name, {}))
+    for name, options in runs:
+        report = measure(name, DEFAULT_MODEL_PATHS[name], args.workers, options)
+        reports.append(report)
+        if options:
+            name = f"{name} (buckets {','.join(map(str, options['buckets']))})"
+        if "error" in report:
+            print(f"❌ {name}: {report['error']}")
+            continue
+        # What the model adds on top of an idle worker, per worker and for the whole host
+        report["model_rss_mb"] = round(report["rss_mb"] - baseline["rss_mb"], 1)
+        report["model_pss_mb"] = round(report["pss_mb"] - baseline["pss_mb"], 1)
+        report["model_host_total_mb"] = round(report["host_total_mb"] - baseline["host_total_mb"], 1)
+        print(f"{name}: {report['model_rss_mb']} MB RSS per worker, "
+              f"{report['model_pss_mb']} MB PSS per worker, "
+              f"{report['model_host_total_mb']} MB for {args.workers} workers")
+
+    print(json.dumps(reports, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus-style metrics: counters, gauges and histograms with
+# labels, rendered in the text exposition format by Registry.render(). Each
+# update is a dict lookup plus a few additions under a per-metric lock, cheap
+# enough to leave on for every request.
+#
+# Under gunicorn every worker process has its own Registry, and a scrape of
+# /metrics reaches whichever worker accepts it. Each worker therefore writes
+# its snapshot() to a directory shared by the workers (write_snapshot), and
+# the worker answering the scrape renders all of them (render_snapshots),
+# every sample labelled with the worker it came from; sum without (worker)
+# gives the service-wide series.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, extra=()):
+        return self._header() + self._render_samples(extra)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def _render_samples(self, extra=()):
+        lines = []
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value, extra))
+        return lines
+
+    def _render_sample(self, key, value, extra=()):
+        return [f"{self.name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}"]
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"name": self.name, "kind": self.kind, "documentation": self.documentation,
+                "labelnames": list(self.labelnames), "values": values}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        metric = cls(snapshot["name"], snapshot["documentation"], snapshot["labelnames"])
+        metric._values = {tuple(key): value for key, value in snapshot["values"]}
+        return metric
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value, extra=()):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = ('le', _format_value(float(bound)))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, (*extra, le))} {cumulative}")
+        labels = _format_labels(self.labelnames, key, extra)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        metric = cls(snapshot["name"], snapshot["documentation"], snapshot["labelnames"], snapshot["buckets"])
+        metric._values = {tuple(key): value for key, value in snapshot["values"]}
+        return metric
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return [metric.snapshot() for metric in self._metrics]
+
+
+METRIC_KINDS = {cls.kind: cls for cls in (Counter, Gauge, Histogram)}
+
+
+def write_snapshot(registry, directory, worker):
+    # Atomically, so a scrape never reads a half-written file
+    path = os.path.join(directory, f'{worker}.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def read_snapshots(directory):
+    snapshots = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                snapshots[os.path.basename(path)[:-len('.json')]] = json.load(f)
+        except (OSError, ValueError):
+            continue  # the worker exited and its file was removed
+    return snapshots
+
+
+def render_snapshots(snapshots):
+    # One HELP/TYPE header per metric, then every worker's samples with a
+    # worker label
+    metrics = {}
+    for worker, snapshot in sorted(snapshots.items()):
+        for state in snapshot:
+            metric = METRIC_KINDS[state["kind"]].from_snapshot(state)
+            metrics.setdefault(metric.name, []).append((worker, metric))
+    lines = []
+    for per_worker in metrics.values():
+        lines.extend(per_worker[0][1]._header())
+        for worker, metric in per_worker:
+            lines.extend(metric._render_samples((('worker', worker),)))
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
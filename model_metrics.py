@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+import time
+
+# Measured model quality, written by evaluate.py and reported by /predict.
+# The file is tied to the exact model file it was measured on (by SHA-256),
+# so a metrics file left over from another model version is ignored rather
+# than reported.
+
+SCHEMA_VERSION = 1
+DEFAULT_METRICS_PATH = 'model_metrics.json'
+
+# What /predict reported before any evaluation had been run
+LEGACY_METRICS = {"accuracy": 84.511, "loss": 0.14328, "source": "legacy-constants"}
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_model_metrics(path, metrics):
+    metrics = dict(metrics, schema_version=SCHEMA_VERSION, written_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    with open(path + '.tmp', 'w') as f:
+        json.dump(metrics, f, indent=2)
+    os.replace(path + '.tmp', path)
+    return metrics
+
+
+def load_model_metrics(path, model_file):
+    # The accuracy / loss to report for model_file, or LEGACY_METRICS if
+    # there is no usable metrics file for it
+    if not os.path.exists(path):
+        return dict(LEGACY_METRICS)
+    try:
+        with open(path) as f:
+            metrics = json.load(f)
+        if metrics.get("schema_version") != SCHEMA_VERSION:
+            raise ValueError(f"unsupported schema_version {metrics.get('schema_version')!r}")
+        if os.path.exists(model_file) and metrics["model"]["sha256"] != file_sha256(model_file):
+            raise ValueError(f"measured on a different model file than {model_file}")
+        return {
+            "accuracy": metrics["accuracy"],
+            "loss": metrics["loss"],
+            "source": path,
+            "evaluated_at": metrics.get("written_at"),
+            "dataset": metrics.get("dataset", {}).get("manifest"),
+            "samples": metrics.get("samples"),
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ Ignoring {path}: {e}")
+        return dict(LEGACY_METRICS)
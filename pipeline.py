@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# A fixed pool of worker threads fed by a bounded queue: one stage of the
+# request pipeline (decode + preprocess here, inference in MicroBatcher).
+# submit() blocks while the queue is full, so a slow later stage pushes back
+# on the request threads instead of letting work pile up in memory. OpenCV
+# releases the GIL, so preprocessing threads really run in parallel.
+#
+# Work can carry a deadline (a time.monotonic() timestamp, None for none).
+# Each stage checks it before starting the work, so a request whose client
+# has already given up is dropped at the next stage boundary instead of
+# being decoded, filtered and run through the model for nobody.
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage):
+        super().__init__(f"deadline exceeded before {stage}")
+        self.stage = stage
+
+
+def deadline_after(ms):
+    # Deadline ms milliseconds from now; None (no deadline) for ms <= 0
+    return time.monotonic() + ms / 1000.0 if ms and ms > 0 else None
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check_deadline(deadline, stage):
+    if expired(deadline):
+        raise DeadlineExceeded(stage)
+
+
+class StagePool:
+    def __init__(self, name, workers=4, max_queue=32):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+
+        self._queue = queue.Queue(self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self._started_at = None
+        self._tasks = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._blocked_submits = 0
+        self._expired = 0
+
+    def start(self):
+        # Safe to call again, e.g. after a fork (threads do not survive it)
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'{self.name}-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self._started_at is None:
+                self._started_at = time.perf_counter()
+        return self
+
+    def submit(self, fn, *args, deadline=None):
+        if not self._threads:
+            self.start()
+        future = Future()
+        task = (future, fn, args, time.perf_counter(), deadline)
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            with self._lock:
+                self._blocked_submits += 1
+            try:
+                self._queue.put(task, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                self._count_expired()
+                raise DeadlineExceeded(self.name)
+        return future
+
+    def _count_expired(self):
+        with self._lock:
+            self._expired += 1
+
+    def map(self, fn, *iterables):
+        # Runs fn over the arguments concurrently and returns the results in order
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [f.result() for f in futures]
+
+    def _run(self):
+        while True:
+            future, fn, args, enqueued_at, deadline = self._queue.get()
+            started = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                if expired(deadline):
+                    self._count_expired()
+                    future.set_exception(DeadlineExceeded(self.name))
+                else:
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finished = time.perf_counter()
+            with self._lock:
+                self._tasks += 1
+                self._wait_seconds += started - enqueued_at
+                self._busy_seconds += finished - started
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "tasks": self._tasks,
+                "blocked_submits": self._blocked_submits,
+                "expired": self._expired,
+                "mean_queue_wait_ms": round(self._wait_seconds * 1000.0 / self._tasks, 3) if self._tasks else 0.0,
+                "utilization": round(self._busy_seconds / (elapsed * self.workers), 4) if elapsed else 0.0,
+            }
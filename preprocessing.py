@@ -0,0 +1,156 @@
+import functools
+import hashlib
+import inspect
+import json
+
+import cv2
+import numpy as np
+
+IMAGE_SIZE = 224
+
+# 'exact' is the original pipeline: blur at full resolution, then resize.
+# 'resize_first' shrinks to RESIZE_FIRST_FACTOR x the target size with
+# INTER_AREA before the blurs, so the filters run on a few hundred pixels
+# per side instead of the full fundus photo, then resizes to the target.
+PREPROCESS_MODES = ('exact', 'resize_first')
+RESIZE_FIRST_FACTOR = 2
+
+# Reduced decoding: libjpeg can decode a JPEG at 1/2, 1/4 or 1/8 scale in the
+# DCT domain, which is much faster and allocates a fraction of the memory of
+# a full decode. decode_bytes() reads the frame size from the JPEG header and
+# picks the largest reduction that still leaves at least REDUCED_DECODE_MIN_SIDE
+# pixels on the short side, i.e. what 'resize_first' would shrink to anyway.
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+REDUCED_DECODE_MIN_SIDE = IMAGE_SIZE * RESIZE_FIRST_FACTOR
+
+# Start-of-frame markers carry the image size; C4 (DHT), C8 (JPG) and CC
+# (DAC) share the range but are not frames
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data):
+    # (width, height) from a JPEG header without decoding it, or None if the
+    # bytes are not a JPEG
+    data = memoryview(data)
+    if bytes(data[:2]) != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+def decode_reduction(data, min_side=REDUCED_DECODE_MIN_SIDE):
+    # Largest DCT-domain reduction (8, 4, 2) that keeps the short side at
+    # least min_side pixels, or 1 for a full decode
+    size = jpeg_size(data)
+    if size is None:
+        return 1
+    short_side = min(size)
+    return next((r for r in REDUCED_DECODE_FLAGS if short_side // r >= min_side), 1)
+
+
+def decode_bytes(data, reduced=False):
+    # Decode image bytes to a BGR array (None if they cannot be decoded)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not buf.size:
+        return None
+    reduction = decode_reduction(buf) if reduced else 1
+    return cv2.imdecode(buf, REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR))
+
+
+# Model input formats. The float32 path normalizes to [0, 1] here; uint8
+# outputs get the filtered [0, 255] pixels and a model variant with the
+# scaling built into its input layers (convert_model.py --uint8) does the
+# rest, so requests carry a quarter of the bytes. With channel order 'bgr'
+# the BGR->RGB swap is left to the model as well.
+CHANNEL_ORDERS = ('rgb', 'bgr')
+
+
+def _filter_and_resize(img, mode, channel_order='rgb'):
+    if mode == 'resize_first':
+        side = IMAGE_SIZE * RESIZE_FIRST_FACTOR
+        if img.shape[0] > side and img.shape[1] > side:
+            img = cv2.resize(img, (side, side), interpolation=cv2.INTER_AREA)
+    elif mode != 'exact':
+        raise ValueError(f"Unknown preprocessing mode '{mode}', expected one of {PREPROCESS_MODES}")
+
+    img = cv2.medianBlur(img, 5)
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    if channel_order == 'rgb':
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif channel_order != 'bgr':
+        raise ValueError(f"Unknown channel order '{channel_order}', expected one of {CHANNEL_ORDERS}")
+    return cv2.resize(img, (IMAGE_SIZE, IMAGE_SIZE))
+
+
+def filter_and_resize_into(img, out, mode='exact', channel_order='rgb'):
+    # The uint8 (224, 224, 3) image before normalization; the float32
+    # preprocess_into() is exactly this divided by 255, so it can be stored
+    # losslessly
+    out[...] = _filter_and_resize(img, mode, channel_order)
+    return out
+
+
+@functools.lru_cache()
+def preprocessing_fingerprint(mode='exact', reduced_decode=False):
+    # Changes whenever anything that shapes the preprocessed tensor does (the
+    # settings, the filter code, the OpenCV build), so tensors stored under
+    # older settings can be recognised as stale
+    settings = {
+        "mode": mode,
+        "reduced_decode": bool(reduced_decode),
+        "image_size": IMAGE_SIZE,
+        "resize_first_factor": RESIZE_FIRST_FACTOR,
+        "reduced_decode_min_side": REDUCED_DECODE_MIN_SIDE,
+        "opencv": cv2.__version__,
+    }
+    source = inspect.getsource(_filter_and_resize) + inspect.getsource(decode_reduction)
+    return hashlib.sha256((json.dumps(settings, sort_keys=True) + source).encode()).hexdigest()[:16]
+
+
+def preprocess_into(img, out, mode='exact', channel_order='rgb'):
+    # Preprocess one decoded BGR image into a preallocated (224, 224, 3)
+    # view, e.g. one eye's half of a (224, 224, 6) model input. float32
+    # views are normalized to [0, 1], uint8 views get the raw pixels
+    if out.dtype == np.uint8:
+        return filter_and_resize_into(img, out, mode, channel_order)
+    np.divide(_filter_and_resize(img, mode, channel_order), np.float32(255.0), out=out)
+    return out
+
+
+def preprocess_batch(images, mode='exact', out=None):
+    # Preprocess N decoded images into one stacked (N, 224, 224, 3) array
+    if out is None:
+        out = np.empty((len(images), IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.float32)
+    for i, img in enumerate(images):
+        preprocess_into(img, out[i], mode)
+    return out
+
+
+def preprocess_pairs(pairs, mode='exact', out=None, dtype=np.float32, channel_order='rgb'):
+    # Preprocess N (left, right) pairs straight into a (N, 224, 224, 6)
+    # model input: left eye in channels 0-2, right eye in channels 3-5
+    if out is None:
+        out = np.empty((len(pairs), IMAGE_SIZE, IMAGE_SIZE, 6), dtype=dtype)
+    for i, (left, right) in enumerate(pairs):
+        preprocess_into(left, out[i, ..., :3], mode, channel_order)
+        preprocess_into(right, out[i, ..., 3:], mode, channel_order)
+    return out
@@ -0,0 +1,159 @@
+import argparse
+import glob
+import json
+import os
+
+import cv2
+import numpy as np
+
+from backends import DEFAULT_MODEL_PATHS
+from compare_backends import run_isolated, sample_inputs
+from labels import class_labels
+from preprocessing import IMAGE_SIZE, preprocess_pairs
+
+# Post-training quantization of the Keras model to TFLite, plus a report on
+# how each quantized variant compares with the float model.
+#
+#   python quantize_model.py --dynamic                     # dynamic-range (int8 weights)
+#   python quantize_model.py --int8 --calibration-dir imgs # full int8, calibrated on imgs
+#   python quantize_model.py --report-only --eval-dir imgs
+#
+# The variants of --model <name>.h5 are written to and read from
+# <name>_dynamic.tflite, <name>_int8.tflite and (from convert_model.py)
+# <name>.tflite next to it, the default paths for the default model.
+# Serve a variant with INFERENCE_BACKEND=tflite-dynamic or tflite-int8
+# (and MODEL_BACKEND_PATH for a non-default model).
+
+
+def load_inputs(directory, limit=None):
+    # Consecutive images in the directory are paired up as (left, right).
+    # Only the first `limit` pairs are read, each preprocessed straight into
+    # the (N, 224, 224, 6) model input as it is decoded; pairs with an
+    # unreadable image are skipped.
+    paths = sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(directory, f'*.{ext}')))
+    pairs = list(zip(paths[0::2], paths[1::2]))[:limit]
+    inputs = np.empty((len(pairs), IMAGE_SIZE, IMAGE_SIZE, 6), dtype=np.float32)
+    count = 0
+    for left_path, right_path in pairs:
+        left, right = cv2.imread(left_path), cv2.imread(right_path)
+        if left is None or right is None:
+            print(f"⚠️ Skipping unreadable pair {left_path}, {right_path}")
+            continue
+        preprocess_pairs([(left, right)], out=inputs[count:count + 1])
+        count += 1
+    return inputs[:count]
+
+
+def variant_paths(model_path):
+    stem = os.path.splitext(model_path)[0]
+    return {
+        'keras': model_path,
+        'tflite': f'{stem}.tflite',
+        'tflite-dynamic': f'{stem}_dynamic.tflite',
+        'tflite-int8': f'{stem}_int8.tflite',
+    }
+
+
+def representative_dataset(inputs):
+    def generate():
+        for i in range(len(inputs)):
+            yield [inputs[i:i + 1]]
+    return generate
+
+
+def quantize(model, mode, path, calibration_inputs=None):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        converter.representative_dataset = representative_dataset(calibration_inputs)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"✅ {mode} model written to {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def report(paths, inputs, repeats):
+    # paths: variant name -> model file, the 'keras' one being the reference
+    runs = {name: run_isolated(name, path, inputs, [1], repeats) for name, path in paths.items()}
+    if "error" in runs['keras']:
+        raise SystemExit(f"Keras reference failed to run: {runs['keras']['error']}")
+    expected = np.array(runs['keras']["probabilities"])
+    expected_top1 = expected.argmax(1)
+
+    rows = []
+    for name, run in runs.items():
+        row = {"variant": name, "size_mb": round(os.path.getsize(paths[name]) / 1e6, 2)}
+        if "error" in run:
+            row["error"] = run["error"]
+            rows.append(row)
+            continue
+
+        actual = np.array(run["probabilities"])
+        agree = actual.argmax(1) == expected_top1
+        row.update({
+            "top1_agreement": round(float(agree.mean()), 4),
+            "top1_agreement_by_class": {
+                class_labels[c]: round(float(agree[expected_top1 == c].mean()), 4)
+                for c in np.unique(expected_top1)
+            },
+            "max_prob_diff": round(float(np.max(np.abs(actual - expected))), 5),
+            "mean_prob_diff": round(float(np.mean(np.abs(actual - expected))), 5),
+            "latency_ms": run["latency"]["1"]["p50_ms"],
+            "rss_mb": run["rss_after_mb"],
+        })
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-training quantization and accuracy/latency report")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATHS['keras'])
+    parser.add_argument('--dynamic', action='store_true', help="Export a dynamic-range quantized model")
+    parser.add_argument('--int8', action='store_true', help="Export a full-int8 quantized model")
+    parser.add_argument('--calibration-dir', help="Images used to calibrate int8 activation ranges")
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--eval-dir', help="Images used for the report (default: calibration images)")
+    parser.add_argument('--eval-samples', type=int, default=200)
+    parser.add_argument('--report-only', action='store_true', help="Skip exporting, only compare existing variants")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    if not (args.dynamic or args.int8 or args.report_only):
+        args.dynamic = args.int8 = True
+
+    paths = variant_paths(args.model)
+    calibration_inputs = load_inputs(args.calibration_dir, args.calibration_samples) if args.calibration_dir else None
+    if not args.report_only:
+        from tensorflow.keras.models import load_model
+        model = load_model(args.model)
+        if args.dynamic:
+            quantize(model, 'dynamic', paths['tflite-dynamic'])
+        if args.int8:
+            if calibration_inputs is None or not len(calibration_inputs):
+                print("⚠️ No --calibration-dir given, calibrating on the bundled pair and synthetic images")
+                calibration_inputs = sample_inputs(16)
+            quantize(model, 'int8', paths['tflite-int8'], calibration_inputs)
+
+    inputs = load_inputs(args.eval_dir, args.eval_samples) if args.eval_dir else calibration_inputs
+    if inputs is None or not len(inputs):
+        inputs = sample_inputs(8)
+    rows = report({name: path for name, path in paths.items() if name == 'keras' or os.path.exists(path)},
+                  inputs, args.repeats)
+
+    print(f"{'variant':<16}{'size MB':>9}{'top-1 agree':>13}{'max Δp':>9}{'p50 ms':>9}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['variant']:<16}{row['size_mb']:>9}  ❌ {row['error']}")
+        else:
+            print(f"{row['variant']:<16}{row['size_mb']:>9}{row['top1_agreement']:>13}{row['max_prob_diff']:>9}{row['latency_ms']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"samples": len(inputs), "variants": rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1078 @@
+import bisect
+import gzip
+import hashlib
+import html
+import json
+import re
+
+# Recommendations dictionary: disease -> {(min_age, max_age): advice}
+recommendations = {
+    'Normal Retina': {
+        (0, 20): """
+🩺 **Status**: No ocular disease detected.
+
+🏥 **Consultations**:
+- Annual check-up with pediatric ophthalmologist
+- Screen for vision issues during school years
+
+🍽️ **Diet**:
+- Encourage fruits (especially citrus), carrots, spinach, and eggs
+- Limit screen time and increase water intake
+
+🧘‍♀️ **Lifestyle**:
+- Outdoor play is essential
+- Eye relaxation after 20 mins of screen use (20-20-20 rule)
+
+📅 **Monitoring**:
+- Annual comprehensive eye exam
+- If using glasses, check prescription yearly
+        """,
+        (20, 30): """
+🩺 **Status**: No signs of ocular disease.
+
+🏥 **Consultations**:
+- Comprehensive eye exam every 1–2 years
+
+🍽️ **Diet**:
+- Rich in Vitamin A (carrots, leafy greens), Omega-3s (flaxseeds, fish), and hydration
+
+🧘‍♂️ **Lifestyle**:
+- Reduce blue light exposure from screens
+- Use sunglasses to prevent UV damage
+
+📅 **Monitoring**:
+- Baseline retinal imaging for reference
+        """,
+        (30, 40): """
+🩺 **Status**: No ocular abnormalities found.
+
+🏥 **Consultations**:
+- Eye exams every 2 years unless vision changes
+
+🍽️ **Diet**:
+- Add antioxidant-rich foods (blueberries, spinach, walnuts)
+
+🧘‍♀️ **Lifestyle**:
+- Take breaks during screen-heavy work
+- Use artificial tears if experiencing dry eyes
+
+📅 **Monitoring**:
+- Annual comprehensive eye exam
+- If using glasses, check prescription yearly
+        """,
+        (40, 50): """
+🩺 **Status**: No disease, but aging eye changes may begin.
+
+🏥 **Consultations**:
+- Eye exam every 1–2 years to monitor for presbyopia or early disease signs
+
+🍽️ **Diet**:
+- Add lutein and zeaxanthin (broccoli, corn, eggs) for macular protection
+
+🧘‍♂️ **Lifestyle**:
+- Monitor reading distance; use adequate lighting
+
+📅 **Monitoring**:
+- Annual comprehensive eye exam
+- If using glasses, check prescription yearly
+        """,
+        (50, 60): """
+🩺 **Status**: Healthy retina.
+
+🏥 **Consultations**:
+- Annual dilated eye exams to monitor age-related risks
+
+🍽️ **Diet**:
+- Add turmeric, green tea (anti-inflammatory), and Omega-3s
+
+🧘‍♀️ **Lifestyle**:
+- Control blood pressure, manage screen use
+
+📅 **Monitoring**:
+- Annual comprehensive eye exam
+- If using glasses, check prescription yearly
+        """,
+        (60, 100): """
+🩺 **Status**: Eyes are healthy, but risk of age-related changes is high.
+
+🏥 **Consultations**:
+- Annual to biannual visits with ophthalmologist
+- Check for cataract, macular degeneration, glaucoma
+
+🍽️ **Diet**:
+- High antioxidant intake (berries, dark greens)
+- Stay hydrated and limit sodium
+
+🧘‍♂️ **Lifestyle**:
+- Stay active, avoid falls, use vision-friendly lighting at home
+
+📅 **Monitoring**:
+- Yearly comprehensive tests including eye pressure, field of vision, and retina scans📅
+- Annual comprehensive eye exam
+        """
+    },
+    'Diabetic Retinopathy': {
+    (0, 20): """
+🩺 **Diagnosis**: Diabetic Retinopathy.
+
+🏥 **Consultations**:
+- Pediatric retina specialist
+- Endocrinologist for tight glucose control
+
+🍽️ **Diet**:
+- High-fiber, low-GI meals; supervised carbohydrate control
+
+🧘‍♀️ **Lifestyle**:
+- Daily physical activity; avoid sugar-rich snacks
+- Parent-supervised glucose monitoring
+
+💊 **Treatment**:
+- Mostly non-surgical if caught early
+- Retinal scan every 6–12 months
+
+📅 **Monitoring**:
+- HbA1c every 3 months
+- Fundus photography for tracking
+        """,
+    (20, 30): """
+🩺 **Diagnosis**: Diabetic Retinopathy detected.
+
+🏥 **Consultations**:
+- Retina specialist and diabetologist
+
+🍽️ **Diet**:
+- Whole grains, beans, leafy greens; limit starches and sugary drinks
+
+🧘‍♂️ **Lifestyle**:
+- Daily walking/jogging
+- Manage work stress with mindfulness
+
+💊 **Treatment**:
+- Anti-VEGF injections or laser if needed
+- Oral or insulin glucose therapy
+
+📅 **Monitoring**:
+- Eye scan every 6–12 months
+- Glucose log maintenance
+        """,
+    (30, 40): """
+🩺 **Diagnosis**: Diabetic Retinopathy detected
+
+🏥 **Consultations**:
+- Retina consultant, general physician, diabetes educator
+
+🍽️ **Diet**:
+- High-protein, low-carb meals
+- Include Omega-3s and vitamin D supplements
+
+🧘‍♀️ **Lifestyle**:
+- 30–40 mins daily aerobic activity
+- Avoid smoking and alcohol
+
+💊 **Treatment**:
+- Laser therapy if needed
+- Blood sugar and blood pressure control
+
+📅 **Monitoring**:
+- Eye exams every 6 months
+- Monthly glucose checks
+        """,
+    (40, 50): """
+🩺 **Diagnosis**: Diabetic Retinopathy detected
+
+🏥 **Consultations**:
+- Retina specialist and diabetic care team
+
+🍽️ **Diet**:
+- Fresh, non-starchy veggies; avoid red meat and fried food
+
+🧘‍♂️ **Lifestyle**:
+- Manage weight, reduce stress with guided yoga
+
+💊 **Treatment**:
+- Anti-VEGF therapy likely, oral diabetes meds or insulin
+
+📅 **Monitoring**:
+- Retinal OCT scans every 6 months
+- Renal screening for diabetes-related complications
+        """,
+    (50, 60): """
+🩺 Diabetic Retinopathy detected.
+
+🏥 **Consultations**:
+- Retina surgeon, nephrologist (if comorbid)
+
+🍽️ **Diet**:
+- Nutritionist-supervised low-carb plan
+- Control sodium and cholesterol intake
+
+🧘‍♀️ **Lifestyle**:
+- Walk after meals, reduce stress
+
+💊 **Treatment**:
+- Injections or laser therapy depending on severity
+- May require insulin regimen update
+
+📅 **Monitoring**:
+- Quarterly eye check-ups
+- Glucose and BP log with caregiver support
+        """,
+    (60, 100): """
+🩺 **Diagnosis**: Diabetic Retinopathy detected
+
+🏥 **Consultations**:
+- Retina surgeon, endocrinologist, geriatric care support
+
+🍽️ **Diet**:
+- Soft diabetic meals; avoid sugar completely
+
+🧘‍♂️ **Lifestyle**:
+- Limited movement? Assisted physical therapy
+- Home lighting and fall-prevention strategies
+
+💊 **Treatment**:
+- Possible vitrectomy
+- Long-term anti-VEGF therapy
+
+📅 **Monitoring**:
+- Monthly retinal scans
+- Family/caregiver involvement for medication
+        """
+},
+ 'Glaucoma':{
+    (0, 20): """
+🩺 **Diagnosis**: Pediatric or juvenile glaucoma.
+
+🏥 **Consultations**:
+- Pediatric glaucoma specialist
+- Genetic counseling if congenital
+
+🍽️ **Diet**:
+- Balanced, fiber-rich meals
+- Limit sugar and processed food
+
+🧘‍♀️ **Lifestyle**:
+- Avoid eye trauma during sports
+- Use eye drops as prescribed
+
+💊 **Treatment**:
+- Likely surgical (goniotomy, trabeculotomy)
+- Regular IOP-lowering medication
+
+📅 **Monitoring**:
+- IOP check every 3 months
+- Visual field and optic nerve imaging
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Pediatric or juvenile glaucoma.
+
+🏥 **Consultations**:
+- Glaucoma specialist
+- Optometrist for field testing
+
+🍽️ **Diet**:
+- Leafy greens (kale, spinach), avoid caffeine and salt
+- Stay hydrated
+
+🧘‍♂️ **Lifestyle**:
+- Avoid yoga poses that raise eye pressure (e.g., headstands)
+- Use prescribed eye drops regularly
+
+💊 **Treatment**:
+- Eye drops (prostaglandin analogs)
+- Laser trabeculoplasty in some cases
+
+📅 **Monitoring**:
+- IOP check every 3–4 months
+- Visual field test every 6 months
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: Pediatric or juvenile glaucoma
+
+🏥 **Consultations**:
+- Ophthalmologist, lifestyle counselor
+
+🍽️ **Diet**:
+- High in carotenoids, magnesium-rich foods
+- Limit red meat and alcohol
+
+🧘‍♀️ **Lifestyle**:
+- Elevate head while sleeping to reduce eye pressure
+- Avoid weightlifting
+
+💊 **Treatment**:
+- Combination drops or surgery if drops ineffective
+
+📅 **Monitoring**:
+- Biannual optic nerve scans (OCT)
+- Visual acuity testing every 6 months
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Pediatric or juvenile glaucoma
+
+🏥 **Consultations**:
+- Glaucoma surgeon if pressure uncontrolled
+
+🍽️ **Diet**:
+- Add turmeric and flax seeds
+- Low sodium, high hydration
+
+🧘‍♂️ **Lifestyle**:
+- Screen work breaks; avoid bending or strain
+
+💊 **Treatment**:
+- Dual or triple therapy with drops
+- Laser or micro-invasive surgery (MIGS)
+
+📅 **Monitoring**:
+- Every 3-month pressure check
+- Visual field every 6–12 months
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: Pediatric or juvenile glaucoma detected 
+                   Risk of optic nerve damage increases.
+
+🏥 **Consultations**:
+- Advanced glaucoma clinic
+
+🍽️ **Diet**:
+- Maintain heart-healthy, eye-supportive diet
+- Avoid smoking
+
+🧘‍♀️ **Lifestyle**:
+- Use light filtering lenses
+- Avoid emotional stress
+
+💊 **Treatment**:
+- Glaucoma filtering surgery if needed
+- Beta blockers or carbonic anhydrase inhibitors
+
+📅 **Monitoring**:
+- Monthly IOP check if severe
+- OCT and optic nerve head imaging every 6 months
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: Glaucoma detected 
+                  Glaucoma often advanced in this age group.
+
+🏥 **Consultations**:
+- Geriatric ophthalmologist
+- Neurology if vision loss affects daily life
+
+🍽️ **Diet**:
+- Eye-healthy diet: spinach, salmon, citrus, seeds
+
+🧘‍♂️ **Lifestyle**:
+- Fall prevention; increase lighting at home
+- Family-assisted medication
+
+💊 **Treatment**:
+- Possible shunt surgery or tube implants
+- Continue eye drops rigorously
+
+📅 **Monitoring**:
+- Frequent (every 2 months) IOP monitoring
+- Home eye pressure tracking if needed
+    """
+},
+ 'Cataract':{
+    (0, 20): """
+🩺 **Diagnosis**: Congenital or developmental cataract (rare but vision-critical).
+
+🏥 **Consultations**:
+- Pediatric ophthalmologist
+- Pediatrician for systemic causes
+
+🍽️ **Diet**:
+- Vitamin A-rich foods (mango, eggs)
+- Hydration and eye nutrition
+
+🧘‍♀️ **Lifestyle**:
+- Protect eyes from UV
+- Glasses if advised
+
+💊 **Treatment**:
+- Surgery if cataract obstructs vision
+- Post-op visual rehab
+
+📅 **Monitoring**:
+- Vision and lens clarity checks every 3–6 months
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Rare; may be trauma, steroid, or radiation-induced.
+
+🏥 **Consultations**:
+- Retina and cataract surgeon
+
+🍽️ **Diet**:
+- Leafy greens, Omega-3s, avoid smoking
+
+🧘‍♂️ **Lifestyle**:
+- Use protective eyewear in labs/sports
+
+💊 **Treatment**:
+- Cataract surgery if vision is significantly affected
+
+📅 **Monitoring**:
+- Slit-lamp check every 6 months
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: cataract  likely due to oxidative stress or medications.
+
+🏥 **Consultations**:
+- General ophthalmologist
+
+🍽️ **Diet**:
+- Increase lutein, zeaxanthin, Vitamin C (citrus, corn)
+
+🧘‍♀️ **Lifestyle**:
+- UV sunglasses, reduce alcohol
+
+💊 **Treatment**:
+- Surgery if visual impairment affects function
+
+📅 **Monitoring**:
+- Annual vision check-ups
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Age-related lens changes; early nuclear sclerosis common.
+
+🏥 **Consultations**:
+- Eye surgeon if visual clarity declines
+
+🍽️ **Diet**:
+- Vitamin E and B-complex supplements
+- Avoid excess sunlight
+
+🧘‍♂️ **Lifestyle**:
+- Adequate lighting for reading
+
+💊 **Treatment**:
+- Phacoemulsification (if indicated)
+
+📅 **Monitoring**:
+- Annual slit lamp and refraction test
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: Lens opacity likely affecting daily activities.
+
+🏥 **Consultations**:
+- Cataract surgeon
+
+🍽️ **Diet**:
+- Anti-inflammatory foods: tomatoes, green tea, berries
+
+🧘‍♀️ **Lifestyle**:
+- Drive carefully; ensure proper contrast vision
+
+💊 **Treatment**:
+- Cataract surgery (intraocular lens implant)
+
+📅 **Monitoring**:
+- Pre-surgery workup, post-op follow-ups
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: Mature or hypermature cataract common.
+
+🏥 **Consultations**:
+- Geriatric ophthalmologist
+- GP to manage anesthesia risks
+
+🍽️ **Diet**:
+- Soft fiber-rich foods, hydration
+
+🧘‍♂️ **Lifestyle**:
+- Prevent falls, avoid dim lighting
+
+💊 **Treatment**:
+- Immediate cataract surgery if visual obstruction
+
+📅 **Monitoring**:
+- Monthly checkups post-surgery until stable
+    """
+},
+'Age-related Macular Degeneration': {
+    (0, 20): """
+🩺 **Diagnosis**: Extremely rare. Consider misdiagnosis or rare genetic macular dystrophies.
+
+🏥 **Consultations**:
+- Pediatric retinal specialist
+- Genetic testing for Stargardt disease
+
+🍽️ **Diet**:
+- Vitamin A, lutein-rich foods (carrots, eggs, leafy greens)
+
+🧘‍♀️ **Lifestyle**:
+- Limit screen time, use protective glasses
+
+💊 **Treatment**:
+- Low vision aids if needed
+- Regular monitoring
+
+📅 **Monitoring**:
+- Fundus photography every 6 months
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Early AMD unlikely; suspect early-onset macular disorders.
+
+🏥 **Consultations**:
+- Retina specialist for OCT
+
+🍽️ **Diet**:
+- Antioxidants (C, E, Zinc), avoid processed food
+
+🧘‍♂️ **Lifestyle**:
+- Quit smoking completely (major risk factor)
+
+💊 **Treatment**:
+- Observation if no wet AMD
+- AREDS2 vitamins (preventive)
+
+📅 **Monitoring**:
+- OCT scan once a year
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: Rare early AMD or hereditary variants.
+
+🏥 **Consultations**:
+- Genetic counseling if family history exists
+
+🍽️ **Diet**:
+- Lutein, zeaxanthin, Omega-3 supplements
+- Avoid trans fats and excess carbs
+
+🧘‍♀️ **Lifestyle**:
+- Minimize blue light exposure
+
+💊 **Treatment**:
+- Antioxidant therapy
+- Observation if no exudative signs
+
+📅 **Monitoring**:
+- Yearly visual field + retinal scans
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Rare early AMD or hereditary variants.
+
+🏥 **Consultations**:
+- Ophthalmologist with retinal expertise
+
+🍽️ **Diet**:
+- AREDS2 formulation supplements
+- Add wild salmon, citrus fruits
+
+🧘‍♂️ **Lifestyle**:
+- Stop smoking, walk daily (20–30 min)
+
+💊 **Treatment**:
+- Dry AMD: Supplements and lifestyle
+- Wet AMD: Anti-VEGF injection (if diagnosed)
+
+📅 **Monitoring**:
+- Amsler grid at home weekly
+- Fundus exam every 6 months
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: Moderate AMD likely. Watch for neovascular changes.
+
+🏥 **Consultations**:
+- Retina specialist regularly
+- Nutritional counselor
+
+🍽️ **Diet**:
+- Kale, spinach, sweet corn, berries
+- Avoid refined sugar
+
+🧘‍♀️ **Lifestyle**:
+- Use magnifiers, increase indoor lighting
+
+💊 **Treatment**:
+- Wet AMD: Monthly Anti-VEGF injections
+- Dry AMD: Supplements and diet
+
+📅 **Monitoring**:
+- OCT monthly for wet AMD
+- Visual acuity every 6 months
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: High risk of advanced AMD and legal blindness.
+
+🏥 **Consultations**:
+- Retina clinic
+- Low vision therapist
+
+🍽️ **Diet**:
+- Eye-supporting diet (AREDS2-based), soft textured
+
+🧘‍♂️ **Lifestyle**:
+- Assistive tools: reading lamps, large-print books
+- Family assistance
+
+💊 **Treatment**:
+- Wet AMD: Injections (Ranibizumab, Aflibercept)
+- Dry AMD: Monitoring + vision support
+
+📅 **Monitoring**:
+- Bi-monthly if on injections
+- Vision aid adjustment every 6–12 months
+    """
+},
+ 'Hypertensive Retinopathy':{
+    (0, 20): """
+🩺 **Diagnosis**: Hypertensive Retinopathy detected
+🏥 **Consultations**:
+- Pediatric nephrologist + ophthalmologist
+
+🍽️ **Diet**:
+- Salt-restricted, potassium-rich (banana, spinach)
+
+🧘‍♀️ **Lifestyle**:
+- Avoid junk food, maintain healthy BMI
+
+💊 **Treatment**:
+- Antihypertensives if diagnosed
+- Retinal laser rarely if severe edema
+
+📅 **Monitoring**:
+- BP monthly
+- Retina check every 6 months
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Early signs like arteriolar narrowing, mild AV nicking.
+
+🏥 **Consultations**:
+- General physician + retina specialist
+
+🍽️ **Diet**:
+- DASH diet: low sodium, high fiber
+
+🧘‍♂️ **Lifestyle**:
+- Reduce screen time, avoid late nights
+
+💊 **Treatment**:
+- Antihypertensives
+- Anti-VEGF if macular edema occurs
+
+📅 **Monitoring**:
+- Fundus once a year if stable
+- BP check biweekly
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: AV nicking, cotton wool spots possible.
+
+🏥 **Consultations**:
+- Cardiologist + ophthalmologist
+
+🍽️ **Diet**:
+- Avoid red meat, caffeine; add whole grains
+
+🧘‍♀️ **Lifestyle**:
+- Daily walk (30 minutes)
+- Decrease work stress
+
+💊 **Treatment**:
+- BP meds (ACE inhibitors, beta-blockers)
+- Injections if edema or hemorrhage
+
+📅 **Monitoring**:
+- Retina check every 6 months
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Moderate hypertensive changes.
+
+🏥 **Consultations**:
+- Hypertension clinic
+- Retina specialist
+
+🍽️ **Diet**:
+- DASH diet + Vitamin C & magnesium
+
+🧘‍♂️ **Lifestyle**:
+- Screen-time limits, 8-hour sleep
+
+💊 **Treatment**:
+- Combo antihypertensives
+- Laser or anti-VEGF if complications
+
+📅 **Monitoring**:
+- Eye check every 3 months
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: Grade 3/4 HR common—hemorrhages, macular edema.
+
+🏥 **Consultations**:
+- Endocrinologist (if diabetic), retina surgeon
+
+🍽️ **Diet**:
+- Strict sodium restriction, omega-3
+
+🧘‍♀️ **Lifestyle**:
+- Monitor home BP, relax daily
+
+💊 **Treatment**:
+- Anti-VEGF injections
+- Retinal laser
+
+📅 **Monitoring**:
+- Monthly if macular edema exists
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: Advanced changes with risk of permanent damage.
+
+🏥 **Consultations**:
+- Geriatric hypertension & retina care
+
+🍽️ **Diet**:
+- Light, BP-safe diet, low-fat dairy
+
+🧘‍♂️ **Lifestyle**:
+- Chair yoga, supervised walking
+
+💊 **Treatment**:
+- Aggressive BP control
+- Injections + surgery (rare)
+
+📅 **Monitoring**:
+- BP home monitoring daily
+- Eye check monthly
+    """
+},
+'Pathological Myopia':{
+    (0, 20): """
+🩺 **Diagnosis**: Often congenital or juvenile progressive myopia.
+
+🏥 **Consultations**:
+- Pediatric ophthalmologist
+- Genetic counseling if familial
+
+🍽️ **Diet**:
+- Eye-healthy foods: citrus fruits, carrots, zinc-rich foods
+
+🧘‍♀️ **Lifestyle**:
+- Limit screen time
+- Encourage outdoor play (2+ hours/day)
+
+💊 **Treatment**:
+- Atropine eye drops (0.01%) to slow progression
+- Myopia control lenses (orthokeratology)
+
+📅 **Monitoring**:
+- Axial length measurement every 6 months
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Early signs of posterior staphyloma, floaters may occur.
+
+🏥 **Consultations**:
+- Retina specialist for annual monitoring
+
+🍽️ **Diet**:
+- Rich in lutein, zeaxanthin, and DHA
+
+🧘‍♂️ **Lifestyle**:
+- Avoid contact sports (retinal tear risk)
+- Screen use breaks: 20–20–20 rule
+
+💊 **Treatment**:
+- Protective glasses
+- Photodynamic therapy if CNV develops
+
+📅 **Monitoring**:
+- Yearly OCT + Fundus photography
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: Macular thinning, risk of choroidal neovascularization (CNV).
+
+🏥 **Consultations**:
+- Retina clinic regularly
+- Low vision optometry if needed
+
+🍽️ **Diet**:
+- Omega-3 (fish oil), antioxidant-rich
+
+🧘‍♀️ **Lifestyle**:
+- Regular posture breaks
+- Eye relaxation techniques
+
+💊 **Treatment**:
+- CNV: Anti-VEGF injections
+- Corrective lenses with prism if double vision
+
+📅 **Monitoring**:
+- Visual field + fundus every 6–12 months
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Risk of macular hemorrhage or foveoschisis.
+
+🏥 **Consultations**:
+- Retina surgeon
+- Low vision therapist
+
+🍽️ **Diet**:
+- AREDS2 supplements may help
+
+🧘‍♂️ **Lifestyle**:
+- Avoid heavy lifting or trauma
+
+💊 **Treatment**:
+- Anti-VEGF for CNV
+- Surgical options: vitrectomy if foveoschisis
+
+📅 **Monitoring**:
+- OCT every 3–6 months
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: High risk of retinal detachment, CNV, or myopic maculopathy.
+
+🏥 **Consultations**:
+- Retina specialist urgently if visual symptoms arise
+
+🍽️ **Diet**:
+- Soft diet to reduce strain
+- Antioxidants: kale, sweet potatoes
+
+🧘‍♀️ **Lifestyle**:
+- Avoid night driving if vision impacted
+
+💊 **Treatment**:
+- Injections or surgery based on CNV or detachment
+
+📅 **Monitoring**:
+- Frequent (every 3 months) retina screening
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: legal blindness possible.
+
+🏥 **Consultations**:
+- Retina specialist + rehabilitation center
+
+🍽️ **Diet**:
+- Vision-support diet with supplements
+
+🧘‍♂️ **Lifestyle**:
+- Use assistive devices: magnifiers, talking devices
+
+💊 **Treatment**:
+- Advanced: Anti-VEGF or surgery
+- Low vision support (e.g., magnifying video systems)
+
+📅 **Monitoring**:
+- Bimonthly follow-up for progression tracking
+    """
+},
+ 'Other Abnormalities':{
+    (0, 20): """
+🩺 **Diagnosis**: Commonly congenital abnormalities (e.g., coloboma, albinism).
+
+🏥 **Consultations**:
+- Pediatric ophthalmologist
+- Neuro-ophthalmology if needed
+
+🍽️ **Diet**:
+- Eye development support: Vitamin A, D, and calcium
+
+🧘‍♀️ **Lifestyle**:
+- Visual therapy if amblyopia
+- Avoid screen strain
+
+💊 **Treatment**:
+- Tailored to condition: steroids (for inflammation), genetic therapies (if eligible)
+
+📅 **Monitoring**:
+- Detailed eye exams every 6–12 months
+    """,
+    (20, 30): """
+🩺 **Diagnosis**: Rare disorders like uveitis, early optic neuritis, trauma-induced damage.
+
+🏥 **Consultations**:
+- Specialist depending on type (retina, cornea, neuro)
+
+🍽️ **Diet**:
+- Anti-inflammatory foods: turmeric, berries
+
+🧘‍♂️ **Lifestyle**:
+- Use safety goggles if at risk (workplace)
+
+💊 **Treatment**:
+- Topical or systemic steroids for inflammatory causes
+
+📅 **Monitoring**:
+- As per underlying condition
+    """,
+    (30, 40): """
+🩺 **Diagnosis**: Intermediate-stage disorders (e.g., keratoconus, autoimmune uveitis).
+
+🏥 **Consultations**:
+- Cornea or autoimmune specialist
+
+🍽️ **Diet**:
+- Omega-3s, green tea, flax seeds
+
+🧘‍♀️ **Lifestyle**:
+- Maintain hygiene for eye infections
+
+💊 **Treatment**:
+- Cross-linking (keratoconus)
+- Steroids/immunomodulators (uveitis)
+
+📅 **Monitoring**:
+- 3-monthly if active disease
+    """,
+    (40, 50): """
+🩺 **Diagnosis**: Potential for degenerative disorders or post-injury complications.
+
+🏥 **Consultations**:
+- Multispecialty: retina, glaucoma, neuro
+
+🍽️ **Diet**:
+- Fiber-rich, low sodium for IOP control
+
+🧘‍♂️ **Lifestyle**:
+- No heavy eye rubbing
+
+💊 **Treatment**:
+- Depending on the specific pathology (drops, surgery)
+
+📅 **Monitoring**:
+- Every 3–6 months
+    """,
+    (50, 60): """
+🩺 **Diagnosis**: ischemic optic neuropathy, chronic uveitis.
+
+🏥 **Consultations**:
+- Retina + anterior segment specialists
+
+🍽️ **Diet**:
+- Vitamin C, E, and Zinc supplements
+
+🧘‍♀️ **Lifestyle**:
+- Indoor mobility training if needed
+
+💊 **Treatment**:
+- Surgery (e.g., cataract) + medications
+
+📅 **Monitoring**:
+- 2–3 month follow-up depending on condition
+    """,
+    (60, 100): """
+🩺 **Diagnosis**: Optic atrophy, retinal vascular occlusion, age-related issues.
+
+🏥 **Consultations**:
+- Full geriatric ophthalmic team
+
+🍽️ **Diet**:
+- Heart and vision-healthy diet, soft textured
+
+🧘‍♂️ **Lifestyle**:
+- Fall prevention measures, vision aid tools
+
+💊 **Treatment**:
+- Surgery or long-term drops depending on condition
+
+📅 **Monitoring**:
+- Every 1–2 months for progressive diseases
+    """
+},
+}
+
+
+# Compiled table: built once at import. Each (disease, age band) entry gets a
+# stable id, its markdown plus an HTML rendering, and pre-encoded (and
+# pre-gzipped) response bodies with strong ETags for /recommendations/<id>.
+# Lookups are a bisect over each disease's sorted band start ages.
+#
+# Edge ages: anything below the youngest band (i.e. negative) has no
+# recommendation; anything at or above the oldest band's upper bound (100+)
+# gets the oldest band, since those patients belong with the 60+ advice.
+NO_RECOMMENDATION = "No recommendation found."
+
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def render_html(markdown):
+    # Enough markdown for these entries: **bold**, "- " bullet lists, blank-line paragraphs
+    blocks, items, paragraph = [], [], []
+
+    def flush():
+        if paragraph:
+            blocks.append('<p>' + '<br>'.join(paragraph) + '</p>')
+            paragraph.clear()
+        if items:
+            blocks.append('<ul>' + ''.join(f'<li>{item}</li>' for item in items) + '</ul>')
+            items.clear()
+
+    for line in markdown.strip().splitlines():
+        line = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html.escape(line.strip()))
+        if not line:
+            flush()
+        elif line.startswith('- '):
+            if paragraph:
+                flush()
+            items.append(line[2:])
+        else:
+            if items:
+                flush()
+            paragraph.append(line)
+    flush()
+    return '\n'.join(blocks)
+
+
+class Recommendation:
+    def __init__(self, disease, min_age, max_age, markdown):
+        self.id = f"{_slug(disease)}-{min_age}-{max_age}"
+        self.disease = disease
+        self.min_age = min_age
+        self.max_age = max_age
+        self.markdown = markdown
+        self.html = render_html(markdown)
+
+        document = {
+            "id": self.id,
+            "disease": disease,
+            "min_age": min_age,
+            "max_age": max_age,
+            "markdown": markdown,
+            "html": self.html,
+        }
+        # format -> (content type, body, gzipped body, strong ETag)
+        self.representations = {}
+        for fmt, content_type, body in (
+            ('json', 'application/json', json.dumps(document).encode('utf-8')),
+            ('html', 'text/html; charset=utf-8', self.html.encode('utf-8')),
+            ('markdown', 'text/markdown; charset=utf-8', markdown.encode('utf-8')),
+        ):
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            self.representations[fmt] = (content_type, body, gzip.compress(body, mtime=0), etag)
+
+
+def compile_recommendations(table):
+    by_id, index = {}, {}
+    for disease, bands in table.items():
+        entries = sorted(
+            (Recommendation(disease, low, high, advice) for (low, high), advice in bands.items()),
+            key=lambda entry: entry.min_age,
+        )
+        index[disease] = ([entry.min_age for entry in entries], entries)
+        by_id.update((entry.id, entry) for entry in entries)
+    return by_id, index
+
+
+recommendations_by_id, _recommendation_index = compile_recommendations(recommendations)
+
+
+def lookup_recommendation(disease, age):
+    starts, entries = _recommendation_index[disease]
+    position = bisect.bisect_right(starts, age) - 1
+    if position < 0:
+        return None
+    entry = entries[position]
+    if age >= entry.max_age and position != len(entries) - 1:
+        return None  # a gap between bands
+    return entry
+
+
+# Get recommendation
+def get_recommendation(disease, age):
+    entry = lookup_recommendation(disease, age)
+    return entry.markdown if entry else NO_RECOMMENDATION
@@ -0,0 +1,379 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, load_backend
+from bulk import chunked
+from cache import content_hash, pair_key
+from labels import class_labels
+from preprocessing import PREPROCESS_MODES, decode_bytes, preprocess_pairs, preprocessing_fingerprint
+from recommendations import NO_RECOMMENDATION, lookup_recommendation
+from tensor_store import TensorStore, to_model_input
+from thread_settings import apply_tensorflow_threads, thread_settings_from_env
+
+# Offline scoring of an archived screening dataset, without the web service.
+# Reads a CSV manifest with left,right,age columns (and an optional id
+# column; image paths are relative to the manifest), preprocesses the images
+# on a pool of worker processes, runs the model in large batches and appends
+# one row per eye pair to a CSV file or a directory of Parquet parts.
+#
+#   python score_dataset.py manifest.csv --output scores.csv
+#   python score_dataset.py manifest.csv --output scores/ --format parquet --shard 0/4
+#
+# Progress is checkpointed to <output>.checkpoint.json after every batch;
+# running the same command again resumes after the last completed batch
+# (--restart starts over). --shard i/N scores every N-th manifest row
+# starting at row i, so N machines can split one manifest.
+#
+# With --tensor-store, pairs already in a store built by build_tensor_store.py
+# under the same preprocessing settings are read from it instead of being
+# decoded and filtered again: the workers only hash the image files, and the
+# stored tensors are streamed to the model in batches straight from the
+# memory-mapped store (see batch_inputs). Only the missing rows are
+# preprocessed on the pool.
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--shard must look like i/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"--shard index must be in 0..{count - 1}, got {value!r}")
+    return index, count
+
+
+def read_manifest(path, shard=(0, 1)):
+    index, count = shard
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = []
+        for i, row in enumerate(csv.DictReader(f)):
+            if i % count != index:
+                continue
+            rows.append({
+                "index": i,
+                "id": row.get('id') or str(i),
+                "left": os.path.join(root, row.get('left') or ''),
+                "right": os.path.join(root, row.get('right') or ''),
+                "age": row.get('age'),
+                "label": row.get('label'),
+            })
+        return rows
+
+
+def read_pair(row):
+    pair = []
+    for path in (row["left"], row["right"]):
+        if not os.path.isfile(path):
+            raise ValueError(f"Could not read image '{path}'")
+        with open(path, 'rb') as f:
+            pair.append(f.read())
+    return pair
+
+
+def decode_pair(row, data, reduced):
+    images = []
+    for path, image_bytes in zip((row["left"], row["right"]), data):
+        img = decode_bytes(image_bytes, reduced)
+        if img is None:
+            raise ValueError(f"Could not read image '{path}'")
+        images.append(img)
+    return tuple(images)
+
+
+def init_worker():
+    # Parallelism comes from the processes; one OpenCV thread each
+    cv2.setNumThreads(1)
+
+
+def prepare_input(row, mode, reduced, dtype='float32', channel_order='rgb'):
+    # The row's (224, 224, 6) model input in the backend's input format
+    data = read_pair(row)
+    return preprocess_pairs([decode_pair(row, data, reduced)], mode, dtype=dtype, channel_order=channel_order)[0]
+
+
+def read_age(row):
+    # (age, error)
+    try:
+        return int(row["age"]), None
+    except (TypeError, ValueError):
+        return None, f"Invalid age: {row['age']!r}"
+
+
+def prepare(task):
+    # Runs in a worker process: the row's model input, or an error
+    row, mode, reduced, input_format = task
+    age, error = read_age(row)
+    if error:
+        return row, None, None, error
+    try:
+        return row, age, prepare_input(row, mode, reduced, *input_format), None
+    except Exception as e:
+        return row, age, None, str(e)
+
+
+def row_pair_key(row):
+    # Runs in a worker process: the store key of the row's pair, None if
+    # its files cannot be read
+    try:
+        return pair_key(*map(content_hash, read_pair(row)))
+    except ValueError:
+        return None
+
+
+def locate_stored(pool, store, fingerprint, rows, chunksize=1):
+    # Manifest index -> store key, for the rows whose pair is in the store
+    keys = pool.imap(row_pair_key, rows, chunksize)
+    return {row["index"]: key for row, key in zip(rows, keys)
+            if key is not None and store.lookup(key, fingerprint) is not None}
+
+
+def prepared_batches(pool, fn, tasks, batch_size, chunksize=1, skip=None):
+    # Yields (tasks, results) a batch at a time, fn applied to the tasks on
+    # the pool; tasks skip() picks (read from the tensor store by the
+    # caller) are not sent to the pool and get None. The next batch is
+    # prepared while the caller works on the current one; at most two
+    # batches are held in memory
+    pending = None
+    for batch in chunked(tasks, batch_size):
+        upcoming = batch, pool.map_async(fn, [t for t in batch if not (skip and skip(t))], chunksize)
+        if pending is not None:
+            yield _merged(*pending, skip)
+        pending = upcoming
+    if pending is not None:
+        yield _merged(*pending, skip)
+
+
+def _merged(batch, results, skip):
+    results = iter(results.get())
+    return batch, [None if skip and skip(t) else next(results) for t in batch]
+
+
+def batch_inputs(store, fingerprint, input_format, sources):
+    # Model inputs for one batch, each source either a prepared input or
+    # the store key of a stored pair. A batch read entirely from the store
+    # is a slice of the mapping (no copy when its rows are stored back to
+    # back), turned into the backend's input format in one step: for a
+    # uint8 RGB backend on a uint8 store that is the mapping itself
+    keys = [source for source in sources if isinstance(source, str)]
+    if not keys:
+        return np.stack(sources)
+    (_, stored), = store.batches(keys, fingerprint, len(keys))
+    stored = to_model_input(stored, *input_format)
+    if len(keys) == len(sources):
+        return stored
+    batch = np.empty((len(sources),) + store.shape, dtype=stored.dtype)
+    stored_rows = iter(stored)
+    for i, source in enumerate(sources):
+        batch[i] = next(stored_rows) if isinstance(source, str) else source
+    return batch
+
+
+def stored_item(row, stored):
+    # (age, store key, error) for a row read from the tensor store
+    age, error = read_age(row)
+    return age, None if error else stored[row["index"]], error
+
+
+def score_batch(backend, prepared, include_text=True, to_batch=np.stack):
+    ready = [i for i, (_, _, inputs, _) in enumerate(prepared) if inputs is not None]
+    predictions = backend.predict(to_batch([prepared[i][2] for i in ready])) if ready else []
+    by_position = dict(zip(ready, predictions))
+
+    rows = []
+    for i, (row, age, _, error) in enumerate(prepared):
+        out = dict.fromkeys(output_columns(include_text))
+        out.update(index=row["index"], id=row["id"], left=row["left"], right=row["right"], age=age)
+        if i in by_position:
+            prediction = by_position[i]
+            label = int(np.argmax(prediction))
+            disease = class_labels[label]
+            entry = lookup_recommendation(disease, age)
+            out["predicted_disease"] = disease
+            out["confidence"] = round(float(prediction[label]) * 100, 2)
+            out["recommendation_id"] = entry.id if entry else None
+            if include_text:
+                out["recommendation"] = entry.markdown if entry else NO_RECOMMENDATION
+            for name, p in zip(class_labels, prediction):
+                out[f"p_{name}"] = round(float(p), 6)
+        else:
+            out["error"] = error
+        rows.append(out)
+    return rows
+
+
+def output_columns(include_text=True):
+    columns = ['index', 'id', 'left', 'right', 'age', 'predicted_disease', 'confidence', 'recommendation_id']
+    if include_text:
+        columns.append('recommendation')
+    return columns + [f"p_{name}" for name in class_labels] + ['error']
+
+
+class CsvOutput:
+    # position = byte offset after the last checkpointed row; anything a
+    # crashed run wrote past it is truncated away on resume
+    def __init__(self, path, columns, position=0):
+        self.path = path
+        self._file = open(path, 'r+' if position else 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        if position:
+            self._file.seek(position)
+            self._file.truncate()
+        else:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    # One part file per batch; position = number of checkpointed parts
+    def __init__(self, path, columns, position=0):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self._table, self._write_table = pyarrow.Table.from_pylist, pyarrow.parquet.write_table
+        self.path = path
+        self.columns = columns
+        self._parts = position
+        os.makedirs(path, exist_ok=True)
+        for stale in glob.glob(os.path.join(path, 'part-*.parquet')):
+            if int(os.path.basename(stale)[5:-8]) >= position:
+                os.remove(stale)
+
+    def write(self, rows):
+        part = os.path.join(self.path, f'part-{self._parts:06d}.parquet')
+        self._write_table(self._table([{c: row[c] for c in self.columns} for row in rows]), part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._parts += 1
+
+    def position(self):
+        return self._parts
+
+    def close(self):
+        pass
+
+
+OUTPUTS = {'csv': CsvOutput, 'parquet': ParquetOutput}
+
+
+def load_checkpoint(path, expected):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    for key, value in expected.items():
+        if checkpoint.get(key) != value:
+            raise SystemExit(f"{path} was written for {key}={checkpoint.get(key)!r}, not {value!r}; "
+                             "pass --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a manifest of eye pairs offline")
+    parser.add_argument('manifest', help="CSV with left,right,age columns (optional id)")
+    parser.add_argument('--output', required=True, help="CSV file, or a directory for --format parquet")
+    parser.add_argument('--format', choices=sorted(OUTPUTS), default='csv')
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), help="i/N: score every N-th row from row i")
+    parser.add_argument('--backend', choices=BACKENDS, default='keras')
+    parser.add_argument('--model', help="Model file for the backend (default: its usual path)")
+    parser.add_argument('--batch-size', type=int, default=64, help="Eye pairs per model call")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Preprocessing processes")
+    parser.add_argument('--preprocess-mode', choices=PREPROCESS_MODES, default='exact')
+    parser.add_argument('--reduced-decode', action='store_true', help="Decode large JPEGs at reduced scale")
+    parser.add_argument('--tensor-store', help="Read already preprocessed pairs from this store")
+    parser.add_argument('--no-recommendation-text', action='store_true', help="Write recommendation ids only")
+    parser.add_argument('--restart', action='store_true', help="Ignore any checkpoint and start over")
+    args = parser.parse_args()
+
+    rows = read_manifest(args.manifest, args.shard)
+    include_text = not args.no_recommendation_text
+    checkpoint_path = args.output.rstrip('/') + CHECKPOINT_SUFFIX
+    settings = {
+        "manifest": os.path.abspath(args.manifest),
+        "shard": f"{args.shard[0]}/{args.shard[1]}",
+        "format": args.format,
+        "backend": args.backend,
+        "preprocess_mode": args.preprocess_mode,
+        "reduced_decode": args.reduced_decode,
+        "recommendation_text": include_text,
+    }
+    checkpoint = None if args.restart else load_checkpoint(checkpoint_path, settings)
+    if checkpoint is None:
+        checkpoint = dict(settings, done=0, output_position=0, rows=len(rows))
+    if checkpoint["done"] >= len(rows):
+        print(f"✅ Already complete: {len(rows)} rows in {args.output}")
+        return
+    if checkpoint["done"]:
+        print(f"↪️ Resuming after row {checkpoint['done']} of {len(rows)}")
+
+    output = OUTPUTS[args.format](args.output, output_columns(include_text), checkpoint["output_position"])
+
+    # Workers are spawned before TensorFlow starts in this process
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(max(1, args.workers), initializer=init_worker) as pool:
+        chunksize = max(1, args.batch_size // (4 * max(1, args.workers)))
+        todo = rows[checkpoint["done"]:]
+        store, stored, to_batch = None, {}, np.stack
+        if args.tensor_store:
+            store = TensorStore(args.tensor_store)
+            fingerprint = preprocessing_fingerprint(args.preprocess_mode, args.reduced_decode)
+            stored = locate_stored(pool, store, fingerprint, todo, chunksize)
+            print(f"{len(stored)}/{len(todo)} pairs found in {args.tensor_store}")
+
+        if args.backend.startswith('keras'):
+            apply_tensorflow_threads(thread_settings_from_env())
+        backend = load_backend(args.backend, args.model)
+        input_format = (np.dtype(backend.input_dtype).name, backend.channel_order)
+        if store is not None:
+            to_batch = partial(batch_inputs, store, fingerprint, input_format)
+        tasks = ((row, args.preprocess_mode, args.reduced_decode, input_format) for row in todo)
+
+        def is_stored(task):
+            return task[0]["index"] in stored
+
+        started, scored = time.perf_counter(), 0
+        for chunk, results in prepared_batches(pool, prepare, tasks, args.batch_size, chunksize, is_stored):
+            prepared = [result if result is not None else (task[0], *stored_item(task[0], stored))
+                        for task, result in zip(chunk, results)]
+            output.write(score_batch(backend, prepared, include_text, to_batch))
+            scored += len(prepared)
+            checkpoint["done"] += len(prepared)
+            checkpoint["output_position"] = output.position()
+            save_checkpoint(checkpoint_path, checkpoint)
+            rate = scored / (time.perf_counter() - started)
+            print(f"{checkpoint['done']}/{len(rows)} rows ({rate:.1f} pairs/s)")
+
+    output.close()
+    print(f"✅ Scored {scored} rows into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
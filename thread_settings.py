@@ -0,0 +1,93 @@
+import json
+import os
+
+import cv2
+
+# Thread-pool sizes for TensorFlow and OpenCV. With several worker processes
+# on one host each library would otherwise size its pools to every core and
+# the workers thrash each other. Values come from the environment:
+#
+#   TF_NUM_INTRAOP_THREADS   threads inside one TensorFlow op
+#   TF_NUM_INTEROP_THREADS   TensorFlow ops run concurrently
+#   OPENCV_NUM_THREADS       cv2.setNumThreads (0 = OpenCV's single-thread mode)
+#   CPU_AFFINITY             'split' pins each gunicorn worker to its own
+#                            share of the cores, 'none' leaves it to the OS
+#
+# Anything not set in the environment is taken from the file tune_threads.py
+# writes (THREAD_SETTINGS_PATH, default thread_settings.json), which also
+# holds the gunicorn worker count it measured best.
+#
+# TensorFlow only accepts these before its runtime starts, so
+# apply_tensorflow_threads() must run before the model is loaded.
+
+DEFAULT_TUNED_PATH = 'thread_settings.json'
+AFFINITY_MODES = ('none', 'split')
+
+
+def _env_int(name):
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else None
+
+
+def load_tuned_settings(path=None):
+    # The configuration tune_threads.py picked for this host, {} if none
+    path = path or os.environ.get('THREAD_SETTINGS_PATH', DEFAULT_TUNED_PATH)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            tuned = json.load(f)["best"]
+        if tuned.get("cpu_affinity", 'none') not in AFFINITY_MODES:
+            raise ValueError(f"unknown cpu_affinity {tuned['cpu_affinity']!r}")
+        return tuned
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ Ignoring {path}: {e}")
+        return {}
+
+
+def thread_settings_from_env():
+    tuned = load_tuned_settings()
+    settings = {
+        "tf_intra_op": _env_int('TF_NUM_INTRAOP_THREADS'),
+        "tf_inter_op": _env_int('TF_NUM_INTEROP_THREADS'),
+        "opencv": _env_int('OPENCV_NUM_THREADS'),
+        "cpu_affinity": os.environ.get('CPU_AFFINITY', '').strip() or None,
+    }
+    return {key: tuned.get(key) if value is None else value for key, value in settings.items()}
+
+
+def apply_opencv_threads(settings):
+    if settings.get("opencv") is not None:
+        cv2.setNumThreads(settings["opencv"])
+
+
+def apply_tensorflow_threads(settings):
+    if settings.get("tf_intra_op") is None and settings.get("tf_inter_op") is None:
+        return
+    import tensorflow as tf
+    try:
+        if settings.get("tf_intra_op") is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(settings["tf_intra_op"])
+        if settings.get("tf_inter_op") is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(settings["tf_inter_op"])
+    except RuntimeError as e:
+        # The TensorFlow runtime was already initialized in this process
+        print("⚠️ TensorFlow thread settings not applied:", str(e))
+
+
+def affinity_cores(worker_index, workers):
+    # The worker's own block of the cores this process may run on
+    cores = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cores) // max(1, workers))
+    start = (worker_index % max(1, workers)) * per_worker % len(cores)
+    return cores[start:start + per_worker]
+
+
+def apply_cpu_affinity(settings, worker_index, workers):
+    # Linux applies this to the calling thread and the threads it starts
+    # later, so it has to run before the TensorFlow / OpenCV pools start
+    if settings.get("cpu_affinity") != 'split' or not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = affinity_cores(worker_index, workers)
+    os.sched_setaffinity(0, cores)
+    return cores
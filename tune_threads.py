@@ -0,0 +1,231 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import threading
+import time
+
+import numpy as np
+
+from backends import BACKENDS
+from thread_settings import AFFINITY_MODES, DEFAULT_TUNED_PATH, apply_cpu_affinity, thread_settings_from_env
+
+# Finds the worker count and thread-pool sizes that serve /predict fastest
+# on this host. Every configuration in the sweep (worker processes x
+# TensorFlow intra-/inter-op threads x OpenCV threads x CPU affinity) is
+# started for real: each worker is a fresh process that imports app.py with
+# those settings, loads the model and answers /predict requests (decode,
+# preprocess pool, micro-batcher, model) from --threads concurrent clients,
+# like one gunicorn worker. The caches and admission control are off, so
+# every request does the full work.
+#
+#   python tune_threads.py --backend tflite --duration 10
+#   python tune_threads.py --workers 1,2,4 --intra-op 1,auto --max-p99-ms 400
+#
+# 'auto' stands for the cores per worker. Throughput and p99 latency of
+# every configuration are printed; the fastest one (within --max-p99-ms, if
+# given) is written to thread_settings.json, which gunicorn.conf.py and
+# app.py read at startup (see thread_settings.py).
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def parse_values(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def resolve(value, workers):
+    return max(1, available_cores() // workers) if value == 'auto' else int(value)
+
+
+def configurations(args):
+    seen = []
+    for workers in map(int, parse_values(args.workers)):
+        for intra, inter, opencv, affinity in itertools.product(
+                parse_values(args.intra_op), parse_values(args.inter_op),
+                parse_values(args.opencv), parse_values(args.affinity)):
+            config = {
+                "workers": workers,
+                "tf_intra_op": resolve(intra, workers),
+                "tf_inter_op": resolve(inter, workers),
+                "opencv": resolve(opencv, workers),
+                # Pinning a single worker to every core changes nothing
+                "cpu_affinity": affinity if workers > 1 else 'none',
+            }
+            if config not in seen:
+                seen.append(config)
+    return seen
+
+
+def run_worker(config, worker_index, args, ready, go, results):
+    # One service worker under the configuration's settings
+    os.environ.update({
+        "INFERENCE_BACKEND": args.backend,
+        "TF_NUM_INTRAOP_THREADS": str(config["tf_intra_op"]),
+        "TF_NUM_INTEROP_THREADS": str(config["tf_inter_op"]),
+        "OMP_NUM_THREADS": str(config["tf_intra_op"]),
+        "OPENCV_NUM_THREADS": str(config["opencv"]),
+        "CPU_AFFINITY": config["cpu_affinity"],
+        "PREDICTION_CACHE_SIZE": '0',
+        "TENSOR_CACHE_MB": '0',
+        "ADMISSION_MAX_CONCURRENT": '0',
+    })
+    if args.model:
+        os.environ["MODEL_BACKEND_PATH"] = args.model
+    # Before app.py starts any thread, so they all inherit it
+    apply_cpu_affinity(thread_settings_from_env(), worker_index, config["workers"])
+
+    import app
+    if not app.model_ready.wait(args.load_timeout):
+        results.put((worker_index, None, f"model not ready: {app.model_status}"))
+        return
+    with open('static/uploads/left.jpg', 'rb') as f:
+        left = f.read()
+    with open('static/uploads/right.jpg', 'rb') as f:
+        right = f.read()
+
+    def post(client):
+        # Random bytes after the JPEG end marker make every pair new
+        suffix = os.urandom(16)
+        return client.post('/predict', data={
+            "age": "55",
+            "left_eye": (io.BytesIO(left + suffix), 'left.jpg'),
+            "right_eye": (io.BytesIO(right + suffix), 'right.jpg'),
+        }).status_code
+
+    post(app.app.test_client())
+    ready.put(worker_index)
+    go.wait()
+
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + args.duration
+
+    def client():
+        test_client = app.app.test_client()
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            status = post(test_client)
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            else:
+                errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put((worker_index, latencies, f"{len(errors)} failed requests" if errors else None))
+
+
+def measure(config, args):
+    ctx = multiprocessing.get_context('spawn')
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    processes = [ctx.Process(target=run_worker, args=(config, i, args, ready, go, results), daemon=True)
+                 for i in range(config["workers"])]
+    for p in processes:
+        p.start()
+
+    latencies, errors = [], []
+    try:
+        for _ in processes:
+            ready.get(timeout=args.load_timeout + 60)
+    except queue.Empty:
+        errors.append("workers did not become ready")
+    if not errors:
+        go.set()
+        for _ in processes:
+            try:
+                _, worker_latencies, error = results.get(timeout=args.duration + 120)
+            except queue.Empty:
+                errors.append("worker did not report")
+                break
+            latencies.extend(worker_latencies or [])
+            if error:
+                errors.append(error)
+    else:
+        while not results.empty():
+            errors.append(results.get()[2])
+    for p in processes:
+        p.join(timeout=10)
+        if p.is_alive():
+            p.terminate()
+
+    return dict(
+        config,
+        threads=args.threads,
+        requests=len(latencies),
+        throughput_rps=round(len(latencies) / args.duration, 2),
+        p50_ms=round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+        p99_ms=round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+        errors=errors,
+    )
+
+
+def pick_best(results, max_p99_ms=None):
+    usable = [r for r in results if r["requests"] and not r["errors"]]
+    if max_p99_ms is not None:
+        usable = [r for r in usable if r["p99_ms"] <= max_p99_ms]
+    if not usable:
+        return None
+    return max(usable, key=lambda r: (r["throughput_rps"], -r["p99_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep worker and thread-pool settings over the /predict path")
+    parser.add_argument('--backend', choices=BACKENDS, default='keras')
+    parser.add_argument('--model', help="Model file for the backend (default: its usual path)")
+    parser.add_argument('--workers', default='1,2,4', help="Worker processes to try")
+    parser.add_argument('--intra-op', default='1,auto', help="TensorFlow intra-op threads to try")
+    parser.add_argument('--inter-op', default='1', help="TensorFlow inter-op threads to try")
+    parser.add_argument('--opencv', default='1,auto', help="OpenCV threads to try (0 = OpenCV's serial mode)")
+    parser.add_argument('--affinity', default=','.join(AFFINITY_MODES), help="CPU affinity modes to try")
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent requests per worker; gunicorn.conf.py "
+                        "uses the best one as ADMISSION_MAX_CONCURRENT")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds measured per configuration")
+    parser.add_argument('--load-timeout', type=float, default=300.0, help="Seconds to wait for the model to load")
+    parser.add_argument('--max-p99-ms', type=float, help="Only pick configurations with a p99 at or below this")
+    parser.add_argument('--output', default=os.environ.get('THREAD_SETTINGS_PATH', DEFAULT_TUNED_PATH))
+    args = parser.parse_args()
+
+    for mode in parse_values(args.affinity):
+        if mode not in AFFINITY_MODES:
+            parser.error(f"--affinity must be among {AFFINITY_MODES}, got {mode!r}")
+    configs = [c for c in configurations(args) if c["workers"] <= available_cores()]
+    print(f"Sweeping {len(configs)} configurations on {available_cores()} cores, {args.duration:.0f}s each")
+
+    results = []
+    for i, config in enumerate(configs, 1):
+        result = measure(config, args)
+        results.append(result)
+        print(f"[{i}/{len(configs)}] {json.dumps(result)}")
+
+    best = pick_best(results, args.max_p99_ms)
+    if best is None:
+        raise SystemExit("No configuration completed without errors" +
+                         (f" within a p99 of {args.max_p99_ms} ms" if args.max_p99_ms is not None else ""))
+
+    settings = {key: best[key] for key in ('workers', 'threads', 'tf_intra_op', 'tf_inter_op', 'opencv', 'cpu_affinity')}
+    tuned = {
+        "best": settings,
+        "measured": {key: best[key] for key in ('throughput_rps', 'p50_ms', 'p99_ms')},
+        "backend": args.backend,
+        "host": {"cores": available_cores(), "machine": platform.machine(), "processor": platform.processor()},
+        "written_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results,
+    }
+    with open(args.output + '.tmp', 'w') as f:
+        json.dump(tuned, f, indent=2)
+    os.replace(args.output + '.tmp', args.output)
+    print(f"✅ Best: {json.dumps(settings)} at {best['throughput_rps']} rps, p99 {best['p99_ms']} ms")
+    print(f"   written to {args.output}; gunicorn and app.py pick it up at startup")
+
+
+if __name__ == '__main__':
+    main()
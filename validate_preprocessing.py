@@ -0,0 +1,127 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from preprocessing import decode_bytes, preprocess_batch, preprocess_pairs
+
+# Compares the 'resize_first' preprocessing mode against the 'exact' pipeline
+# used by /predict: pixel drift of the preprocessed tensors, time per image
+# and, if a model is available, drift of the predicted probabilities.
+#
+#   python validate_preprocessing.py static/uploads/left.jpg static/uploads/right.jpg
+#   python validate_preprocessing.py --dir /data/fundus --model retinal_disease_model.h5
+#   python validate_preprocessing.py --dir /data/fundus --reduced-decode
+#       (resize_first on images decoded at reduced scale, as REDUCED_DECODE=1 serves them)
+
+
+def load_images(paths, reduced=False):
+    images = []
+    for path in paths:
+        img = decode_bytes(np.fromfile(path, dtype=np.uint8), True) if reduced else cv2.imread(path)
+        if img is None:
+            print(f"⚠️ Skipping unreadable image: {path}")
+            continue
+        images.append((path, img))
+    return images
+
+
+def time_mode(images, mode, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        preprocess_batch(images, mode)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0 / len(images)
+
+
+def pixel_drift(exact, fast):
+    diff = np.abs(exact - fast)
+    mse = float(np.mean((exact - fast) ** 2))
+    return {
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "psnr_db": float('inf') if mse == 0 else round(10 * np.log10(1.0 / mse), 2),
+    }
+
+
+def prediction_drift(model, images, fast_images, batch_size):
+    # Consecutive images are paired up as (left, right), matching how the
+    # bundled left.jpg / right.jpg are used
+    pairs = [(images[i], images[i + 1]) for i in range(0, len(images) - 1, 2)]
+    fast_pairs = [(fast_images[i], fast_images[i + 1]) for i in range(0, len(fast_images) - 1, 2)]
+    if not pairs:
+        return None
+
+    exact_probs, fast_probs = [], []
+    for i in range(0, len(pairs), batch_size):
+        exact_probs.append(model.predict(preprocess_pairs(pairs[i:i + batch_size], 'exact'), verbose=0))
+        fast_probs.append(model.predict(preprocess_pairs(fast_pairs[i:i + batch_size], 'resize_first'), verbose=0))
+    exact_probs = np.concatenate(exact_probs)
+    fast_probs = np.concatenate(fast_probs)
+
+    return {
+        "pairs": len(pairs),
+        "top1_agreement": float(np.mean(exact_probs.argmax(1) == fast_probs.argmax(1))),
+        "max_prob_diff": float(np.max(np.abs(exact_probs - fast_probs))),
+        "mean_prob_diff": float(np.mean(np.abs(exact_probs - fast_probs))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure drift of resize-first preprocessing against the exact pipeline")
+    parser.add_argument('images', nargs='*', help="Image files (default: the bundled static/uploads/left.jpg and right.jpg)")
+    parser.add_argument('--dir', help="Directory of images to validate on")
+    parser.add_argument('--model', help="Keras model to measure prediction drift with (e.g. retinal_disease_model.h5)")
+    parser.add_argument('--reduced-decode', action='store_true',
+                        help="Decode large JPEGs at reduced scale for the resize_first side")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    paths = list(args.images)
+    if args.dir:
+        paths += sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(args.dir, f'*.{ext}')))
+    if not paths:
+        paths = ['static/uploads/left.jpg', 'static/uploads/right.jpg']
+
+    loaded = load_images(paths)
+    if not loaded:
+        raise SystemExit("No readable images to validate on")
+    images = [img for _, img in loaded]
+    fast_images = [img for _, img in load_images([path for path, _ in loaded], True)] if args.reduced_decode else images
+
+    exact = preprocess_batch(images, 'exact')
+    fast = preprocess_batch(fast_images, 'resize_first')
+
+    report = {
+        "images": len(images),
+        "reduced_decode": args.reduced_decode,
+        "ms_per_image": {
+            "exact": round(time_mode(images, 'exact', args.repeats), 3),
+            "resize_first": round(time_mode(fast_images, 'resize_first', args.repeats), 3),
+        },
+        "pixel_drift": pixel_drift(exact, fast),
+        "per_image": [
+            dict(path=path, **pixel_drift(exact[i], fast[i])) for i, (path, _) in enumerate(loaded)
+        ],
+    }
+    report["speedup"] = round(report["ms_per_image"]["exact"] / report["ms_per_image"]["resize_first"], 2)
+
+    if args.model:
+        from tensorflow.keras.models import load_model
+        report["prediction_drift"] = prediction_drift(load_model(args.model), images, fast_images, args.batch_size)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()